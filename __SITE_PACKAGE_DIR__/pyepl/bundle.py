@@ -0,0 +1,332 @@
+# PyEPL: bundle.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module reads and writes stimulus bundles: single files holding
+a whole pool of stimuli, already decoded, which are memory mapped
+and only turned into stimuli as they are used.
+
+A bundle starts with a header (magic string, version, and the offset
+and length of the index).  The index is a pickled list with one
+(name, kind, attributes, offset, length, info) tuple per item, where
+kind is one of:
+
+  image   RGBA pixels; info is (width, height, propxsize, propysize)
+  sound   16 bit stereo PCM at 44100 Hz; info is the byte order
+  text    UTF-8 text
+  lines   UTF-8 lines of text, for a TextPool
+  none    no content, just attributes
+
+Payloads are aligned to PAD bytes.
+"""
+
+import pygame
+import os
+import sys
+import copy
+import mmap
+import struct
+import cPickle
+import numpy
+
+import hardware
+import display
+import sound
+from exceptions import EPLError
+
+# file name extension of bundles
+BUNDLE_EXT = ".eplb"
+
+# magic string, version, index offset and index length
+HEADER = "<8sIQQ"
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = "PYEPLBDL"
+VERSION = 1
+
+# payload alignment
+PAD = 16
+
+class BundleError(EPLError):
+    """
+    Raised for a malformed bundle.
+    """
+    pass
+
+def isBundle(path):
+    """
+    Return True if path names a bundle file.
+    """
+    return path.lower().endswith(BUNDLE_EXT) and os.path.isfile(path)
+
+class BundleWriter:
+    """
+    Writes a bundle file, one item at a time.
+    """
+    def __init__(self, filename):
+        """
+        Create BundleWriter.
+
+        INPUT ARGS:
+          filename- the bundle file to write.
+        """
+        self.filename = filename
+        self.file = open(filename, "wb")
+        self.index = []
+
+        # the header is written for real by close
+        self.file.write("\0" * HEADER_SIZE)
+    def addPayload(self, name, kind, attrs, data, info = None):
+        """
+        Write one item.  data is a string (or buffer) of its payload.
+        """
+        pos = self.file.tell()
+        if pos % PAD:
+            self.file.write("\0" * (PAD - pos % PAD))
+            pos = self.file.tell()
+        self.file.write(data)
+        self.index.append((name, kind, attrs, pos, len(data), info))
+    def addImage(self, name, surf, attrs = {}, propxsize = None, propysize = None):
+        """
+        Write an image item from a pygame Surface.
+        """
+        w, h = surf.get_size()
+        self.addPayload(name, "image", attrs, pygame.image.tostring(surf, "RGBA", 0),
+                        (w, h, propxsize, propysize))
+    def addSound(self, name, snd, attrs = {}):
+        """
+        Write a sound item from the samples of an AudioClip (16 bit
+        stereo at 44100 Hz, as a raw string or an array).
+        """
+        self.addPayload(name, "sound", attrs, buffer(sound.asSamples(snd)), sys.byteorder)
+    def addText(self, name, text, attrs = {}):
+        """
+        Write a text item.
+        """
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        self.addPayload(name, "text", attrs, text)
+    def addLines(self, name, lines, attrs = {}):
+        """
+        Write a list of lines of text.
+        """
+        lines = [isinstance(line, unicode) and line.encode("utf-8") or line for line in lines]
+        self.addPayload(name, "lines", attrs, "\n".join(lines))
+    def addItem(self, d):
+        """
+        Write a PoolDict, according to the type of its content
+        attribute.
+        """
+        name = d.get("name")
+        attrs = d.copy()
+        attrs.pop("name", None)
+        content = attrs.pop("content", None)
+        attrs = dict(attrs)
+
+        if isinstance(content, display.Image):
+            self.addImage(name, content.getLowUnscaled().surf, attrs,
+                          content.propxsize, content.propysize)
+        elif isinstance(content, sound.AudioClip):
+            wasloaded = not content.getSamples() is None
+            if isinstance(content, sound.FileAudioClip):
+                wasloaded = content.isLoaded()
+                content.load()
+            self.addSound(name, content.getSamples(), attrs)
+            if not wasloaded:
+                content.unload()
+        elif isinstance(content, display.Text):
+            self.addText(name, "\n".join(content.text), attrs)
+        elif isinstance(content, list):
+            # a pool of texts (as made for a text file)
+            self.addLines(name, [x.name for x in content], attrs)
+        elif content is None:
+            self.addPayload(name, "none", attrs, "")
+        else:
+            raise TypeError, "Can't bundle %r." % content
+    def close(self):
+        """
+        Write the index and header and close the file.
+        """
+        index = cPickle.dumps(self.index, 2)
+        pos = self.file.tell()
+        self.file.write(index)
+        self.file.seek(0)
+        self.file.write(struct.pack(HEADER, MAGIC, VERSION, pos, len(index)))
+        self.file.close()
+
+def writeBundle(filename, pool):
+    """
+    Write every PoolDict of a pool to a bundle file.
+    """
+    w = BundleWriter(filename)
+    try:
+        for d in pool:
+            w.addItem(d)
+    finally:
+        w.close()
+
+class Bundle:
+    """
+    An open bundle file.  The file is mapped (copy on write) as a
+    whole, and payloads are read from the mapping as they are needed.
+    """
+    def __init__(self, filename):
+        """
+        Open a bundle and read its index.
+        """
+        self.open(filename)
+    def open(self, filename):
+        """
+        Map the file and read the index.
+        """
+        self.filename = filename
+        f = open(filename, "rb")
+        try:
+            self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_COPY)
+        finally:
+            f.close()
+        if len(self.map) < HEADER_SIZE:
+            raise BundleError, "%s is not a bundle." % filename
+        magic, version, pos, length = struct.unpack(HEADER, self.map[:HEADER_SIZE])
+        if magic != MAGIC:
+            raise BundleError, "%s is not a bundle." % filename
+        if version != VERSION:
+            raise BundleError, "%s has unsupported bundle version %d." % (filename, version)
+        self.index = cPickle.loads(self.map[pos:pos + length])
+    def __getstate__(self):
+        """
+        Pickle just the file name.
+        """
+        return {"filename": self.filename}
+    def __setstate__(self, state):
+        """
+        Open the file again after unpickling.
+        """
+        self.open(state["filename"])
+    def __len__(self):
+        """
+        Return the number of items.
+        """
+        return len(self.index)
+    def __iter__(self):
+        """
+        Iterate over the (name, kind, attributes, offset, length,
+        info) index entries.
+        """
+        return iter(self.index)
+    def payload(self, i):
+        """
+        Return a buffer of the payload of item i (without copying).
+        """
+        name, kind, attrs, pos, length, info = self.index[i]
+        return buffer(self.map, pos, length)
+    def text(self, i):
+        """
+        Return the text of item i as a unicode string.
+        """
+        return str(self.payload(i)).decode("utf-8")
+    def describe(self, i):
+        """
+        Return the name of item i, for logging.
+        """
+        return "%s:%s" % (self.filename, self.index[i][0])
+
+class BundleImage(display.Image):
+    """
+    An image whose pixels are in a bundle.
+    """
+    def __uinit__(self, bundle, i, propxsize = None, propysize = None):
+        """
+        Create BundleImage.
+
+        INPUT ARGS:
+          bundle- the Bundle.
+          i- the index of the image in the bundle.
+          propxsize, propysize- (optional) proportional size, as for
+                                Image.
+        """
+        display.Image.__uinit__(self, bundle.describe(i), propxsize, propysize)
+        self.bundle = bundle
+        self.index = i
+    def loadLow(self):
+        """
+        Make the LowImage objects from the mapped pixels.
+        """
+        w, h = self.bundle.index[self.index][5][:2]
+        surf = pygame.image.frombuffer(self.bundle.payload(self.index), (w, h), "RGBA")
+        self.img_unscaled = hardware.graphics.LowImage(surf)
+        self.img = self.img_unscaled
+
+        if self.propxsize is None or self.propysize is None:
+            return
+
+        v = display.VideoTrack.lastInstance()
+        if v:
+            # scale to the proportional size, as Image does
+            yres = v.getResolution()[1]
+            self.img = self.img_unscaled.scale(int(yres * self.propxsize), int(yres * self.propysize))
+        else:
+            self.propxsize = None
+            self.propysize = None
+    def loadAsync(self):
+        """
+        Nothing to do: the pixels need no decoding.
+        """
+        pass
+    def isReady(self):
+        """
+        Return True: loading takes no decoding.
+        """
+        return True
+    def prepareCache(self, yres = None):
+        """
+        Nothing to do: the pixels need no decoding.
+        """
+        return False
+
+class BundleAudioClip(sound.FileAudioClip):
+    """
+    A sound whose samples are in a bundle.
+    """
+    def __init__(self, bundle, i):
+        """
+        Create BundleAudioClip.
+
+        INPUT ARGS:
+          bundle- the Bundle.
+          i- the index of the sound in the bundle.
+        """
+        sound.AudioClip.__init__(self)
+        self.bundle = bundle
+        self.index = i
+        self.filename = bundle.describe(i)
+        self.fileSettings = copy.copy(sound.defaultFileSettings)
+        self.fileSettings['channels'] = 2
+        self.sndStripped = None
+        self.cacheKey = None
+        length = bundle.index[i][4]
+        self.duration = (length * 1000) / (self.RESAMPLEDRATE
+                                           * self.sampleWidth
+                                           * self.numchannels)
+    def load(self):
+        """
+        Map the samples from the bundle, without copying them (unless
+        they must be byte swapped).
+        """
+        if self.snd is None:
+            # (the samples are left in the bundle's map unless they
+            # must be swapped)
+            samples = numpy.frombuffer(self.bundle.payload(self.index), numpy.int16)
+            if self.bundle.index[self.index][5] != sys.byteorder:
+                samples = samples.byteswap()
+            self.setSamples(samples)
+    def append(self, data, numchans):
+        """
+        Bundled sounds can not be recorded to.
+        """
+        raise sound.SoundException("Can't append to a bundled sound.")
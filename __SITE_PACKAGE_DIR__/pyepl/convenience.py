@@ -25,6 +25,7 @@ import exputils
 
 import math, numpy, pygame
 import timing
+import rsvp
 
 # method for setting realtime
 def setRealtime(period=120, computation=9600, constraint=1200):
@@ -109,25 +110,18 @@ def instructBegin(text, font = None, size = None, color = None, scroll = None, r
     else:
         inst_color = display.defaultFontColor
 
-    # use the font's wordWrap method to get a list of Text objects, each representing a line of text
-    line_texts = inst_font.wordWrap(text, inst_size, inst_color, inst_resx - (inst_resy * (leftmargin + rightmargin)))
+    # lay out the text in a single pass, wrapped between the margins and aligned
+    inst_layout = inst_font.layout(text, inst_size, inst_resx - (inst_resy * (leftmargin + rightmargin)), justification)
 
-    # start with an empty list for 2-tuples of line Text objects and left padding amounts
-    inst_lines = []
+    # make a Text object for each line
+    line_texts = []
+    for line in inst_layout.lines:
+        line_texts.append(display.Text(line, inst_font, inst_size, inst_color))
 
-    # calculate left padding for each line...
-    if justification == "LEFT":
-        # if the justification is "left" put the left side of the texts at the left margin...
-        for line_text in line_texts:
-            inst_lines.append((line_text, leftmargin * inst_resy))
-    elif justification == "RIGHT":
-        # if the justification is "right" put the right side of the texts at the right margin...
-        for line_text in line_texts:
-            inst_lines.append((line_text, inst_resx - rightmargin * inst_resy - line_text.getSize()[0]))
-    elif justification == "CENTER":
-        # uf the justification is "center" center the texts between the margins...
-        for line_text in line_texts:
-            inst_lines.append((line_text, (leftmargin * inst_resy) + (inst_resx - (leftmargin + rightmargin) * inst_resy) / 2 - line_text.getSize()[0] / 2))
+    # list of 2-tuples of line Text objects and left padding amounts
+    inst_lines = []
+    for line_text, offset in zip(line_texts, inst_layout.offsets):
+        inst_lines.append((line_text, leftmargin * inst_resy + offset))
     
     # persistently load texts
     for line_text in line_texts:
@@ -177,9 +171,8 @@ def instructBegin(text, font = None, size = None, color = None, scroll = None, r
     # we want to fill a screenfull before maxpos becomes positive
     inst_maxpos = -inst_resy + inst_topmargin
 
-    for line, leftpadding in inst_lines:
-        # increase maxpos by the vertical size of all the lines combined
-        inst_maxpos += line.getSize()[1]
+    # increase maxpos by the vertical size of all the lines combined
+    inst_maxpos += inst_layout.size[1]
 
     # if maxpos is still negative (i.e. there was less than a screenfull)...
     if inst_maxpos < 0.0:
@@ -593,7 +586,49 @@ def presentStimuli(stimuli, attribute, duration, clk = None, on_jitter = None, I
         if ISI is not None:
             clk.delay(ISI,ISI_jitter)
 
-        
+
+def presentRSVP(showables, frames, blankFrames = 0, clk = None):
+    """
+    Present showables one after another, each for a whole number of
+    refreshes, with the frames flipped back to back (see
+    rsvp.RSVPSequence).
+
+    INPUT ARGS:
+      showables- list of showables, shown centered.
+      frames- number of frames to show each one (or a list with one
+              number per showable).
+      blankFrames- number of frames with only the background after
+                   each one (or a list).
+      clk- PresentationClock for timing.
+
+    OUTPUT ARGS:
+      onsets- list of the timestamps of each showable's onset.
+      missed- list of (showable index, frame, lateness) tuples for
+              frames that missed their slot.
+    """
+    if not isinstance(frames, (list, tuple)):
+        frames = [frames] * len(showables)
+    if not isinstance(blankFrames, (list, tuple)):
+        blankFrames = [blankFrames] * len(showables)
+
+    # build the sequence, noting the showable each item belongs to
+    seq = rsvp.RSVPSequence()
+    owner = []
+    for i, (showable, n, blank) in enumerate(zip(showables, frames, blankFrames)):
+        seq.add(showable, n)
+        owner.append(i)
+        if blank:
+            seq.add(None, blank)
+            owner.append(i)
+
+    try:
+        onsets = seq.present(clk)
+    finally:
+        seq.release()
+    onsets = [onsets[j] for j in xrange(len(owner)) if j == 0 or owner[j] != owner[j - 1]]
+    missed = [(owner[item], frame, lateness) for item, frame, lateness in seq.getMissed()]
+    return onsets, missed
+
 def flashStimulus(showable, duration = 1000, x = 0.5, y = 0.5, jitter = None, clk = None):
     """
     Flash a showable on the screen for a specified duration.
@@ -16,13 +16,22 @@ from base import Carvable, Track, Registered, MediaFile, UniquelyConstructed
 import hardware
 import timing
 import threading
+import time
 #import PIL.Image  # catch error here!
 import os
 import weakref
 import exputils
+import frametiming
+import lrucache
 from stimulus import Stimulus
 
 import pygame
+import numpy
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
 
 # Get the PyEPL directory (used below to find the default font)
 pyepldir = os.path.abspath(os.path.dirname(__file__))
@@ -52,6 +61,13 @@ class Showable:
     """
     An object which may be displayed in the basic video output layer.
     """
+    # True if show only draws through LowImage.show (or clearScreen),
+    # so it can be drawn as part of a frame's sprite batch
+    batchable = False
+    # True if show draws the same thing every time until changed is
+    # called, so a frame made only of retainable showables can be
+    # presented again from an offscreen copy
+    retainable = False
     def __init__(self):
         self.loadRequireCount = 0
     def requireLoaded(self):
@@ -71,6 +87,17 @@ class Showable:
         Draw this object.
         """
         pass
+    def changed(self):
+        """
+        Note that this object now draws differently, so retained
+        frames showing it must be drawn again.
+        """
+        # let anything that drew a copy of it (see FlattenedStimulus) know
+        self.changeCount = getattr(self, "changeCount", 0) + 1
+
+        v = VideoTrack.lastInstance()
+        if v:
+            v.invalidate()
     def getSize(self):  # to be overridden
         """
         Return a 2-tuple representing the X and Y dimensions of this
@@ -138,10 +165,41 @@ class ActiveShowable(Showable):
         """
         return "ACTIVESHOWABLE"
 
+def forgetDerived(key, image):
+    """
+    Let an Image evicted from the derived image cache be freed.
+    """
+    Image.loaded.pop(((image.img,), ()), None)
+
+# Images made by pixel operations, by source, source pixel generation,
+# operation and arguments
+derivedImages = lrucache.LRUCache(64 * 1024 * 1024, forgetDerived)
+
+def setDerivedImageBudget(nbytes):
+    """
+    Set the number of bytes of images made by pixel operations (such
+    as Image.contrast) kept for reuse by identical calls.
+    """
+    derivedImages.setBudget(nbytes)
+
+def operandKey(x):
+    """
+    Return a hashable key for an argument of a pixel operation.
+    """
+    if isinstance(x, Image):
+        return (x, x.pixelGeneration)
+    if isinstance(x, numpy.ndarray):
+        return (x.shape, x.dtype.str, sha1(numpy.ascontiguousarray(x).data).hexdigest())
+    if isinstance(x, Color):
+        return (x.red, x.green, x.blue, x.alpha)
+    return x
+
 class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
     """
     Represents an image.
     """
+    batchable = True
+    retainable = True
 #    def __uinit__(self, x, propxsize = 0.5, propysize = 0.5):
     def __uinit__(self, x, propxsize = None, propysize = None):
         """
@@ -171,6 +229,12 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
             self.img = None
             self.img_unscaled = None
 
+        # background load in progress (see loadAsync)
+        self.loadjob = None
+
+        # incremented whenever the pixels are changed
+        self.pixelGeneration = 0
+
         # set empty logline
         self.logLineStr = 'IMAGE'
 
@@ -192,12 +256,51 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         return r
     def getLowUnscaled(self):
         """
+        Returns the LowImage object of the image at its original size.
         """
         if self.img:
+            if self.img_unscaled is None:
+                # the scaled image came from the image cache, so the
+                # file has not been decoded yet
+                self.img_unscaled = hardware.graphics.LowImage(self.filename)
             return self.img_unscaled
-        self.load()
-        r = self.img_unscaled
-        self.unload()
+
+        # not loaded, so decode the file rather than loading (and
+        # scaling) it
+        return hardware.graphics.LowImage(self.filename)
+    def requireLoaded(self):
+        """
+        Load the image and keep it loaded until unrequireLoaded.
+        """
+        self.loadRequireCount += 1
+
+        # file-backed images can be unloaded by the texture residency
+        # manager (their textures are accounted as they are made)
+        if not self.filename is None:
+            hardware.graphics.residency.manager.use(self)
+
+        if not self.isLoaded():
+            self.load()
+    def unrequireLoaded(self):
+        """
+        Allow the image to be unloaded.  It stays loaded (so showing
+        it again is cheap) until the texture budget needs the room.
+        """
+        self.loadRequireCount -= 1
+        if self.loadRequireCount < 0:
+            self.loadRequireCount = 0
+        if self.loadRequireCount == 0 and not self.filename is None:
+            hardware.graphics.residency.manager.release(self)
+    def getByteSize(self):
+        """
+        Return the approximate number of bytes used by the loaded
+        image (0 if it is not loaded).
+        """
+        if not self.img:
+            return 0
+        r = self.img.getByteSize()
+        if not self.img_unscaled is None and not self.img_unscaled is self.img:
+            r += self.img_unscaled.getByteSize()
         return r
     def load(self):
         """
@@ -208,53 +311,145 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         be unloaded after it is shown with SmartShow.
         """
         if not self.img:
-            # if it's not already loaded, load it by constructing a LowImage object...
+            self.loadLow()
 
-            # if there are no proportional dimensions...
-            if self.propxsize is None or self.propysize is None:
-                # construct the LowImage without scaling
-                self.img = hardware.graphics.LowImage(self.filename)
+            # make room for the new textures (which may unload idle images)
+            if not self.filename is None:
+                hardware.graphics.residency.manager.loaded(self)
+    def loadLow(self):
+        """
+        Make the LowImage objects for the image file.
+        """
+        # if it's being loaded in the background, finish that (waiting if necessary)
+        if self.loadjob:
+            job = self.loadjob
+            self.loadjob = None
+            self.img_unscaled, self.img = job.finish()
+            return
+
+        # if it's not already loaded, load it by constructing a LowImage object...
+
+        # if there are no proportional dimensions...
+        if self.propxsize is None or self.propysize is None:
+            # construct the LowImage without scaling
+            self.img = hardware.graphics.LowImage(self.filename)
 
-                # set the unscaled image to be the normal one
-                self.img_unscaled = self.img
+            # set the unscaled image to be the normal one
+            self.img_unscaled = self.img
+
+            # and we're done
+            return
+
+        # try to get the VideoTrack
+        v = VideoTrack.lastInstance()
 
-                # and we're done
+        # if there is a VideoTrack...
+        if v:
+            # get the screen's vertical resolution
+            yres = v.getResolution()[1]
+
+            # calculate the pixel dimensions for the image based on the vertical resolution and the proportional dimensions
+            xs = int(yres * self.propxsize)
+            ys = int(yres * self.propysize)
+
+            # if there is an image cache, get the scaled pixels from it
+            surf = hardware.graphics.imagecache.scaledSurface(self.filename, (xs, ys))
+            if surf is not None:
+                # the unscaled image is only loaded if it is asked for
+                self.img = hardware.graphics.LowImage(surf)
+                self.img_unscaled = None
                 return
+            
+            # construct the LowImage
+            self.img_unscaled = hardware.graphics.LowImage(self.filename)
+
+            # scale it
+            self.img = self.img_unscaled.scale(xs, ys)
+        else:
+            # no VideoTrack...
 
+            # construct the LowImage without scaling
+            self.img = hardware.graphics.LowImage(self.filename)
+
+            # set the unscaled image to be the normal one
+            self.img_unscaled = self.img
+
+            # set the proportional dimensions to None...
+            self.propxsize = None
+            self.propysize = None
+    def loadAsync(self):
+        """
+        Start loading the image without waiting for it.  The file is
+        decoded (and scaled) on a background thread, and its texture
+        is made during later screen updates.  Use isReady to see if
+        it has finished; load or show will wait for it if it has not.
+        """
+        if self.img or self.loadjob or self.filename is None:
+            # already loaded or loading
+            return
+
+        size = None
+        if not self.propxsize is None and not self.propysize is None:
             # try to get the VideoTrack
             v = VideoTrack.lastInstance()
 
-            # if there is a VideoTrack...
             if v:
-                # get the screen's vertical resolution
+                # calculate the pixel dimensions from the vertical resolution, as in load
                 yres = v.getResolution()[1]
-
-                # calculate the pixel dimensions for the image based on the vertical resolution and the proportional dimensions
-                xs = int(yres * self.propxsize)
-                ys = int(yres * self.propysize)
-                
-                # construct the LowImage
-                self.img_unscaled = hardware.graphics.LowImage(self.filename)
-
-                # scale it
-                self.img = self.img_unscaled.scale(xs, ys)
+                size = (int(yres * self.propxsize), int(yres * self.propysize))
             else:
-                # no VideoTrack...
+                # no VideoTrack, so no scaling
+                self.propxsize = None
+                self.propysize = None
 
-                # construct the LowImage without scaling
-                self.img = hardware.graphics.LowImage(self.filename)
+        self.loadjob = hardware.loadImageAsync(self.filename, size)
+    def isReady(self):
+        """
+        Return True if the image is loaded, so showing it will not
+        have to wait.
+        """
+        if self.img:
+            return True
+        if self.loadjob and self.loadjob.isReady():
+            # take the finished LowImages (or raise the loading error)
+            self.load()
+            return True
+        return False
+    def prepareCache(self, yres = None):
+        """
+        Make sure the image, scaled to its proportional size, is in
+        the image cache (see hardware.setImageCache), without loading
+        it.
 
-                # set the unscaled image to be the normal one
-                self.img_unscaled = self.img
+        INPUT ARGS:
+          yres- (optional) vertical screen resolution to scale for.
+                Defaults to the VideoTrack's.
 
-                # set the proportional dimensions to None...
-                self.propxsize = None
-                self.propysize = None
+        OUTPUT ARGS:
+          made- True if the scaled image had to be made.
+        """
+        if self.filename is None or self.propxsize is None or self.propysize is None:
+            # nothing to scale
+            return False
+        if yres is None:
+            v = VideoTrack.lastInstance()
+            if not v:
+                raise RuntimeError, "No VideoTrack to get the resolution from."
+            yres = v.getResolution()[1]
+        size = (int(yres * self.propxsize), int(yres * self.propysize))
+        return hardware.graphics.imagecache.prepare(self.filename, size)
     def unload(self):
         """
         After calling this method, the Image's data is unloaded from memory.
         """
+        # stop any background load
+        if self.loadjob:
+            self.loadjob.cancel()
+            self.loadjob = None
+
         # unload by removing our internal reference to the LowImage object
+        if self.img and not self.filename is None:
+            hardware.graphics.residency.manager.unloaded(self)
         self.img = None
         self.img_unscaled = None
     def isLoaded(self):
@@ -277,6 +472,7 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
             del d["img_unscaled"]
         except KeyError:
             pass
+        d["loadjob"] = None
         return d
     def __setstate__(self, state):
         """
@@ -285,6 +481,7 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         # unpickle with None as self.image (since we left it out when we pickled)
         self.__dict__.update(state)
         self.img = None
+        self.loadjob = None
     def export(self, archive, namehint):
         """
         Export image.
@@ -336,7 +533,83 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         self.load()
         
         # Set the value or slice in the LowImage
+        if isinstance(value, Image):
+            value = value.getLow()
         self.img[index] = value
+
+        # anything showing this image must be redrawn
+        self.pixelGeneration += 1
+        self.changed()
+    def getPixels(self):
+        """
+        Return the image's pixels as a (height, width, 4) uint8 RGBA
+        NumPy array, without copying them: writing to the array
+        changes the image.  Call pixelsChanged after writing to it.
+        The array stays valid while the image is loaded.
+        """
+        self.load()
+        return self.img.getPixels()
+    def pixelsChanged(self):
+        """
+        Note that the pixels were changed through getPixels.
+        """
+        # make sure the image is not "carved in stone"
+        self.aboutToChange()
+
+        self.img.changed()
+        self.pixelGeneration += 1
+        self.changed()
+    def derive(self, op, args, cache = True):
+        """
+        Return the Image made by calling the LowImage method op with
+        args, reusing the result of an earlier identical call if it
+        is still cached.
+        """
+        if cache:
+            key = (self, self.pixelGeneration, op, tuple([operandKey(a) for a in args]))
+            r = derivedImages.get(key)
+            if not r is None:
+                return r
+        self.load()
+        lowargs = [isinstance(a, Image) and a.getLow() or a for a in args]
+        r = Image(getattr(self.img, op)(*lowargs))
+        if cache:
+            derivedImages.put(key, r, r.getByteSize())
+        return r
+    def crop(self, x, y, w, h):
+        """
+        Return a new Image of the w by h pixels with their upper left
+        corner at x, y.
+        """
+        return self.derive("crop", (x, y, w, h))
+    def blend(self, other, weight = 0.5):
+        """
+        Return a new Image mixing this image (1 - weight) with other
+        (weight): an Image or array of the same size, or a Color.
+        """
+        return self.derive("blend", (other, weight))
+    def alphaMask(self, mask):
+        """
+        Return a new Image whose alpha is this image's multiplied by
+        mask: an Image of the same size (whose gray level is used),
+        or a (height, width) array of values from 0.0 to 1.0 (floats)
+        or 0 to 255 (integers).
+        """
+        return self.derive("alphaMask", (mask,))
+    def contrast(self, factor, mean = None):
+        """
+        Return a new Image with the color values moved away from
+        (factor > 1) or toward (factor < 1) mean, which defaults to
+        the image's mean value.
+        """
+        return self.derive("contrast", (factor, mean))
+    def phaseScramble(self, amount = 1.0, seed = None):
+        """
+        Return a new Image with the same amplitude spectrum and amount
+        (0.0 to 1.0) of random phase added.  Give a seed to make the
+        result repeatable (and cached).
+        """
+        return self.derive("phaseScramble", (amount, seed), cache = not seed is None)
     def __mul__(self, x):
         """
         Color multiplication.
@@ -345,6 +618,8 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         self.load()
         
         # multiply the LowImages and return the result wrapped in an Image object
+        if isinstance(x, Image):
+            x = x.getLow()
         return Image(self.img * x)
     def __div__(self, x):
         """
@@ -354,6 +629,8 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         self.load()
 
         # divide the LowImages and return the result wrapped in an Image object
+        if isinstance(x, Image):
+            x = x.getLow()
         return Image(self.img / x)
     def __add__(self, x):
         """
@@ -363,6 +640,8 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         self.load()
         
         # add the LowImages and return the result wrapped in an Image object
+        if isinstance(x, Image):
+            x = x.getLow()
         return Image(self.img + x)
     def __sub__(self, x):
         """
@@ -372,6 +651,8 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
         self.load()
 
         # subtract the LowImages and return the result wrapped in an Image object
+        if isinstance(x, Image):
+            x = x.getLow()
         return Image(self.img - x)
     def __neg__(self):
         """
@@ -402,7 +683,7 @@ class Image(UniquelyConstructed, Carvable, Showable, Stimulus):
             ys = int(yres * y)
 
         # scale the LowImages and return the result wrapped in an Image object
-        return Image(self.img_unscaled.scale(int(xs), int(ys)), x, y)
+        return Image(self.getLowUnscaled().scale(int(xs), int(ys)), x, y)
     def apply(self, f):
         """
         Apply function f to all pixels of image for result.  f can
@@ -496,6 +777,7 @@ class Movie(UniquelyConstructed, Showable, Stimulus):
     When you are done playing a movie, you can then unshow the image
     where the movie was projected.
     """
+    batchable = True
     def __uinit__(self, x):
         """
         Creates a new Movie object.  It uses pygame to play the movie,
@@ -537,14 +819,17 @@ class Movie(UniquelyConstructed, Showable, Stimulus):
 
         if self.img is None:
             # Create a surface where pygame will render the movie
-            self._render_surf = pygame.Surface(self.movie.get_size())
+            # (32 bits deep, so its pixels can go to OpenGL as they are)
+            self._render_surf = pygame.Surface(self.movie.get_size(), 0, 32)
 
             # Tell the movie to render frames to that new surface
             self.movie.set_display(self._render_surf)
 
             # Create a LowImage for performing the OpenGL blitting of the
-            # movie frames to the actual OpenGL surface that we use
-            self.img = hardware.graphics.LowImage(self._render_surf)
+            # movie frames to the actual OpenGL surface that we use.
+            # Its texture is streamed: allocated once and updated in
+            # place with each new frame.
+            self.img = hardware.graphics.LowImage(self._render_surf, streaming = True)
     def unload(self):
         """
         After calling this method, the Movie's data is unloaded from memory.
@@ -829,6 +1114,30 @@ class Font(MediaFile):
         """
         # return a text object
         return Text(text, self, size, color)
+    def layout(self, text, size = None, width = None, align = "LEFT"):
+        """
+        Lay out text without rendering it.  Returns a TextLayout with
+        the lines, their widths and their x offsets for the alignment.
+
+        INPUT ARGS:
+          text- the text to lay out.
+          size- proportional font size (defaults to the default size).
+          width- if given, word wrap to this many pixels (paragraphs
+            are followed by a blank line).  Otherwise, only newlines
+            break lines.
+          align- "LEFT", "RIGHT" or "CENTER" within width.
+        """
+        global defaultFontSize
+        if not size:
+            size = defaultFontSize
+
+        # calculate the font size in pixels (from its proportional size)
+        truesize = int(VideoTrack.lastInstance().getResolution()[1] * size)
+
+        # make sure the font is loaded
+        self.load()
+
+        return self.font.layout(text, truesize, width, align)
     def wordWrap(self, text, size, color, width):
         """
         Like write, but instead return a list of text objects where
@@ -853,65 +1162,13 @@ class Font(MediaFile):
         # make sure the font is loaded
         self.load()
 
-        # split up the text by paragraph breaks
-        para = text.split("\n\n")
-
-        # start a list of paragraphs
-        paragraphs = []
-
-        # for each paragraph (between paragraph breaks)...
-        for p in para:
-            # remove leading and trailing white space and replace newlines with spaces
-            p = p.lstrip().rstrip().replace("\n", " ")
-
-            # if there anything left after that...
-            if len(p):
-                # start a list of words in the paragraph
-                words = []
+        # lay out the text in a single pass (paragraphs are followed by a blank line)
+        layout = self.font.layout(text, truesize, width)
 
-                # split up the paragraph at spaces
-                for word in p.split(" "):
-                    # for each resulting string that's not empty...
-                    if len(word):
-                        # add the word to the word list
-                        words.append(word)
-
-                # add the word list to the paragraph list
-                paragraphs.append(words)
-
-        # start a list to hold the text objects
+        # make a Text object for each line
         result = []
-
-        # iterate over the paragraphs (each one is a list of words)...
-        for words in paragraphs:
-            # start with the first word of the paragraph
-            wordbase = 0
-
-            # set the limit to the length of the paragraph (in words)
-            wordlimit = len(words)
-
-            # as long as we haven't placed all the words yet...
-            while wordbase != wordlimit:
-                # construct a string - a potential line
-                line = " ".join(words[wordbase : wordlimit])
-
-                # find out how long it would be if we rendered it
-                lwidth, lheight = self.font.getSize(line, truesize)
-                if lwidth > width:
-                    # if it's to big for our width, take off one of the words and try again
-                    wordlimit -= 1
-                else:
-                    # otherwise, append the appropriate Text object to the result
-                    result.append(Text(line, self, size, color))
-
-                    # reset the word base so only the remaining words of the paragraph will be placed
-                    wordbase = wordlimit
-
-                    # reset the word limit so the rest of the paragraph will be placed
-                    wordlimit = len(words)
-
-            # add a blank line after each paragraph
-            result.append(Text("", self, size, color))
+        for line in layout.lines:
+            result.append(Text(line, self, size, color))
 
         # return the lines
         return result
@@ -934,11 +1191,73 @@ def setDefaultFont(font = None, size = None, color = None):
     if color:
         defaultFontColor = color
 
+# how Text objects are drawn: "atlas" lays out glyph quads from a
+# shared texture per font and size (tinted on the GPU), "texture"
+# renders each line into its own texture
+textBackend = "atlas"
+
+def setTextBackend(backend):
+    """
+    Choose how Text objects are rendered from now on, either "atlas"
+    (the default) or "texture".
+    """
+    global textBackend
+    if backend not in ("atlas", "texture"):
+        raise ValueError, "Invalid text backend: %r" % backend
+    textBackend = backend
+
+def setTextCacheBudget(nbytes):
+    """
+    Set the number of bytes of rendered text (textures, glyph atlases
+    and glyph layouts) kept for reuse by identical Text objects.  The least
+    recently used renderings are dropped first.
+    """
+    hardware.graphics.font.textCache.setBudget(nbytes)
+
+def getTextCacheStats():
+    """
+    Return a dictionary of rendered text cache statistics (entries,
+    bytes, budget, hits, misses, evictions).
+    """
+    return hardware.graphics.font.textCache.getStats()
+
+def prewarm(items, font = None, size = None, color = None):
+    """
+    Render text ahead of time, for example while instructions are on
+    the screen, so that constructing and showing the same Text during
+    a trial costs no rasterization or texture upload.
+
+    INPUT ARGS:
+      items- A Pool, or a sequence of strings and/or Text objects.
+        For a Pool, the Text attributes of each item are rendered, as
+        is the item's name with the font, size and color given here
+        (as Pool.makeTexts would make it).
+      font/size/color- Font attributes used for plain strings.
+    """
+    for item in items:
+        if isinstance(item, dict):
+            # a PoolDict: warm its Text attributes and its name
+            texts = [v for v in item.itervalues() if isinstance(v, Text)]
+            if item.has_key("name"):
+                texts.append(Text(str(item["name"]), font, size, color))
+        elif isinstance(item, Text):
+            texts = [item]
+        else:
+            texts = [Text(str(item), font, size, color)]
+
+        for t in texts:
+            if not t.isLoaded():
+                # rendering fills the cache; the cache decides how long it's kept
+                t.render()
+                t.unrender()
+
 class Text(Showable, Stimulus):
     """
     Represents a string of text rendered with a certain font, color,
     and size.
     """
+    batchable = True
+    retainable = True
     def __init__(self, text, font = None, size = None, color = None):
         """
         Create text object.
@@ -997,7 +1316,10 @@ class Text(Showable, Stimulus):
         # for each line of text...
         for t in self.text:
             # ...append the rendered line
-            self.rendered.append(self.font.font.write(t, self.size, self.color.getTuple()))
+            if textBackend == "atlas":
+                self.rendered.append(self.font.font.writeGlyphs(t, self.size, self.color.getTuple()))
+            else:
+                self.rendered.append(self.font.font.write(t, self.size, self.color.getTuple()))
     def unrender(self):
         """
         Delete all the rendered text.
@@ -1060,14 +1382,8 @@ class Text(Showable, Stimulus):
             # in it hasn't been rendered...
             # make sure the font is loaded
             self.font.load()
-            self.xsize = 0
-            self.ysize = 0
-            for t in self.text:
-                # iterate through the lines of text, getting the sum of y sizes and the maximum of x sizes
-                # we query the font object for how large the text would be if rendered
-                x, y = self.font.font.getSize(t, self.size)
-                self.xsize = max(self.xsize, x)
-                self.ysize += y
+            # the cached font metrics tell us how large the text would be if rendered
+            self.xsize, self.ysize = self.font.font.layout("\n".join(self.text), self.size).size
         return self.xsize, self.ysize
     
     def getSize(self):
@@ -1085,18 +1401,26 @@ class Text(Showable, Stimulus):
     def setColor(self, color):
         #set the color
         self.color = Color(color)
-        #re-render
-        self.render()
+        if self.rendered and isinstance(self.rendered[0], hardware.graphics.LowText):
+            # glyph quads are tinted on the GPU, so just change their color
+            for i in self.rendered:
+                i.setColor(self.color.getTuple())
+        else:
+            #re-render
+            self.render()
+        self.changed()
 
     def setSize(self, size):
         self.propsize = size
         self.render()
         self.setXYSize()
+        self.changed()
 
     def setFont(self, font):
         self.font = font
         self.render()
         self.setXYSize()
+        self.changed()
             
     def logLine(self):
         """
@@ -1153,7 +1477,7 @@ class CompoundStimulus(Stimulus):
     Comibine multiple stimuli into a single compound stimulus that you
     can present at once.  
     """
-    def __init__(self,stimuli):
+    def __init__(self,stimuli,flatten=False):
 	"""
 	stimuli = [(Name,[Text,Image],[ABS,PROP,REL],[LOC,(Relation,Name)]), ...]
 
@@ -1203,16 +1527,58 @@ class CompoundStimulus(Stimulus):
 	the offset in pixels and not proportional units.
 
 	('cool',stim,'ANCHOR',(CENTER, propToPixel(.25,.75), (.1,.15), True))
+
+	If flatten is True, the stimuli are drawn once into an
+	offscreen texture when first shown, which is then shown as a
+	single image.  It is drawn again only when one of the stimuli
+	changes, and the layout is worked out again only when the
+	screen resolution or the size of a stimulus changes.  Stimuli
+	that can not be drawn this way (such as movies) are shown
+	separately as usual.
 	
 	Example:
 	"""
 	self.stimuli = stimuli
+	self.flatten = flatten
+
+	# the FlattenedStimulus made by show (when flattening)
+	self.flattened = None
+	self.flatShown = None
 
     def show(self):
+	v = VideoTrack.lastInstance()
+	if self.flatten and hardware.graphics.composite.available():
+	    batchable = [stim.batchable for label, stim, specMode, location in self.stimuli]
+	    if not False in batchable:
+		self.showFlat(v)
+		return
+	self.showChildren(v)
+
+    def showFlat(self, v):
+	"""
+	Show the stimuli as one FlattenedStimulus.
+	"""
+	key = (v.getResolution(), [stim.getSize() for label, stim, specMode, location in self.stimuli])
+	if self.flattened is None or self.flattened.layoutKey != key:
+	    # lay the stimuli out as they would be shown, then take
+	    # them off the screen again (once the flattened stimulus
+	    # has loaded them)
+	    self.showChildren(v)
+	    entries = [v.pending.get(self.showns[label]) for label, stim, specMode, location in self.stimuli]
+	    self.flattened = FlattenedStimulus(entries)
+	    self.flattened.layoutKey = key
+	    self.flatShown = v.show(self.flattened, *self.flattened.origin)
+	    v.unshow(*self.showns.values())
+	else:
+	    self.flatShown = v.show(self.flattened, *self.flattened.origin)
+
+    def showChildren(self, v):
+	"""
+	Show each of the stimuli.
+	"""
 	# loop and show the stimuli, keeping track of the showns in a
 	# dictionary referenced by Name
 	self.showns = {}
-	v = VideoTrack.lastInstance()
 	for label, stim, specMode, location in self.stimuli:
 	    if specMode=='ABS':
 		self.showns[label] = v.show(stim, location[0], location[1])
@@ -1256,6 +1622,9 @@ class CompoundStimulus(Stimulus):
 	keyslist = self.showns.keys()
 	for key in keyslist:
 	    v.unshow(self.showns[key])
+	if self.flatShown is not None:
+	    v.unshow(self.flatShown)
+	    self.flatShown = None
 
     def present(self, clk = None, duration = None, jitter = None, bc = None, minDuration = None):
         """
@@ -1299,11 +1668,112 @@ class CompoundStimulus(Stimulus):
             return timestamp
 
     
+class FlattenedStimulus(Showable):
+    """
+    A group of batchable showables drawn into a render target, so
+    that showing the group draws one quad.
+    """
+    batchable = True
+    retainable = True
+    def __init__(self, entries):
+        """
+        Create FlattenedStimulus.
+
+        INPUT ARGS:
+          entries- list of (shown, showable, x, y) tuples, in draw
+                   order, at their places on the screen.
+        """
+        Showable.__init__(self)
+        self.entries = entries
+
+        # the bounding box of the showables
+        x0 = min([x for shown, showable, x, y in entries])
+        y0 = min([y for shown, showable, x, y in entries])
+        x1 = max([x + showable.getSize()[0] for shown, showable, x, y in entries])
+        y1 = max([y + showable.getSize()[1] for shown, showable, x, y in entries])
+        self.origin = (x0, y0)
+        self.size = (x1 - x0, y1 - y0)
+
+        # the render target and the change counts of the showables
+        # when it was drawn
+        self.target = None
+        self.drawnCounts = None
+    def getChangeCounts(self):
+        """
+        Return the change counts of the showables.
+        """
+        return [getattr(showable, "changeCount", 0) for shown, showable, x, y in self.entries]
+    def requireLoaded(self):
+        """
+        Keep the showables loaded too.
+        """
+        Showable.requireLoaded(self)
+        for shown, showable, x, y in self.entries:
+            showable.requireLoaded()
+    def unrequireLoaded(self):
+        """
+        Allow the showables to be unloaded too.
+        """
+        Showable.unrequireLoaded(self)
+        for shown, showable, x, y in self.entries:
+            showable.unrequireLoaded()
+    def isLoaded(self):
+        """
+        Return True if all the showables are loaded.
+        """
+        for shown, showable, x, y in self.entries:
+            if not showable.isLoaded():
+                return False
+        return True
+    def load(self):
+        """
+        Load the showables.
+        """
+        for shown, showable, x, y in self.entries:
+            showable.load()
+    def unload(self):
+        """
+        Drop the render target.
+        """
+        self.target = None
+    def getSize(self):
+        """
+        Return the size of the bounding box of the showables.
+        """
+        return self.size
+    def drawShowables(self):
+        """
+        Draw the showables at their places.
+        """
+        for shown, showable, x, y in self.entries:
+            showable.show(x, y)
+    def show(self, x, y):
+        """
+        Draw the group with its upper left corner at x, y, drawing the
+        showables into the render target first if any of them changed.
+        """
+        counts = self.getChangeCounts()
+        if self.target is None:
+            self.target = hardware.graphics.RenderTarget(*self.size)
+        if counts != self.drawnCounts or not self.target.isCurrent():
+            self.target.capture(self.origin[0], self.origin[1], self.drawShowables)
+            self.drawnCounts = counts
+        self.target.show(x, y)
+    def logLine(self):
+        """
+        Identify the group and its showables for the video log.
+        """
+        parts = ["%d,%d,%s" % (x - self.origin[0], y - self.origin[1], showable.logLine().replace("\t", " "))
+                 for shown, showable, x, y in self.entries]
+        return "COMPOUND\t%d\t%s" % (len(parts), ";".join(parts))
+
 class SolidBackground(Showable):  # change this to handle any rectangular region
     """
     Draw the same color to every pixel on the screen regardless of
     showing position.
     """
+    batchable = True
+    retainable = True
     def __init__(self, color):
         """
         Create SolidBackground object.
@@ -1325,6 +1795,130 @@ class SolidBackground(Showable):  # change this to handle any rectangular region
         """
         return "BG\t%s" % (self.color,)
 
+class DisplayList:
+    """
+    The ordered list of (shown, showable, x, y) entries to draw, back
+    to front.  Entries are kept in a doubly linked list indexed by
+    their Shown, so finding, removing and reordering an entry does not
+    depend on how many others there are.
+    """
+    # indices into the links of the list
+    PREV = 0
+    NEXT = 1
+    ENTRY = 2
+    def __init__(self):
+        """
+        Create an empty DisplayList.
+        """
+        # links [prev, next, entry] by Shown
+        self.links = {}
+
+        # circular list; root[NEXT] is drawn first
+        self.root = []
+        self.root[:] = [self.root, self.root, None]
+
+        # list of the entries in draw order (None when out of date)
+        self.snapshot = None
+    def __len__(self):
+        """
+        Return the number of entries.
+        """
+        return len(self.links)
+    def __contains__(self, shown):
+        """
+        Test whether a Shown is in the list.
+        """
+        return shown in self.links
+    def __iter__(self):
+        """
+        Iterate over the entries in draw order.
+        """
+        return iter(self.getEntries())
+    def getEntries(self):
+        """
+        Return a list of the entries in draw order.  The same list is
+        returned until the display list changes, so it must not be
+        modified.
+        """
+        if self.snapshot is None:
+            r = []
+            link = self.root[DisplayList.NEXT]
+            while link is not self.root:
+                r.append(link[DisplayList.ENTRY])
+                link = link[DisplayList.NEXT]
+            self.snapshot = r
+        return self.snapshot
+    def get(self, shown):
+        """
+        Return the entry for a Shown.  Raises ValueError if it is not
+        present.
+        """
+        try:
+            return self.links[shown][DisplayList.ENTRY]
+        except KeyError:
+            raise ValueError, "Shown not present."
+    def insertBefore(self, entry, link):
+        """
+        Add entry to the list just before link.
+        """
+        prev = link[DisplayList.PREV]
+        new = [prev, link, entry]
+        prev[DisplayList.NEXT] = new
+        link[DisplayList.PREV] = new
+        self.links[entry[0]] = new
+        self.snapshot = None
+    def append(self, entry):
+        """
+        Add entry to be drawn last (in front of everything else).
+        """
+        self.insertBefore(entry, self.root)
+    def remove(self, shown):
+        """
+        Remove and return the entry for a Shown.  Raises ValueError if
+        it is not present.
+        """
+        try:
+            link = self.links.pop(shown)
+        except KeyError:
+            raise ValueError, "Shown not present."
+        link[DisplayList.PREV][DisplayList.NEXT] = link[DisplayList.NEXT]
+        link[DisplayList.NEXT][DisplayList.PREV] = link[DisplayList.PREV]
+        self.snapshot = None
+        return link[DisplayList.ENTRY]
+    def toFront(self, shown):
+        """
+        Move a Shown to be drawn last.
+        """
+        self.append(self.remove(shown))
+    def toBack(self, shown):
+        """
+        Move a Shown to be drawn first.
+        """
+        entry = self.remove(shown)
+        self.insertBefore(entry, self.root[DisplayList.NEXT])
+    def putBehind(self, shown1, shown2):
+        """
+        Move shown1 to be drawn just before shown2.
+        """
+        if shown2 not in self.links:
+            raise ValueError, "Shown (#2) not present."
+        if shown1 not in self.links:
+            raise ValueError, "Shown (#1) not present."
+        if shown1 is not shown2:
+            entry = self.remove(shown1)
+            self.insertBefore(entry, self.links[shown2])
+    def putInFrontOf(self, shown1, shown2):
+        """
+        Move shown1 to be drawn just after shown2.
+        """
+        if shown2 not in self.links:
+            raise ValueError, "Shown (#2) not present."
+        if shown1 not in self.links:
+            raise ValueError, "Shown (#1) not present."
+        if shown1 is not shown2:
+            entry = self.remove(shown1)
+            self.insertBefore(entry, self.links[shown2][DisplayList.NEXT])
+
 class VideoTrack(textlog.LogTrack):
     """
     A track for video output.
@@ -1339,8 +1933,8 @@ class VideoTrack(textlog.LogTrack):
         # call the LogTrack constructor
         textlog.LogTrack.__init__(self, basename, archive, autoStart)
 
-        # list of things that should be displayed when the screen is next updated
-        self.pending = []
+        # things that should be displayed when the screen is next updated
+        self.pending = DisplayList()
 
         # list of things on the screen now
         self.onscreen = []
@@ -1348,9 +1942,26 @@ class VideoTrack(textlog.LogTrack):
         # number of active showables represented in the onscreen list
         self.activepending = 0
 
+        # generation of the pending list, incremented whenever it changes
+        self.generation = 0
+
+        # generation of the onscreen list
+        self.onscreengeneration = None
+
+        # incremented whenever a showable changes how it draws
+        self.contentgeneration = 0
+
         # default to no minimum frame duration (no maximum framerate)
         self.minframeduration = 0L
 
+        # ms to leave before the refresh when pacing the render loop
+        # (None to run the render loop flat out)
+        self.pacingMargin = None
+
+        # estimated ms a render loop frame takes, from waking to
+        # submitting
+        self.frameWork = 0.0
+
         # initialize the last_updated timestamp
         self.last_updated = (0L, 0L)
 
@@ -1363,15 +1974,40 @@ class VideoTrack(textlog.LogTrack):
         # list of currently playing movies
         self._playing_movies = []
 
+        # log every showable at every update ("FULL") or only the changes ("DELTA")
+        self.logMode = "FULL"
+
+        # number of delta logged updates between keyframes
+        self.keyframeInterval = 100
+
+        self.resetDeltaLog()
+
+        # timing records of the most recent frames
+        self.frameTiming = frametiming.FrameTiming()
+
     def startLogging(self):
         """
         Begin logging all basic video output.
         """
+        # a new delta log starts with a keyframe
+        self.resetDeltaLog()
+
+        # summarize only the frames drawn while logging
+        if not self.logall:
+            self.frameTiming.clear()
+
         # call the LogTrack's startLogging method
         textlog.LogTrack.startLogging(self)
 
         # log the current resolution
         self.logResolution()
+    def stopLogging(self):
+        """
+        Log a summary of the frame timing and stop logging.
+        """
+        if self.logall:
+            self.logFrameSummary()
+        textlog.LogTrack.stopLogging(self)
     def startService(self):
         """
         Initialize video output.
@@ -1429,6 +2065,47 @@ class VideoTrack(textlog.LogTrack):
         else:
             # otherwise, set it to zero
             self.minframeduration = 0L
+    def setFramePacing(self, margin = 2.0):
+        """
+        Pace the render loop to the display: sleep until just before
+        the next refresh, then poll for events, call the frame
+        function and draw, so the frame is submitted margin ms before
+        the refresh.  The time frames take is estimated as the loop
+        runs.  A margin of None runs the render loop flat out.
+
+        Pacing leaves the processor idle between frames and shortens
+        the time from input to the screen.
+        """
+        self.pacingMargin = margin
+        self.frameWork = 0.0
+    def sleepUntilFrame(self):
+        """
+        Sleep until it is time to start a paced render loop frame and
+        return the time (as FrameTiming.now) of waking.
+        """
+        period = hardware.getRefreshStats()["period"]
+        now = self.frameTiming.now()
+        lead = self.pacingMargin + self.frameWork
+
+        # aim for the first refresh there is still time to make
+        target = hardware.nextRefresh()
+        while target - lead < now:
+            target += period
+        if target - lead - now > period:
+            # the refresh time is unknown; do not wait longer than a frame
+            target = now + lead
+        time.sleep((target - lead - now) / 1000.0)
+        return self.frameTiming.now()
+    def noteFrameWork(self, wake, submitted):
+        """
+        Update the estimate of how long paced frames take.  It rises
+        at once to a slow frame and falls back gradually.
+        """
+        work = submitted - wake
+        if work > self.frameWork:
+            self.frameWork = work
+        else:
+            self.frameWork += (work - self.frameWork) * 0.05
     def getResolution(self):
         """
         Return an x, y tuple of the screen's resolution.
@@ -1473,6 +2150,7 @@ class VideoTrack(textlog.LogTrack):
 
         # add the shown, showable, and position to the pending list
         self.pending.append((shown, showable, x, y))
+        self.generation += 1
 
         if isinstance(showable, ActiveShowable):
             # if it's an active showable, increment the activingpending count
@@ -1524,34 +2202,31 @@ class VideoTrack(textlog.LogTrack):
 	Relations can be one of BELOW, ABOVE, LEFT, RIGHT, OVER.  The
 	offset does not apply to the OVER relation.
         """
-        # iterate through the pending list looking for the shown specified...
-        for xshown, xshowable, x, y in self.pending:
-            # when we find it...
-            if xshown is shown:
-                # get the size of the associated showable
-                xs, ys = xshowable.getSize()
-
-                # get the size of the new showable
-                xs2, ys2 = showable.getSize()
-
-                # calculate the pixel position based on the sizes and positions of the showables and which relation is used...
-                if relation is BELOW:
-                    position = (x + (xs / 2) - (xs2 / 2), y + ys + offset)
-                elif relation is ABOVE:
-                    position = (x + (xs / 2) - (xs2 / 2), y - ys2 - offset)
-                elif relation is LEFT:
-                    position = (x - xs2 - offset, y + (ys / 2) - (ys2 / 2))
-                elif relation is RIGHT:
-                    position = (x + xs + offset, y + (ys / 2) - (ys2 / 2))
-                elif relation is OVER:
-                    position = (x + (xs / 2) - (xs2 / 2), y + (ys / 2) - (ys2 / 2))
-                else:
-                    # raise an exception if the relation provided is not recognized
-                    raise ValueError, "Invalid positional relation: %r" % relation
-                # show the new showable at the calculated position, returning the Shown object
-                return self.show(showable, *position)
-        # if we never found a matching Shown, raise an exception
-        raise ValueError, "Shown not present."
+        # look up the shown specified (raises ValueError if it is not there)
+        xshown, xshowable, x, y = self.pending.get(shown)
+
+        # get the size of the associated showable
+        xs, ys = xshowable.getSize()
+
+        # get the size of the new showable
+        xs2, ys2 = showable.getSize()
+
+        # calculate the pixel position based on the sizes and positions of the showables and which relation is used...
+        if relation is BELOW:
+            position = (x + (xs / 2) - (xs2 / 2), y + ys + offset)
+        elif relation is ABOVE:
+            position = (x + (xs / 2) - (xs2 / 2), y - ys2 - offset)
+        elif relation is LEFT:
+            position = (x - xs2 - offset, y + (ys / 2) - (ys2 / 2))
+        elif relation is RIGHT:
+            position = (x + xs + offset, y + (ys / 2) - (ys2 / 2))
+        elif relation is OVER:
+            position = (x + (xs / 2) - (xs2 / 2), y + (ys / 2) - (ys2 / 2))
+        else:
+            # raise an exception if the relation provided is not recognized
+            raise ValueError, "Invalid positional relation: %r" % relation
+        # show the new showable at the calculated position, returning the Shown object
+        return self.show(showable, *position)
     
     def propToPixel(self, x, y):
 	"""
@@ -1621,61 +2296,43 @@ class VideoTrack(textlog.LogTrack):
         """
         Remove showables from display.
         """
-        # keep a list of the indices of the entries in the pending list to be deleted
-        # we don't delete as we find them because changing the size of the list would corrupt the iterater
-        deletes = []
-
-        # iterate through the pending list searching for the given Shown...
-        for n, (shown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if shown in showns:
-                if isinstance(showable, ActiveShowable):
-                    # decrement the active pending count, if the showable is active
-                    self.activepending -= 1
-                
-                # allow showable to be unloaded
-                showable.unrequireLoaded()
-                
-                # append the index to the deletion list
-                deletes.append(n)
+        for shown in showns:
+            # skip Showns that are not (or no longer) on the pending list
+            if shown not in self.pending:
+                continue
+
+            # remove it from the pending list
+            xshown, showable, x, y = self.pending.remove(shown)
+
+            if isinstance(showable, ActiveShowable):
+                # decrement the active pending count, if the showable is active
+                self.activepending -= 1
 
-        # reverse the deletion list so that we delete from later in the list first
-        # this way, the indices for the remaining items to be deleted are still correct
-        deletes.reverse()
+            # allow showable to be unloaded
+            showable.unrequireLoaded()
 
-        # iterate through the deletion list...
-        for n in deletes:
-            # ...deleting as we go
-            del self.pending[n]
+            self.generation += 1
     def getPosition(self, shown):
         """
         Return the position of the Shown on the screen.
         """
-        # iterate through the pending list searching for the shown provided...
-        for xshown, showable, x, y in self.pending:
-            # when we find it...
-            if xshown is shown:
-                # ...return its position
-                return x, y
+        # look up the shown provided (raises ValueError if it is not there)
+        xshown, showable, x, y = self.pending.get(shown)
 
-        # if we never found it, raise an exception
-        raise ValueError, "Shown not present."
+        # ...return its position
+        return x, y
     def replace(self, shown, showable):
         """
         Replace a shown object with a new object.
         """
-        # iterate through the pending list searching for the shown provided...
-        for xshown, xshowable, x, y in self.pending:
-            # when we find it...
-            if xshown is shown:
-                # ...unshow it
-                self.unshow(shown)
+        # look up the shown provided (raises ValueError if it is not there)
+        xshown, xshowable, x, y = self.pending.get(shown)
 
-                # ...and show the new showable at the same coordinates
-                return self.show(showable, x, y)
+        # ...unshow it
+        self.unshow(shown)
 
-        # if we never found it, raise an exception
-        raise ValueError, "Shown not present."
+        # ...and show the new showable at the same coordinates
+        return self.show(showable, x, y)
     def updateScreen(self, t = None, force = False):
         """
         Change the screen output to refect all basic video elements
@@ -1687,7 +2344,8 @@ class VideoTrack(textlog.LogTrack):
         times those refreshes were requested.  
 	"""
         # update the onscreen list to match the pending list
-        self.onscreen = self.pending[:]
+        self.onscreen = self.pending.getEntries()
+        self.onscreengeneration = self.generation
 
         if self.activepending and not force:
             # if we're in activing mode (and not being forced to ignore it), then we're done
@@ -1709,15 +2367,19 @@ class VideoTrack(textlog.LogTrack):
             # if t is before the the earliest allowable time, set t to the earliest allowable time
             t = mintime
 
-        # iterate through the onscreen list...
-        for shown, showable, x, y in self.onscreen:
-            # ...showing everything in order
-            showable.show(x, y)
+        # draw everything in the onscreen list
+        drawstart = self.frameTiming.now()
+        self.drawShowables(self.onscreen, generation = self.onscreengeneration)
+        drawend = self.frameTiming.now()
 
         # update the screen at the calculated time
 	# now passes in self as a video track instance
         #r = hardware.makeVideoChanges(t,self)  
         r = hardware.makeVideoChanges(t)  
+        self.frameTiming.record(t, drawstart, drawend, hardware.getLastFlip(), r, len(self.onscreen))
+
+        # spend a little of the frame turning images loaded in the background into textures
+        hardware.uploadImages()
         
         for fnc, targs, dargs in self.do_after_update:
             # perform all waiting do_after_update calls
@@ -1761,10 +2423,18 @@ class VideoTrack(textlog.LogTrack):
         t_delta = 0.0
 
         # keep calling f until it returns a false value...
-        while f(self.last_updated, *pargs, **kwargs):
-            # after each call to f:
-            # poll for events
-            hardware.pollEvents()
+        while True:
+            paced = self.pacingMargin is not None
+            if paced:
+                # wait for the frame, then sample input for f to use
+                wake = self.sleepUntilFrame()
+                hardware.pollEvents()
+            if not f(self.last_updated, *pargs, **kwargs):
+                break
+            if not paced:
+                # after each call to f:
+                # poll for events
+                hardware.pollEvents()
 
             # calculate the earliest allowable update time, based on the minimum frame duration
             mintime = self.last_updated[0] + self.minframeduration
@@ -1776,10 +2446,10 @@ class VideoTrack(textlog.LogTrack):
                 # if the current time is earlier than the earliest allowable time, use the earliest allowable time instead
                 t = mintime
 
-            # iterate through the onscreen list...
-            for shown, showable, x, y in self.onscreen:
-                # ...showing everything in order
-                showable.show(x, y)
+            # draw everything in the onscreen list, keeping the batch
+            # open so the FPS text joins it
+            drawstart = self.frameTiming.now()
+            self.drawShowables(self.onscreen, False, self.onscreengeneration)
             
             # Show FPS
             if self.showFPS:
@@ -1795,11 +2465,19 @@ class VideoTrack(textlog.LogTrack):
                     fpsFrameCount += 1
                 if fpsText:
                     fpsText.show(0, 0)
+            hardware.endBatch()
+            drawend = self.frameTiming.now()
 
             # update the screen at the calculated time
             prev_last_updated = self.last_updated
             #self.last_updated = hardware.makeVideoChanges(t, self)
             self.last_updated = hardware.makeVideoChanges(t)
+            self.frameTiming.record(t, drawstart, drawend, hardware.getLastFlip(), self.last_updated, len(self.onscreen))
+            if paced:
+                self.noteFrameWork(wake, drawend)
+
+            # spend a little of the frame turning images loaded in the background into textures
+            hardware.uploadImages()
 
             # log the contents of the display
             self.logDisplay(self.last_updated)
@@ -1816,11 +2494,136 @@ class VideoTrack(textlog.LogTrack):
 
         # mark the end of the render loop in the log
         self.logMessage("EXITLOOP")
+    def drawShowables(self, showables, endBatch = True, generation = None):
+        """
+        Draw a list of (shown, showable, x, y) entries in order.
+
+        Batchable showables are collected into one sprite batch and
+        submitted together; any other showable flushes the batch and
+        draws immediately, so the draw order is preserved.
+
+        INPUT ARGS:
+          showables- list of (shown, showable, x, y) tuples.
+          endBatch- If False, leave the batch open so the caller can
+            add more to it before calling hardware.endBatch.
+          generation- content generation of the list.  If given and
+            every showable is retainable, an unchanged frame is
+            presented from an offscreen copy.
+        """
+        def draw():
+            for shown, showable, x, y in showables:
+                if showable.batchable:
+                    showable.show(x, y)
+                else:
+                    # draw everything queued so far, then draw this one directly
+                    hardware.endBatch()
+                    showable.show(x, y)
+                    hardware.beginBatch()
+
+        if generation is not None:
+            generation = (generation, self.contentgeneration)
+            for shown, showable, x, y in showables:
+                if not showable.retainable:
+                    # this frame may look different next time
+                    generation = None
+                    break
+
+        hardware.beginBatch()
+        hardware.drawRetained(generation, draw)
+        if endBatch:
+            hardware.endBatch()
+    def invalidate(self):
+        """
+        Note that a showable has changed how it draws, so a retained
+        copy of the previous frame can not be reused.
+        """
+        self.contentgeneration += 1
+    def setFrameHistory(self, frames):
+        """
+        Keep timing records of this many of the most recent frames
+        (10000 by default).  Records kept so far are discarded.
+        """
+        self.frameTiming = frametiming.FrameTiming(frames)
+    def getFrameTiming(self):
+        """
+        Return the timing records of the most recent frames, oldest
+        first, as a NumPy structured array with these fields (times
+        in ms):
+
+          requested    when the update was asked for
+          drawstart    drawing started
+          drawend      drawing was submitted
+          swapstart    the flip was called (after waiting for the
+                       requested time)
+          swapreturn   the flip returned
+          onset        the update timestamp
+          uncertainty  its maximum latency
+          showables    the number of showables drawn
+          dropped      refreshes skipped since the previous frame
+          missed       True if the frame was shown more than a
+                       refresh after it was asked for
+        """
+        return self.frameTiming.getFrames()
+    def getFrameSummary(self):
+        """
+        Return a dictionary summarizing the frame timing records: the
+        number of frames, missed deadlines and dropped refreshes, and
+        (p50, p95, p99, max) tuples of the draw, swap, lateness and
+        interval times (see FrameTiming.summary).
+        """
+        return self.frameTiming.summary()
+    def logFrameSummary(self):
+        """
+        Write the frame timing summary to the log.
+        """
+        s = self.frameTiming.summary()
+        self.logMessage("FS\t%d\t%d\t%d" % (s["frames"], s["missed"], s["dropped"]))
+        for name in ("draw", "swap", "lateness", "interval"):
+            if s[name] is not None:
+                self.logMessage("FT\t%s\t%.3f\t%.3f\t%.3f\t%.3f" % ((name,) + s[name]))
     def doAfterUpdate(self, f, *targs, **dargs):
         """
         """
         # append the call to the do_after_update list
         self.do_after_update.append((f, targs, dargs))
+    def setLogMode(self, mode, keyframeInterval = None):
+        """
+        Choose how updates are written to the video log.
+
+        INPUT ARGS:
+          mode- "FULL" to log every showable at every update, or
+            "DELTA" to log only what was added, removed, reordered or
+            changed since the previous update (see pyepl.vidlog for
+            the format and a reader).
+          keyframeInterval- in DELTA mode, log the whole screen every
+            this many updates.
+        """
+        if mode not in ("FULL", "DELTA"):
+            raise ValueError, "Invalid video log mode: %r" % mode
+        if keyframeInterval is not None:
+            if keyframeInterval < 1:
+                raise ValueError, "Keyframe interval must be at least 1."
+            self.keyframeInterval = keyframeInterval
+        self.logMode = mode
+        self.resetDeltaLog()
+    def resetDeltaLog(self):
+        """
+        Forget what the delta log last recorded, so the next update
+        is logged as a keyframe.
+        """
+        # number of updates logged so far
+        self.logframe = 0
+
+        # updates logged since the last keyframe (None to force a keyframe)
+        self.framesSinceKey = None
+
+        # [id, logline] by Shown for what was last logged, in draw order
+        self.logged = {}
+        self.loggedlist = None
+        self.nextlogid = 0
+
+        # content generation when the screen was last logged
+        self.loggedcontentgeneration = None
     def logDisplay(self, timestamp = None):
         """
         Log the basic video components currently displayed.
@@ -1831,6 +2634,11 @@ class VideoTrack(textlog.LogTrack):
                 # if the timestamp is not given, use the current time
                 timestamp = (timing.now(), 0L)
 
+            if self.logMode == "DELTA":
+                # only log what changed
+                self.logDisplayDelta(timestamp)
+                return
+
             # get the number of showables on screen
             t = len(self.onscreen)
 
@@ -1840,96 +2648,105 @@ class VideoTrack(textlog.LogTrack):
             for n, (showable, showable, x, y) in enumerate(self.onscreen):
                 # log each showable on the screen
                 self.logMessage("D\t%d/%d\t%d\t%d\t%s" % (n + 1, t, x, y, showable.logLine()), timestamp)
+    def logDisplayDelta(self, timestamp):
+        """
+        Log the changes to the screen since the last logged update,
+        or a keyframe with everything on it.
+        """
+        onscreen = self.onscreen
+        old = self.logged
+
+        # only ask showables for their log lines if something may have changed them
+        contentchanged = self.contentgeneration != self.loggedcontentgeneration
+
+        if self.framesSinceKey is None or self.framesSinceKey >= self.keyframeInterval:
+            # log a keyframe header, then every showable
+            self.logMessage("DK\t%d\t%d" % (self.logframe, len(onscreen)), timestamp)
+            logged = {}
+            for n, (shown, showable, x, y) in enumerate(onscreen):
+                try:
+                    id = old[shown][0]
+                except KeyError:
+                    id = self.nextlogid
+                    self.nextlogid += 1
+                line = showable.logLine()
+                logged[shown] = [id, line]
+                self.logMessage("DA\t%d\t%d\t%d\t%d\t%s" % (id, n, x, y, line), timestamp)
+            self.framesSinceKey = 0
+        else:
+            # log an update header
+            self.logMessage("DF\t%d\t%d" % (self.logframe, len(onscreen)), timestamp)
+            if onscreen is self.loggedlist:
+                # the display list has not changed
+                logged = old
+            else:
+                # keep the entries still on the screen
+                logged = {}
+                for shown, showable, x, y in onscreen:
+                    if shown in old:
+                        logged[shown] = old[shown]
+
+                # log the removals
+                for shown, showable, x, y in self.loggedlist:
+                    if shown not in logged:
+                        self.logMessage("DR\t%d" % old[shown][0], timestamp)
+
+                # log the additions at their places in the draw order
+                for n, (shown, showable, x, y) in enumerate(onscreen):
+                    if shown not in logged:
+                        id = self.nextlogid
+                        self.nextlogid += 1
+                        line = showable.logLine()
+                        logged[shown] = [id, line]
+                        self.logMessage("DA\t%d\t%d\t%d\t%d\t%s" % (id, n, x, y, line), timestamp)
+
+                # if the entries that stayed were reordered, log the whole order
+                before = [e[0] for e in self.loggedlist if e[0] in logged]
+                after = [e[0] for e in onscreen if e[0] in old]
+                if before != after:
+                    self.logMessage("DO\t%s" % ",".join([str(logged[e[0]][0]) for e in onscreen]), timestamp)
+
+            # log changed log lines
+            for shown, showable, x, y in onscreen:
+                if (contentchanged or not showable.retainable) and shown in old:
+                    line = showable.logLine()
+                    if line != logged[shown][1]:
+                        logged[shown][1] = line
+                        self.logMessage("DC\t%d\t%s" % (logged[shown][0], line), timestamp)
+            self.framesSinceKey += 1
+
+        self.logged = logged
+        self.loggedlist = onscreen
+        self.loggedcontentgeneration = self.contentgeneration
+        self.logframe += 1
     def toFront(self, shown):
         """
+        Move the Shown in front of everything else.
         """
-        # iterate through the pending list searching for the given shown...
-        for n, (xshown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if xshown is shown:
-                # remove it from the pending list
-                del self.pending[n]
-
-                # ...and append it to the end of the list
-                self.pending.append((xshown, showable, x, y))
-
-                # then return
-                return
-            
-        # if we never found a matching Shown, raise an exception
-        raise ValueError, "Shown not present."
+        # raises ValueError if the shown is not there
+        self.pending.toFront(shown)
+        self.generation += 1
     def toBack(self, shown):
         """
+        Move the Shown behind everything else.
         """
-        # iterate through the pending list searching for the given shown...
-        for n, (xshown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if xshown is shown:
-                # remove it from the pending list
-                del self.pending[n]
-
-                # ...and insert it at the beginning of the list
-                self.pending.insert(0, (xshown, showable, x, y))
-
-                # then return
-                return
-            
-        # if we never found a matching Shown, raise an exception
-        raise ValueError, "Shown not present."
+        # raises ValueError if the shown is not there
+        self.pending.toBack(shown)
+        self.generation += 1
     def putBehind(self, shown1, shown2):
         """
+        Move shown1 to be just behind shown2.
         """
-        # iterate through the pending list searching for shown2...
-        for n2, (shown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if shown is shown2:
-                # go on to the next loop
-                break
-        else:
-            # if we never found a matching Shown, raise an exception
-            raise ValueError, "Shown (#2) not present."
-
-        # iterate through the pending list searching for shown1...
-        for n1, (shown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if shown is shown1:
-                # remove it from the pending list
-                del self.pending[n1]
-
-                # ...and insert it before the position of shown2
-                self.pending.insert(n2, (shown1, showable, x, y))
-
-                # then return
-                return
-        # if we never found a matching Shown, raise an exception
-        raise ValueError, "Shown (#1) not present."
+        # raises ValueError if either shown is not there
+        self.pending.putBehind(shown1, shown2)
+        self.generation += 1
     def putInFrontOf(self, shown1, shown2):
         """
+        Move shown1 to be just in front of shown2.
         """
-        # iterate through the pending list searching for shown2...
-        for n2, (shown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if shown is shown2:
-                # go on to the next loop
-                break
-        else:
-            # if we never found a matching Shown, raise an exception
-            raise ValueError, "Shown (#2) not present."
-
-        # iterate through the pending list searching for shown1...
-        for n1, (shown, showable, x, y) in enumerate(self.pending):
-            # when we find it...
-            if shown is shown1:
-                # remove it from the pending list
-                del self.pending[n1]
-
-                # ...and insert it after the position of shown2
-                self.pending.insert(n2 + 1, (shown1, showable, x, y))
-
-                # then return
-                return
-        # if we never found a matching Shown, raise an exception
-        raise ValueError, "Shown (#1) not present."
+        # raises ValueError if either shown is not there
+        self.pending.putInFrontOf(shown1, shown2)
+        self.generation += 1
     def addUpdateCallback(self, cb):
         """
         Call cb whenever the screen is updated.
@@ -100,6 +100,42 @@ class Experiment:
     show_fps - Boolean, if True the display frames per second is shown
     in the corner of the the screen during render loops.
     DEFAULT: False
+
+    retain_frames - Boolean, if True a screen that is redrawn without
+    changes is presented from an offscreen copy instead of being
+    drawn again - DEFAULT: True
+
+    texture_budget - The number of bytes of textures (images, text,
+    movies) to allow.  Images that are not on the screen are unloaded, least
+    recently used first, to stay within it - DEFAULT: 268435456
+    (256 MB)
+
+    image_cache - Directory in which to keep images decoded and
+    scaled to their proportional sizes, so later sessions can map
+    them from disk instead of decoding and scaling the files again,
+    or None for no cache - DEFAULT: None
+
+    video_backend - "opengl" to draw in a window or on the screen, or
+    "offscreen" to draw into a software framebuffer with no display
+    at all, for running and timing experiments on headless machines -
+    DEFAULT: "opengl"
+
+    refresh_rate - The refresh rate of the display, in Hz: simulated
+    by the offscreen video backend, and the starting estimate of the
+    flip timing model otherwise - DEFAULT: 60.0
+
+    blocking_flip - Boolean, if True every flip waits (with glFinish)
+    for the swap to finish, which stalls drawing but times onsets by
+    the swap itself rather than by the refresh model - DEFAULT: False
+
+    audio_cache - Directory in which to keep sound files decoded and
+    resampled for playback, so later sessions can map them from disk
+    instead of decoding the files again, or None for no cache -
+    DEFAULT: None
+
+    audio_budget - The number of bytes of unloaded sounds to keep in
+    memory, least recently used first out, so sounds played again
+    need not be loaded again - DEFAULT: 67108864 (64 MB)
     """
     # set the default options...
     defaults = {
@@ -113,7 +149,15 @@ class Experiment:
         "use_eeg": True,
         "sync_to_vbl": True,
         "max_facet_length": 0.0,
-        "show_fps": False
+        "show_fps": False,
+        "retain_frames": True,
+        "texture_budget": 256 * 1024 * 1024,
+        "image_cache": None,
+        "video_backend": "opengl",
+        "refresh_rate": 60.0,
+        "blocking_flip": False,
+        "audio_cache": None,
+        "audio_budget": 64 * 1024 * 1024
         }
     def __init__(self, **options):
         """
@@ -225,6 +269,24 @@ class Experiment:
 			       help = "Set the maximum length, in VR units, for 3D facets.  Larger facets will be broken into smaller pieces for display.")
 	    eplopts.add_option("--show-fps", action = "store_true", default = defaults["show_fps"],
 			       dest = "show_fps", help = "Display frames per second in the corner of the screen during render loops.")
+	    eplopts.add_option("--no-retain-frames", action = "store_false", default = defaults["retain_frames"],
+			       dest = "retain_frames",
+			       help = "Redraw every frame instead of presenting unchanged screens from an offscreen copy.")
+	    eplopts.add_option("--image-cache", default = defaults["image_cache"],
+			       dest = "image_cache", metavar = "DIRECTORY",
+			       help = "Keep decoded and scaled images in DIRECTORY for later sessions.")
+	    eplopts.add_option("--offscreen", action = "store_const", const = "offscreen",
+			       default = defaults["video_backend"], dest = "video_backend",
+			       help = "Draw into an offscreen framebuffer instead of a window, with a simulated screen refresh.")
+	    eplopts.add_option("--refresh-rate", type = "float", default = defaults["refresh_rate"],
+			       dest = "refresh_rate", metavar = "HZ",
+			       help = "Set the refresh rate of the display (simulated by the offscreen framebuffer).")
+	    eplopts.add_option("--blocking-flip", action = "store_true", default = defaults["blocking_flip"],
+			       dest = "blocking_flip",
+			       help = "Wait for every buffer swap to finish instead of predicting onsets from the refresh model.")
+	    eplopts.add_option("--audio-cache", default = defaults["audio_cache"],
+			       dest = "audio_cache", metavar = "DIRECTORY",
+			       help = "Keep decoded and resampled sounds in DIRECTORY for later sessions.")
 
 	    # add the group to the optparser
 	    parser.add_option_group(eplopts)
@@ -0,0 +1,143 @@
+# PyEPL: frametiming.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module records the timing of every frame a VideoTrack draws in a
+preallocated ring buffer, so the timing of a whole session can be
+checked afterward at little cost per frame.
+
+All times are in ms on the universal clock.  Draw and swap times are
+measured with time.time() and shifted onto the universal clock, so
+they have sub-millisecond resolution.  The swap is timed from the
+flip call, after any wait for the requested time, to its return.
+"""
+
+import numpy
+import time
+
+import hardware
+
+# default number of frames kept
+DEFAULT_CAPACITY = 10000
+
+# one record per frame
+FRAME_DTYPE = numpy.dtype([("requested", numpy.float64),   # when the frame was asked for
+                           ("drawstart", numpy.float64),   # drawing started
+                           ("drawend", numpy.float64),     # drawing was submitted
+                           ("swapstart", numpy.float64),   # the flip was called
+                           ("swapreturn", numpy.float64),  # the flip returned
+                           ("onset", numpy.float64),       # the update timestamp
+                           ("uncertainty", numpy.float64), # its maximum latency
+                           ("showables", numpy.int32),     # number of showables drawn
+                           ("dropped", numpy.int32),       # refreshes skipped before it
+                           ("missed", numpy.bool_)])       # shown more than a refresh late
+
+# the percentiles summarize reports
+PERCENTILES = (50, 95, 99)
+
+class FrameTiming:
+    """
+    A ring buffer of per-frame timing records.
+    """
+    def __init__(self, capacity = DEFAULT_CAPACITY):
+        """
+        Create FrameTiming.
+
+        INPUT ARGS:
+          capacity- the number of most recent frames to keep.
+        """
+        self.frames = numpy.zeros(capacity, FRAME_DTYPE)
+
+        # offset from time.time() (in ms) to the universal clock
+        self.offset = hardware.universal_time() - time.time() * 1000.0
+        self.clear()
+    def clear(self):
+        """
+        Forget all recorded frames.
+        """
+        # index of the next record and the number of frames recorded
+        self.next = 0
+        self.count = 0
+        self.lastonset = None
+        self.lastswap = None
+    def now(self):
+        """
+        Return the time in ms on the universal clock, as a float.
+        """
+        return time.time() * 1000.0 + self.offset
+    def record(self, requested, drawstart, drawend, flip, timestamp, showables):
+        """
+        Record a frame.
+
+        INPUT ARGS:
+          requested- the time the update was asked for.
+          drawstart, drawend- times from now().
+          flip- the (start, end) of the flip from hardware.getLastFlip
+                (on the time.time clock).
+          timestamp- the (onset, uncertainty) timestamp of the update.
+          showables- the number of showables drawn.
+        """
+        swapstart = flip[0] + self.offset
+        swapreturn = flip[1] + self.offset
+        period = hardware.getRefreshStats()["period"]
+        onset = timestamp[0]
+
+        # refreshes skipped between back to back frames
+        dropped = 0
+        if self.lastonset is not None and drawstart - self.lastswap < period:
+            dropped = max(int(round((onset - self.lastonset) / period)) - 1, 0)
+
+        f = self.frames[self.next]
+        f["requested"] = requested
+        f["drawstart"] = drawstart
+        f["drawend"] = drawend
+        f["swapstart"] = swapstart
+        f["swapreturn"] = swapreturn
+        f["onset"] = onset
+        f["uncertainty"] = timestamp[1]
+        f["showables"] = showables
+        f["dropped"] = dropped
+        # (late as the refresh model counts it)
+        f["missed"] = onset > requested + period
+
+        self.next = (self.next + 1) % len(self.frames)
+        self.count += 1
+        self.lastonset = onset
+        self.lastswap = swapreturn
+    def getFrames(self):
+        """
+        Return the recorded frames, oldest first, as a NumPy structured
+        array (see FRAME_DTYPE).  If no more than capacity frames have
+        been recorded this is a view of the buffer, otherwise a copy.
+        """
+        if self.count <= len(self.frames):
+            return self.frames[:self.count]
+        return numpy.concatenate((self.frames[self.next:], self.frames[:self.next]))
+    def summary(self):
+        """
+        Return a dictionary summarizing the recorded frames: frames
+        (the number recorded), kept (the number still in the buffer),
+        missed, dropped, and (p50, p95, p99, max) tuples of the draw,
+        swap, lateness (onset minus requested time) and interval
+        (between successive onsets) times.
+        """
+        frames = self.getFrames()
+        d = {"frames": self.count,
+             "kept": len(frames),
+             "missed": int(frames["missed"].sum()),
+             "dropped": int(frames["dropped"].sum())}
+        for name, values in (("draw", frames["drawend"] - frames["drawstart"]),
+                             ("swap", frames["swapreturn"] - frames["swapstart"]),
+                             ("lateness", frames["onset"] - frames["requested"]),
+                             ("interval", numpy.diff(frames["onset"]))):
+            if len(values):
+                d[name] = tuple([numpy.percentile(values, p) for p in PERCENTILES]) + (values.max(),)
+            else:
+                d[name] = None
+        return d
@@ -26,11 +26,15 @@ import sound
 
 import pygame
 import sys
+import os
 
 modules = [timing, keyboard, mouse, joystick, graphics, eventpoll, vr, eeg, sound]
 
 def initialize(**options):
     global modules
+    if options.get("video_backend", "opengl") == "offscreen":
+        # the offscreen video backend needs no real display
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
     pygame.init()
     pygame.mixer.quit()
     for m in modules:
@@ -76,7 +80,22 @@ getFullscreen = graphics.getFullscreen
 getResolution = graphics.getResolution
 setVideoCaption = graphics.setVideoCaption
 clearScreen = graphics.clearScreen
+beginBatch = graphics.beginBatch
+flushBatch = graphics.flushBatch
+endBatch = graphics.endBatch
+drawRetained = graphics.drawRetained
+loadImageAsync = graphics.loadImageAsync
+uploadImages = graphics.uploadImages
+setTextureBudget = graphics.setTextureBudget
+getTextureStats = graphics.getTextureStats
+setImageCache = graphics.setImageCache
+getFramebuffer = graphics.getFramebuffer
+calibrateRefresh = graphics.calibrateRefresh
+getRefreshStats = graphics.getRefreshStats
+isFramePaced = graphics.isFramePaced
+nextRefresh = graphics.nextRefresh
 makeVideoChanges = graphics.makeVideoChanges
+getLastFlip = graphics.getLastFlip
 startVideo = graphics.startVideo
 stopVideo = graphics.stopVideo
 setGammaRamp = graphics.setGammaRamp
@@ -102,6 +121,9 @@ else:
 # Sound Features
 EPLSound = sound.EPLSound
 SoundFile = sound.SoundFile
+setAudioCache = sound.setAudioCache
+setAudioBudget = sound.setAudioBudget
+getAudioCacheStats = sound.getAudioCacheStats
 
 # VR Features
 
@@ -17,24 +17,53 @@ from OpenGL.GL import *
 import os
 
 import time
+import math
+import numpy
 
 import pyepl
 import pyepl.hardware.eventpoll
 import pyepl.hardware.timing
 from image import LowImage
-from font import LowFont
+from composite import RenderTarget
+import image
+from font import LowFont, LowText
+from layout import TextLayout
 import screensync
+import batch
+import retain
+import composite
+import loader
+import residency
+import imagecache
+import software
+import vblank
 
 pyepldir = os.path.abspath(os.path.dirname(pyepl.__file__))
 
+# the model of the display's refresh used to predict onsets
+refreshModel = vblank.RefreshModel()
+
+# (start, end) of the last flip, in ms on the time.time clock
+lastFlip = (0.0, 0.0)
+
 def initialize(**options):
     """
     Do anything that needs to happen before 2D graphics output can
     happen.
     """
     global init_options
+    global refreshModel
     init_options = options
 
+    # set the texture memory budget
+    residency.manager.setBudget(init_options.get("texture_budget", residency.DEFAULT_BUDGET))
+
+    # set where scaled images are cached
+    imagecache.setDirectory(init_options.get("image_cache"))
+
+    # start the flip timing model at the nominal refresh rate
+    refreshModel = vblank.RefreshModel(init_options.get("refresh_rate", 60.0))
+
     # see if set the linux screen sync
     platform = os.uname()[0]
     if platform =='Linux': 
@@ -57,6 +86,8 @@ def toggleFullscreen():
     global fullscreen
     fullscreen = not fullscreen
     pygame.display.toggle_fullscreen()
+    retain.invalidate()
+    composite.invalidate()
 
 def getFullscreen():
     """
@@ -95,6 +126,11 @@ def clearScreen(color):
     except IndexError:
         alpha = 255
     if alpha == 255:
+        # anything queued so far must be drawn before it is cleared
+        batch.flush()
+        if software.active:
+            software.clear(color)
+            return
         glClearColor(color[0] / 255.0, color[1] / 255.0, color[2] / 255.0, alpha / 255.0)
         glClear(GL_COLOR_BUFFER_BIT)
     else:
@@ -105,6 +141,143 @@ def clearScreen(color):
             lastclearcolor = color
         lastclearimage.show(0, 0)
 
+def beginBatch():
+    """
+    Start collecting LowImage draws into a single batch, so the
+    projection is set up once and quads sharing a texture are drawn
+    together.  Nothing is drawn until flushBatch or endBatch.
+    """
+    batch.begin(*getResolution())
+
+def flushBatch():
+    """
+    Draw everything batched so far, but keep batching.
+    """
+    batch.flush()
+
+def endBatch():
+    """
+    Draw everything batched so far and return to drawing immediately.
+    """
+    batch.end()
+
+def loadImageAsync(filename, size = None):
+    """
+    Start decoding an image file on a background thread, optionally
+    scaled to an (x, y) pixel size.  Returns a LoadJob: its isReady
+    method says whether the LowImages have been made, and its finish
+    method returns the (unscaled, scaled) LowImages, waiting if
+    necessary.
+    """
+    return loader.load(filename, size)
+
+def uploadImages(budget = None):
+    """
+    Spend up to budget seconds (default loader.UPLOAD_BUDGET) turning
+    decoded images into textures, then unload idle images if textures
+    made since (for text, say) went over the texture budget.  Call
+    this once per frame.
+    """
+    r = loader.uploadReady(budget)
+    residency.manager.enforceBudget()
+    return r
+
+def setTextureBudget(nbytes):
+    """
+    Set how many bytes of textures (images, text, movies and so on)
+    may exist.  Images that are not on the screen are unloaded, least
+    recently used first, to stay within it.
+    """
+    residency.manager.setBudget(nbytes)
+
+def getTextureStats():
+    """
+    Return a dictionary of texture residency statistics: budget,
+    bytes, textures, inuse, idle, hits, misses and evictions.
+    """
+    return residency.manager.getStats()
+
+def getFramebuffer():
+    """
+    Return a copy of what has been drawn for the next frame (the
+    back buffer) as a (height, width, 3) uint8 array, top row first.
+    """
+    if software.active:
+        return software.snapshot()
+    w, h = getResolution()
+    glReadBuffer(GL_BACK)
+    glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+    try:
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, w, h, GL_RGB, GL_UNSIGNED_BYTE)
+    finally:
+        glPopClientAttrib()
+    if isinstance(pixels, str):
+        pixels = numpy.fromstring(pixels, numpy.uint8)
+    # OpenGL's first row is the bottom one
+    return numpy.asarray(pixels, numpy.uint8).reshape((h, w, 3))[::-1].copy()
+
+def calibrateRefresh(frames = 60):
+    """
+    Fit the refresh model by flipping frames times, each time waiting
+    for the swap to finish (which shows the current back buffer
+    repeatedly).  Returns the model's statistics.
+    """
+    if software.active or not init_options["sync_to_vbl"]:
+        return getRefreshStats()
+    for i in xrange(frames):
+        start, end = timedFlip(True)
+        refreshModel.observe(end)
+    return getRefreshStats()
+
+def getRefreshStats():
+    """
+    Return a dictionary of the refresh model: period (ms), rate (Hz),
+    locked, uncertainty (ms), and counts of frames, dropped frames
+    and late frames.
+    """
+    return refreshModel.getStats()
+
+def nextRefresh():
+    """
+    Return the predicted time (in ms on the universal clock) of the
+    next refresh.  If flips are not synced to the refresh, or the
+    model has not seen a flip yet, this is the current time.
+    """
+    now = pyepl.hardware.timing.universal_time()
+    if software.active:
+        return software.clock.nextRefresh(now)
+    if not init_options["sync_to_vbl"]:
+        return now
+    t = time.time() * 1000.0
+    return now + refreshModel.nextRefresh(t) - t
+
+def isFramePaced():
+    """
+    Return True if each flip waits for a refresh (or simulated
+    refresh), so consecutive flips show one frame each.
+    """
+    return software.active or init_options["sync_to_vbl"]
+
+def setImageCache(directory):
+    """
+    Keep decoded and scaled images in directory, so later sessions
+    need not decode and scale them again.  None turns the cache off.
+    """
+    imagecache.setDirectory(directory)
+
+def drawRetained(generation, drawfunc):
+    """
+    Draw a frame by calling drawfunc, unless generation identifies
+    the frame retained from an earlier call, in which case the
+    retained copy is blitted instead.  A generation of None means the
+    frame can not be retained.
+    """
+    if generation is None or not init_options.get("retain_frames", True) or software.active:
+        drawfunc()
+    else:
+        retain.draw(generation, drawfunc, *getResolution())
+
 # thresh is set to 250 microseconds because tests have shown that a
 # non-blocking flip takes less than that.  It will be necessary to
 # test this more.  Keep in mind that if it does block, but takes less
@@ -142,10 +315,7 @@ def doMultiFlips(vTrack):
 	#w, h = pygame.display.get_surface().get_size()
         
 	# draw everything to back buffer
-	# iterate through the onscreen pending list...
-        for shown, showable, x, y in vTrack.pending:
-            # ...showing everything in order
-            showable.show(x, y)
+        vTrack.drawShowables(vTrack.pending, generation = vTrack.generation)
 	
 	# flip until blocked
 	starttime = time.time()
@@ -200,29 +370,78 @@ def doBlockingFlip():
     # for drawing, ergo buffer swap in sync with start of VBL has happened.
     glFinish()
 
+def timedFlip(blocking):
+    """
+    Flip (with doBlockingFlip if blocking is True) and return a
+    2-tuple of the times, in ms on the time.time clock, at which the
+    flip was called and returned.
+    """
+    global lastFlip
+    start = time.time()
+    if blocking:
+        doBlockingFlip()
+    else:
+        pygame.display.flip()
+    lastFlip = (start * 1000.0, time.time() * 1000.0)
+    return lastFlip
+
+def softwareFlip():
+    """
+    Wait for the offscreen backend's next simulated refresh, noting
+    when the wait started and ended, and return the refresh time.
+    """
+    global lastFlip
+    start = time.time()
+    onset = software.flip()
+    lastFlip = (start * 1000.0, time.time() * 1000.0)
+    return onset
+
+def getLastFlip():
+    """
+    Return a 2-tuple of the times, in ms on the time.time clock, at
+    which the last flip made by makeVideoChanges was called and
+    returned (after any wait for the requested time).
+    """
+    return lastFlip
+
 # vTrack has to be optional because the clock is currently optional.
 #def makeVideoChanges(t = None, vTrack=None):
-def makeVideoChanges(t = None):
+def makeVideoChanges(t = None, blocking = None):
     """
     At time t, update the screen to reflect all prior changes.
     Returns a timestamp indicating when the update actually happened.
+    When syncing to the vertical retrace, this is the onset predicted
+    by the refresh model and its uncertainty (both in ms).  If
+    blocking is given, it overrides the blocking_flip option for this
+    flip.
     """
     # See if syncing or not
-    if init_options["sync_to_vbl"]:
-	# Call the multiple flip saving the timestamp
-	#tempstamp = pyepl.hardware.timing.timedCall(t, doMultiFlips, vTrack)[0]
-	tempstamp = pyepl.hardware.timing.timedCall(t, doBlockingFlip)[0]
-	# return adjusted time based on the blocking
-        timestamp = (tempstamp[0]+tempstamp[1]-1,1)
-        # timestamp = tempstamp  # for debugging to see latencies
+    if software.active:
+        # wait for the simulated refresh, which is exactly when the frame appears
+        onset = pyepl.hardware.timing.timedCall(t, softwareFlip)[1]
+        timestamp = (onset, 0)
+    elif init_options["sync_to_vbl"]:
+        # only wait for the swap to finish (stalling the pipeline) if asked to
+        if blocking is None:
+            blocking = init_options.get("blocking_flip", False)
+        tempstamp, (start, end) = pyepl.hardware.timing.timedCall(t, timedFlip, blocking)
+
+        # the model works on the time.time clock; convert to and from
+        # the universal clock using the time the call started
+        requested = None
+        if t is not None:
+            requested = start + (t - tempstamp[0])
+        onset, uncertainty = refreshModel.flipped(start, end, blocking, requested)
+        timestamp = (long(round(tempstamp[0] + onset - start)), long(math.ceil(uncertainty)))
     else:
 	# Just call single flip
-	timestamp = pyepl.hardware.timing.timedCall(t, pygame.display.flip)[0]
+	timestamp = pyepl.hardware.timing.timedCall(t, timedFlip, False)[0]
 
     return timestamp
 
-def startVideo():
+def openGLWindow():
     """
+    Open the OpenGL window (or screen).
     """
     global init_options
     global fullscreen
@@ -243,6 +462,22 @@ def startVideo():
     if platform == 'Linux':
 	pygame.display.set_mode(init_options["resolution"], flags)
     
+    # find out whether textures can be uploaded without padding
+    image.checkTextureSupport()
+
+def startVideo():
+    """
+    """
+    global init_options
+    global fullscreen
+    if init_options.get("video_backend", "opengl") == "offscreen":
+        # draw into a software framebuffer on the dummy display
+        fullscreen = False
+        pygame.display.set_mode(init_options["resolution"])
+        software.start(init_options.get("refresh_rate", 60.0))
+    else:
+        openGLWindow()
+
     pygame.display.set_caption("PyEPL VideoTrack")
     
     # hide the mouse pointer
@@ -0,0 +1,219 @@
+# PyEPL: hardware/graphics/batch.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module collects the textured quads drawn during a frame so they
+can be handed to OpenGL in a few vertex array calls.
+"""
+
+from OpenGL.GL import *
+import numpy
+import software
+
+# the batch currently collecting quads (None when drawing immediately)
+active = None
+
+# blend state of quads whose texture has premultiplied alpha
+PREMULTIPLIED = "premultiplied"
+
+# (x, y, width, height) of the screen region being drawn into an
+# offscreen target (None when drawing to the window)
+region = None
+
+class SpriteBatch:
+    """
+    Accumulates textured quads for one frame.  Consecutive quads that
+    share a texture and blend state are merged into a single draw
+    call, so draw order is always preserved.
+    """
+    def __init__(self, xres, yres):
+        """
+        Create an empty batch for a window of the given resolution.
+        """
+        self.xres = xres
+        self.yres = yres
+        self.clear()
+    def clear(self):
+        """
+        Forget all queued quads.
+        """
+        # flat lists of per-vertex data (4 vertices per quad)
+        self.vertices = []
+        self.texcoords = []
+        self.colors = []
+
+        # list of [(texid, blend), first vertex, vertex count] runs
+        self.runs = []
+
+        # objects owning the queued textures, kept alive until drawn
+        self.owners = []
+    def __len__(self):
+        """
+        Return the number of queued quads.
+        """
+        return len(self.vertices) / 8
+    def add(self, texid, rect, texrect, color = (1.0, 1.0, 1.0, 1.0), blend = True, owner = None):
+        """
+        Queue a quad.
+
+        INPUT ARGS:
+          texid- OpenGL texture name to draw from.
+          rect- (x0, y0, x1, y1) screen rectangle in pixels.
+          texrect- (s0, t0, s1, t1) texture coordinates.
+          color- RGBA vertex color (0.0 to 1.0) modulating the texture.
+          blend- Whether to alpha blend the quad, or PREMULTIPLIED
+                 to blend a texture with premultiplied alpha.
+          owner- Object that must stay alive until the quad is drawn.
+        """
+        x0, y0, x1, y1 = rect
+        s0, t0, s1, t1 = texrect
+        self.vertices.extend((x0, y0, x1, y0, x1, y1, x0, y1))
+        self.texcoords.extend((s0, t0, s1, t0, s1, t1, s0, t1))
+        self.colors.extend(tuple(color) * 4)
+        if owner is not None:
+            self.owners.append(owner)
+
+        # extend the last run if it uses the same state, otherwise start a new one
+        key = (texid, blend)
+        if self.runs and self.runs[-1][0] == key:
+            self.runs[-1][2] += 4
+        else:
+            self.runs.append([key, len(self.vertices) / 2 - 4, 4])
+    def addSprite(self, sprite, x, y):
+        """
+        Queue an OGLSprite at its original size with its upper left
+        corner at x, y.
+        """
+        w, h = sprite.srcsize
+        self.add(sprite.texid,
+                 (x, y, x + w - 1, y + h - 1),
+                 (0.0, 0.0, sprite.coords[0], sprite.coords[1]),
+                 blend = sprite.blend, owner = sprite)
+    def flush(self):
+        """
+        Draw all queued quads and empty the batch.
+        """
+        if not self.runs:
+            return
+        if software.active:
+            self.flushSoftware()
+            return
+
+        vertices = numpy.array(self.vertices, dtype = numpy.float32)
+        texcoords = numpy.array(self.texcoords, dtype = numpy.float32)
+        colors = numpy.array(self.colors, dtype = numpy.float32)
+
+        # set up the orthographic projection once for the whole batch
+        if region is None:
+            x0, y0, w, h = 0, 0, self.xres, self.yres
+        else:
+            x0, y0, w, h = region
+        glViewport(0, 0, w, h)
+        glPushAttrib(GL_ENABLE_BIT)
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_CULL_FACE)
+        glEnable(GL_TEXTURE_2D)
+        self.blendFunc()
+
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        if region is None:
+            glOrtho(0.0, w, h, 0.0, 0.0, 1.0)
+        else:
+            # the region's top row becomes the target's first row, the
+            # way image textures are stored
+            glOrtho(x0, x0 + w, y0, y0 + h, 0.0, 1.0)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, vertices)
+        glTexCoordPointer(2, GL_FLOAT, 0, texcoords)
+        glColorPointer(4, GL_FLOAT, 0, colors)
+
+        # one draw call per run of quads sharing a texture and blend state
+        for (texid, blend), first, count in self.runs:
+            glBindTexture(GL_TEXTURE_2D, texid)
+            if blend:
+                glEnable(GL_BLEND)
+            else:
+                glDisable(GL_BLEND)
+            if blend == PREMULTIPLIED:
+                glBlendFunc(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+                glDrawArrays(GL_QUADS, first, count)
+                self.blendFunc()
+            else:
+                glDrawArrays(GL_QUADS, first, count)
+
+        # put OpenGL back the way we found it
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopMatrix()
+        glPopClientAttrib()
+        glPopAttrib()
+        glColor4f(1, 1, 1, 1)
+
+        self.clear()
+    def blendFunc(self):
+        """
+        Set the blend function for ordinary quads.
+        """
+        if region is None:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        else:
+            # keep the target's alpha right where quads overlap, which
+            # leaves its colors premultiplied
+            glBlendFuncSeparate(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+
+    def flushSoftware(self):
+        """
+        Blit all queued quads into the offscreen framebuffer and empty
+        the batch.
+        """
+        v = self.vertices
+        tc = self.texcoords
+        for (texid, blend), first, count in self.runs:
+            for k in range(first, first + count, 4):
+                # the first and third vertices are opposite corners
+                rect = (v[2 * k], v[2 * k + 1], v[2 * k + 4], v[2 * k + 5])
+                texrect = (tc[2 * k], tc[2 * k + 1], tc[2 * k + 4], tc[2 * k + 5])
+                color = self.colors[4 * k:4 * k + 4]
+                software.drawQuad(texid, rect, texrect, color, blend)
+        self.clear()
+
+def begin(xres, yres):
+    """
+    Start collecting quads.  Nested calls share the outer batch.
+    """
+    global active
+    if active is None:
+        active = SpriteBatch(xres, yres)
+
+def flush():
+    """
+    Draw everything queued so far, but keep collecting.
+    """
+    if active is not None:
+        active.flush()
+
+def end():
+    """
+    Draw everything queued and return to immediate drawing.
+    """
+    global active
+    if active is not None:
+        b = active
+        active = None
+        b.flush()
@@ -0,0 +1,195 @@
+# PyEPL: hardware/graphics/composite.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module provides render targets: offscreen textures that a group
+of showables is drawn into once, so the group can then be drawn as a
+single quad.
+"""
+
+import pygame
+from pygame.locals import *
+from OpenGL.GL import *
+
+import batch
+import image
+import residency
+import retain
+import software
+
+try:
+    from OpenGL.GL.EXT.framebuffer_object import *
+except ImportError:
+    pass
+
+# incremented whenever the contents of render targets may have been
+# lost (when the window is recreated)
+epoch = 0
+
+def invalidate():
+    """
+    Note that every render target must be drawn into again.
+    """
+    global epoch
+    epoch += 1
+
+def available():
+    """
+    Return True if render targets can be made.
+    """
+    return software.active or retain.available()
+
+class RenderTarget:
+    """
+    An offscreen RGBA texture covering a region of the screen.
+    """
+    def __init__(self, width, height):
+        """
+        Create RenderTarget.
+
+        INPUT ARGS:
+          width, height- size of the region in pixels.
+        """
+        self.size = (width, height)
+        self.fbo = None
+        self.texid = None
+
+        # epoch of the contents (None until captured)
+        self.epoch = None
+
+        if software.active:
+            # the target is a surface the offscreen backend draws into
+            self.surf = pygame.Surface(self.size, SRCALPHA, 32)
+            self.texid = software.genTexture(self.surf)
+            self.texsize = self.size
+            return
+
+        if image.npot:
+            w2, h2 = width, height
+        else:
+            # texture dimensions are powers of two
+            w2 = 1
+            h2 = 1
+            while w2 < width: w2 <<= 1
+            while h2 < height: h2 <<= 1
+        self.texsize = (w2, h2)
+
+        self.texid = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texid)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w2, h2, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        residency.manager.allocated(w2 * h2 * 4)
+
+        # (targets may be made while drawing into another framebuffer)
+        oldfbo = glGetIntegerv(GL_FRAMEBUFFER_BINDING_EXT)
+        self.fbo = glGenFramebuffersEXT(1)
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbo)
+        glFramebufferTexture2DEXT(GL_FRAMEBUFFER_EXT, GL_COLOR_ATTACHMENT0_EXT, GL_TEXTURE_2D, self.texid, 0)
+        status = glCheckFramebufferStatusEXT(GL_FRAMEBUFFER_EXT)
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, oldfbo)
+        if status != GL_FRAMEBUFFER_COMPLETE_EXT:
+            self.release()
+            raise RuntimeError, "Incomplete offscreen framebuffer (status 0x%x)" % status
+    def __del__(self):
+        """
+        """
+        self.release()
+    def release(self):
+        """
+        Free the framebuffer and texture.
+        """
+        if self.fbo is not None:
+            glDeleteFramebuffersEXT(1, [self.fbo])
+            self.fbo = None
+            glDeleteTextures([self.texid])
+            self.texid = None
+            residency.manager.freed(self.texsize[0] * self.texsize[1] * 4)
+        elif self.texid is not None:
+            software.deleteTexture(self.texid)
+            self.texid = None
+    def isCurrent(self):
+        """
+        Return True if the contents have been captured and not lost.
+        """
+        return self.epoch == epoch
+    def capture(self, x, y, drawfunc):
+        """
+        Call drawfunc with drawing redirected into the target, whose
+        upper left corner is at x, y on the screen.  drawfunc must
+        draw only batchable showables.
+        """
+        w, h = self.size
+
+        # anything already queued belongs where it was going
+        batch.flush()
+        oldregion = batch.region
+        if software.active:
+            oldframebuffer = software.framebuffer
+            oldorigin = software.origin
+            software.framebuffer = self.surf
+            software.origin = (x, y)
+            try:
+                self.surf.fill((0, 0, 0, 0))
+                self.drawBatched(drawfunc)
+            finally:
+                software.framebuffer = oldframebuffer
+                software.origin = oldorigin
+        else:
+            # (a retained frame may be being captured)
+            oldfbo = glGetIntegerv(GL_FRAMEBUFFER_BINDING_EXT)
+            glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbo)
+            batch.region = (x, y, w, h)
+            try:
+                glViewport(0, 0, w, h)
+                glClearColor(0.0, 0.0, 0.0, 0.0)
+                glClear(GL_COLOR_BUFFER_BIT)
+                self.drawBatched(drawfunc)
+            finally:
+                batch.region = oldregion
+                glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, oldfbo)
+        self.epoch = epoch
+    def drawBatched(self, drawfunc):
+        """
+        Call drawfunc with a sprite batch collecting its quads, and
+        draw them.
+        """
+        nested = batch.active is not None
+        batch.begin(*self.size)
+        try:
+            drawfunc()
+        finally:
+            if nested:
+                batch.flush()
+            else:
+                batch.end()
+    def show(self, x, y):
+        """
+        Draw the target with its upper left corner at x, y.
+        """
+        w, h = self.size
+        w2, h2 = self.texsize
+        rect = (x, y, x + w, y + h)
+        texrect = (0.0, 0.0, float(w) / w2, float(h) / h2)
+        if software.active:
+            blend = True
+        else:
+            blend = batch.PREMULTIPLIED
+        if batch.active is not None:
+            batch.active.add(self.texid, rect, texrect, blend = blend, owner = self)
+        else:
+            b = batch.SpriteBatch(*pygame.display.get_surface().get_size())
+            b.add(self.texid, rect, texrect, blend = blend, owner = self)
+            b.flush()
+    def getByteSize(self):
+        """
+        Return the number of bytes of the texture.
+        """
+        w2, h2 = self.texsize
+        return w2 * h2 * 4
@@ -14,8 +14,227 @@ Low level font access.
 import pygame
 import pygame.surfarray
 from pygame.locals import *
+from OpenGL.GL import *
 import image
+import batch
+import software
+import layout
+import residency
 import numpy
+import pyepl.lrucache
+
+def dropAtlas(key, value):
+    """
+    Called when textCache evicts an entry.  When a GlyphAtlas goes, the
+    glyph layouts drawn from it go too, so its pages can be freed once
+    no LowText uses them.
+    """
+    if key[0] == "atlas":
+        for k in textCache.keys():
+            if k[0] == "glyphs" and k[2:] == key[1:]:
+                textCache.remove(k)
+
+# rendered text shared by every LowFont: LowImages from write, GlyphAtlas
+# objects (by the bytes of their texture pages) and glyph layouts from
+# writeGlyphs, least recently used first out
+textCache = pyepl.lrucache.LRUCache(64 * 1024 * 1024, dropAtlas)
+
+def getAtlas(filename, size):
+    """
+    Return the GlyphAtlas for a font file at a point size, creating it
+    the first time it is needed (or again after it was evicted).
+    """
+    key = ("atlas", filename, size)
+    a = textCache.get(key)
+    if a is None:
+        a = GlyphAtlas(filename, size)
+        textCache.put(key, a, a.getByteSize())
+    return a
+
+def accountAtlas(atlas):
+    """
+    Update the bytes textCache accounts for an atlas after glyphs were
+    added to it, since that may have started new pages.
+    """
+    key = ("atlas", atlas.filename, atlas.size)
+    nbytes = atlas.getByteSize()
+    if key in textCache and textCache.sizeOf(key) != nbytes:
+        textCache.put(key, atlas, nbytes)
+
+class GlyphAtlas:
+    """
+    Texture pages holding every glyph used so far for one font file at
+    one point size.  Each glyph is rasterized in white once; text is
+    then drawn as textured quads tinted by their vertex color.
+    """
+    def __init__(self, filename, size, texsize = 512):
+        """
+        Create GlyphAtlas.
+        """
+        self.filename = filename
+        self.size = size
+        self.font = pygame.font.Font(filename, size)
+        self.height = self.font.get_height()
+        self.metrics = layout.getMetrics(filename, size)
+
+        # make sure a page can hold a few rows of glyphs
+        self.texsize = texsize
+        while self.texsize < self.height * 4:
+            self.texsize <<= 1
+
+        # glyph info by character: (texid, width, height, texrect)
+        self.glyphs = {}
+
+        # texture ids of the pages, the last one being filled
+        self.pages = []
+        self.newPage()
+    def __del__(self):
+        """
+        """
+        try:
+            if software.active:
+                for texid in self.pages:
+                    software.deleteTexture(texid)
+            else:
+                glDeleteTextures(self.pages)
+                for texid in self.pages:
+                    residency.manager.freed(self.texsize * self.texsize * 4)
+        except (NameError, AttributeError):
+            pass
+    def newPage(self):
+        """
+        Start a new, empty texture page.
+        """
+        if software.active:
+            page = pygame.Surface((self.texsize, self.texsize), SRCALPHA, 32)
+            page.fill((0, 0, 0, 0))
+            self.pages.append(software.genTexture(page))
+        else:
+            texid = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, texid)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.texsize, self.texsize, 0,
+                         GL_RGBA, GL_UNSIGNED_BYTE, "\0" * (self.texsize * self.texsize * 4))
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            self.pages.append(texid)
+            residency.manager.allocated(self.texsize * self.texsize * 4)
+
+        # the packing position (glyphs are packed in rows)
+        self.penx = 0
+        self.peny = 0
+        self.rowheight = 0
+    def getByteSize(self):
+        """
+        Return the number of bytes used by the texture pages.
+        """
+        return len(self.pages) * self.texsize * self.texsize * 4
+    def getGlyph(self, char):
+        """
+        Return (texid, width, height, texrect) for a character,
+        rasterizing it into the atlas if it is not there yet.
+        """
+        try:
+            return self.glyphs[char]
+        except KeyError:
+            pass
+        surf = self.font.render(char, True, (255, 255, 255))
+        w, h = surf.get_size()
+        if w == 0:
+            # nothing to draw, but keep the advance
+            g = (None, 0, h, None)
+            self.glyphs[char] = g
+            return g
+
+        # move to the next row, or the next page, if the glyph doesn't fit
+        # (glyphs are separated by a pixel so filtering doesn't bleed)
+        if self.penx + w > self.texsize:
+            self.penx = 0
+            self.peny += self.rowheight + 1
+            self.rowheight = 0
+        if self.peny + h > self.texsize:
+            self.newPage()
+
+        texid = self.pages[-1]
+        if software.active:
+            # copy the glyph's alpha too, rather than blending it
+            surf.set_alpha(None)
+            software.textures[texid].blit(surf, (self.penx, self.peny))
+        else:
+            glBindTexture(GL_TEXTURE_2D, texid)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, self.penx, self.peny, w, h,
+                            GL_RGBA, GL_UNSIGNED_BYTE, pygame.image.tostring(surf, "RGBA", 0))
+        ts = float(self.texsize)
+        g = (texid, w, h, (self.penx / ts, self.peny / ts, (self.penx + w) / ts, (self.peny + h) / ts))
+        self.glyphs[char] = g
+
+        self.penx += w + 1
+        self.rowheight = max(self.rowheight, h)
+        return g
+    def prepare(self, text):
+        """
+        Make sure every character of text is in the atlas.
+        """
+        for char in text:
+            self.getGlyph(char)
+    def layout(self, text):
+        """
+        Lay out a line of text left to right, applying the font's
+        kerning.  Returns a 2-tuple of the list of glyph quads, (texid,
+        rect, texrect), and the x, y size of the line.
+        """
+        quads = []
+        pen = 0
+        prev = None
+        for char in text:
+            if prev is not None:
+                pen += self.metrics.kern(prev, char)
+            prev = char
+            texid, w, h, texrect = self.getGlyph(char)
+            if texid is not None:
+                quads.append((texid, (pen, 0, pen + w, h), texrect))
+            pen += w
+        return quads, (pen, self.height)
+
+class LowText:
+    """
+    A line of text laid out as quads from a GlyphAtlas.  Changing the
+    color only changes the vertex color; nothing is re-rendered.
+    """
+    def __init__(self, atlas, layout, color):
+        """
+        Create LowText from a layout returned by GlyphAtlas.layout.
+        """
+        self.atlas = atlas
+        self.quads, self.size = layout
+        self.setColor(color)
+    def setColor(self, color):
+        """
+        Set the RGB or RGBA color (components from 0.0 to 1.0).
+        """
+        if len(color) == 3:
+            color = tuple(color) + (1.0,)
+        self.color = tuple(color)
+    def getSize(self):
+        """
+        Return an x, y tuple for the text dimensions.
+        """
+        return self.size
+    def addTo(self, b, x, y):
+        """
+        Queue the glyph quads in SpriteBatch b at x, y.
+        """
+        for texid, (x0, y0, x1, y1), texrect in self.quads:
+            b.add(texid, (x + x0, y + y0, x + x1, y + y1), texrect, self.color, owner = self.atlas)
+    def show(self, x, y):
+        """
+        """
+        if batch.active is not None:
+            # queue the quads to be drawn when the frame's batch is flushed
+            self.addTo(batch.active, x, y)
+        else:
+            b = batch.SpriteBatch(*pygame.display.get_surface().get_size())
+            self.addTo(b, x, y)
+            b.flush()
 
 class LowFont:
     """
@@ -38,6 +257,11 @@ class LowFont:
         """
         Render string text onto new LowImage with point size size.
         """
+        # reuse an identical rendering if there is one
+        key = ("texture", text, self.filename, size, tuple(color))
+        r = textCache.get(key)
+        if r is not None:
+            return r
         self.setSize(size)
         img = self.font.render(text, True, (255, 255, 255))#.convert_alpha() for El Capitan
         if len(color) == 4 and color[3] != 1.0:
@@ -50,7 +274,28 @@ class LowFont:
         pixels[:, :, 1] = int(color[1] * 255)
         pixels[:, :, 2] = int(color[2] * 255)
         del pixels
-        return image.LowImage(img)
+        r = image.LowImage(img)
+        textCache.put(key, r, r.getByteSize())
+        return r
+    def writeGlyphs(self, text, size, color):
+        """
+        Lay out string text with point size size as a LowText drawn
+        from the shared glyph atlas for this font and size.
+        """
+        atlas = getAtlas(self.filename, size)
+
+        # layouts don't depend on color, so they are shared across
+        # colors; one made from an atlas that has since been evicted
+        # refers to its pages, so it is made again
+        key = ("glyphs", text, self.filename, size)
+        cached = textCache.get(key)
+        if cached is not None and cached[0] is atlas:
+            layout = cached[1]
+        else:
+            layout = atlas.layout(text)
+            accountAtlas(atlas)
+            textCache.put(key, (atlas, layout), 64 * (len(layout[0]) + 1))
+        return LowText(atlas, layout, color)
     def getSize(self, text, size):
         """
         Return a 2-tuple of the x, y pixel size of text rendered in
@@ -58,3 +303,21 @@ class LowFont:
         """
         self.setSize(size)
         return self.font.size(text)
+    def getMetrics(self, size):
+        """
+        Return the cached FontMetrics for this font at point size size.
+        """
+        return layout.getMetrics(self.filename, size)
+    def layout(self, text, size, width = None, align = "LEFT"):
+        """
+        Return a TextLayout of text at point size size, word wrapped
+        to width pixels if width is given, with lines aligned "LEFT",
+        "RIGHT" or "CENTER".  Layouts are cached, so laying out the
+        same text again is free.
+        """
+        key = ("layout", text, self.filename, size, width, align)
+        r = textCache.get(key)
+        if r is None:
+            r = layout.layoutText(self.getMetrics(size), text, width, align)
+            textCache.put(key, r, len(text) + 64 * (len(r) + 1))
+        return r
@@ -22,8 +22,19 @@ except:
     print "Warning: OpenGL.GLU did not import correctly."
     GLU = None
 
+try:
+    from OpenGL.GL.ARB.vertex_buffer_object import *
+    from OpenGL.GL.ARB.pixel_buffer_object import *
+except ImportError:
+    glInitPixelBufferObjectARB = None
+
 import pyepl.exceptions
 import pyepl.hardware.graphics
+import batch
+import software
+import residency
+import numpy
+import sys
 
 # Image operations:
 op_nop = 0
@@ -169,45 +180,230 @@ class Color:
         """
         return "(%f, %f, %f, %f)" % (self.red / 255.0, self.green / 255.0, self.blue / 255.0, self.alpha / 255.0)
 
+# True if textures may have any dimensions (set by checkTextureSupport)
+npot = False
+
+def checkTextureSupport():
+    """
+    See whether the OpenGL context supports non-power-of-two
+    textures.  Must be called once the window has been created.
+    """
+    global npot
+    try:
+        version = glGetString(GL_VERSION)
+        extensions = glGetString(GL_EXTENSIONS)
+    except:
+        npot = False
+        return npot
+    try:
+        major = int(version.split(".")[0])
+    except ValueError:
+        major = 1
+    npot = major >= 2 or "GL_ARB_texture_non_power_of_two" in extensions.split()
+    return npot
+
+def directFormat(surf):
+    """
+    If a surface's pixels can be handed to glTexImage2D as they are,
+    return a 3-tuple of the OpenGL pixel format, internal format and
+    unpack alignment for them.  Otherwise (no non-power-of-two
+    textures, paletted pixels, color keys, unusual masks or row
+    padding) return None.  This does not touch OpenGL, so it may be
+    called from any thread.
+    """
+    if not npot:
+        return None
+    return pixelFormat(surf)
+
+def pixelFormat(surf):
+    """
+    Like directFormat, but without regard to the surface's
+    dimensions, for copying its pixels into part of an existing
+    texture.
+    """
+    bpp = surf.get_bytesize()
+    if bpp not in (3, 4) or surf.get_colorkey() is not None:
+        return None
+    hasalpha = surf.get_flags() & SRCALPHA
+    if not hasalpha and surf.get_alpha() is not None:
+        # per-surface alpha would be lost
+        return None
+
+    # find which byte of each pixel holds each channel
+    order = []
+    for mask in surf.get_masks()[:3]:
+        for i in range(bpp):
+            if mask == 0xff << (8 * i):
+                break
+        else:
+            return None
+        if sys.byteorder == "big":
+            i = bpp - 1 - i
+        order.append(i)
+    if order == [0, 1, 2]:
+        if bpp == 3:
+            fmt = GL_RGB
+        else:
+            fmt = GL_RGBA
+    elif order == [2, 1, 0]:
+        if bpp == 3:
+            fmt = GL_BGR
+        else:
+            fmt = GL_BGRA
+    else:
+        return None
+    if hasalpha:
+        # alpha must be the fourth byte
+        if sys.byteorder == "big":
+            amask = 0xff
+        else:
+            amask = 0xff << 24
+        if bpp != 4 or surf.get_masks()[3] != amask:
+            return None
+        internal = GL_RGBA
+    else:
+        # any fourth byte is padding, so the texture is opaque
+        internal = GL_RGB
+
+    # rows must be padded no more than an unpack alignment allows
+    rowbytes = surf.get_width() * bpp
+    pitch = surf.get_pitch()
+    for alignment in (1, 2, 4, 8):
+        if pitch == (rowbytes + alignment - 1) / alignment * alignment:
+            return fmt, internal, alignment
+    return None
+
+def uploadDirect(surf, fmt, level = 0):
+    """
+    Upload a surface's pixels, without copying them, as the bound
+    texture.  fmt is the result of directFormat(surf).
+    """
+    pixelformat, internal, alignment = fmt
+    w, h = surf.get_size()
+
+    # view the surface's own pixel buffer (this locks the surface until released)
+    buf = surf.get_buffer()
+    pixels = numpy.frombuffer(buf, numpy.uint8)
+    glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+    try:
+        glPixelStorei(GL_UNPACK_ALIGNMENT, alignment)
+        glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+        glTexImage2D(GL_TEXTURE_2D, level, internal, w, h, 0, pixelformat, GL_UNSIGNED_BYTE, pixels)
+    finally:
+        glPopClientAttrib()
+        del pixels
+        del buf
+
+def textureData(surf):
+    """
+    Return a 3-tuple of the RGBA string of a surface padded to
+    power-of-two dimensions, and those dimensions.  This does not
+    touch OpenGL, so it may be called from any thread.
+    """
+    w, h = surf.get_width(), surf.get_height()
+    w2, h2 = 1, 1
+    while w2 < w: w2 <<= 1
+    while h2 < h: h2 <<= 1
+
+    img = pygame.Surface((w2, h2), SRCALPHA, 32)
+    
+    img.blit(surf, (0,0))
+    return pygame.image.tostring(img, "RGBA", 0), w2, h2
+
+def surfacePixels(surf, fmt):
+    """
+    Return a 3-tuple of a uint8 array of a surface's pixels, their
+    OpenGL pixel format and their unpack alignment.  fmt is the
+    result of pixelFormat(surf): if it is None the pixels are copied
+    to RGBA, otherwise the array views the surface's own pixel buffer
+    (which locks the surface until the array is released).
+    """
+    if fmt is None:
+        return numpy.fromstring(pygame.image.tostring(surf, "RGBA", 0), numpy.uint8), GL_RGBA, 1
+    pixelformat, internal, alignment = fmt
+    return numpy.frombuffer(surf.get_buffer(), numpy.uint8), pixelformat, alignment
+
+def subImage(size, pixelformat, alignment, pixels):
+    """
+    Copy pixels of the given (w, h) size into the top left corner of
+    the bound texture.  pixels is None when they come from a bound
+    pixel unpack buffer.
+    """
+    w, h = size
+    glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+    try:
+        glPixelStorei(GL_UNPACK_ALIGNMENT, alignment)
+        glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, w, h, pixelformat, GL_UNSIGNED_BYTE, pixels)
+    finally:
+        glPopClientAttrib()
+
 class OGLSprite:
     """Implement the ugly details of "blitting" to OpenGL"""
-    def __init__(self, surf, mipmap=None):
-        """OGLSprite(self, surf, mipmap=None) -> OGLSprite
+    def __init__(self, surf, mipmap=None, data=None):
+        """OGLSprite(self, surf, mipmap=None, data=None) -> OGLSprite
         
-        Create a drawable texture out of a given surface."""
-
-        w, h = surf.get_width(), surf.get_height()
-        w2, h2 = 1, 1
-        while w2 < w: w2 <<= 1
-        while h2 < h: h2 <<= 1
+        Create a drawable texture out of a given surface.  data may
+        be the surface's textureData, if it was prepared already.
 
-        img = pygame.Surface((w2, h2), SRCALPHA, 32)
-        
-        img.blit(surf, (0,0))
-        rgba = pygame.image.tostring(img, "RGBA", 0)
+        If non-power-of-two textures are supported and the surface's
+        pixel format allows it, the texture is made straight from the
+        surface's pixels; otherwise they are copied into a padded
+        power-of-two RGBA buffer first."""
 
         #assign a texture
-        texid = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texid)
+        self.texid = glGenTextures(1)
+        self.mipmap = mipmap
+        self.blend = True
+        self.nbytes = 0
+        self.allocate(surf, data)
+        residency.manager.allocated(self.nbytes)
+    def allocate(self, surf, data=None):
+        """allocate(self, surf, data=None) -> None
+
+        (Re)create the texture's storage from a surface."""
+        w, h = surf.get_width(), surf.get_height()
+        glBindTexture(GL_TEXTURE_2D, self.texid)
 
-        if mipmap:
+        fmt = None
+        if data is None and not self.mipmap:
+            fmt = directFormat(surf)
+        if fmt:
+            # no padding and no copies
+            uploadDirect(surf, fmt)
+            w2, h2 = w, h
+            internal = fmt[1]
+        elif self.mipmap:
+            if data is None:
+                data = textureData(surf)
+            rgba, w2, h2 = data
             if not GLU:
                 raise NotImplementedError("OGLSprite mipmaps require OpenGL.GLU")
             #build MIPMAP levels. Ths is another slow bit            
             gluBuild2DMipmaps(GL_TEXTURE_2D, GL_RGBA, w2, h2, GL_RGBA, GL_UNSIGNED_BYTE, rgba)
             glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
             glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+            internal = GL_RGBA
         else:
+            if data is None:
+                data = textureData(surf)
+            rgba, w2, h2 = data
             glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w2, h2, 0, GL_RGBA, GL_UNSIGNED_BYTE, rgba)
+            internal = GL_RGBA
 
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)  
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR) 
 
-        self.mipmap = mipmap
+        self.internal = internal
         self.srcsize = w, h
         self.texsize = w2, h2
         self.coords = float(w)/w2, float(h)/h2
-        self.texid = texid
+
+        # account the storage (a reallocation only changes its size)
+        nbytes = w2 * h2 * 4
+        if self.nbytes:
+            residency.manager.resized(nbytes - self.nbytes)
+        self.nbytes = nbytes
     def __del__(self):
         """
         """
@@ -215,39 +411,49 @@ class OGLSprite:
             glDeleteTextures([self.texid])
         except NameError:
             pyepl.exceptions.eplWarn("glDeleteTextures function not present.")
+        # (the module may be gone at exit)
+        if residency:
+            residency.manager.freed(self.nbytes)
+    def updateFormat(self, surf):
+        """updateFormat(self, surf) -> tuple or None or False
+
+        Return how a surface's pixels can be copied into the existing
+        texture: its pixelFormat, None if they must be converted to
+        RGBA first, or False if the texture must be reallocated."""
+        w, h = surf.get_width(), surf.get_height()
+        w2, h2 = self.texsize
+        if w > w2 or h > h2:
+            return False
+        fmt = pixelFormat(surf)
+        if fmt and fmt[1] == self.internal:
+            return fmt
+        if self.internal == GL_RGBA:
+            return None
+        # an opaque texture cannot take pixels with alpha
+        return False
     def update(self, surf):
         """update(self, surf) -> None
-        """
+
+        Replace the texture's pixels with a surface's.  The storage is
+        reused if the surface fits in it."""
         if self.mipmap:
             raise TypeError("Cannot update a mipmap enabled OGLSprite")
 
-        w, h = surf.get_width(), surf.get_height()
-        w2, h2 = 1, 1
-        while w2 < w: w2 <<= 1
-        while h2 < h: h2 <<= 1
-
-        img = pygame.Surface((w2, h2), SRCALPHA, surf)
-        img.blit(surf, (0,0))
-        rgba = pygame.image.tostring(img, "RGBA", 0)
+        fmt = self.updateFormat(surf)
+        if fmt is False:
+            self.allocate(surf)
+            return
 
+        w, h = surf.get_width(), surf.get_height()
+        w2, h2 = self.texsize
         glBindTexture(GL_TEXTURE_2D, self.texid)
-        if 'glTexSubImage2D' in dir() and w2 <= self.texsize[0] and h2 <= self.texsize[1]:
-
-            # untested; i suspect it doesn't work
-            w2, h2 = self.texsize
-            glTexSubImage2D(GL_TEXTURE_RECTANGLE_EXT, 0,
-                0, 0, w2, h2, GL_RGBA, GL_UNSIGNED_BYTE, rgba);
-            if (w, h) != self.srcsize:
-                self.coords = float(w)/w2, float(h)/h2
-        else:
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA,
-                w2, h2, 0, GL_RGBA, GL_UNSIGNED_BYTE, rgba)
-            self.coords = float(w)/w2, float(h)/h2
-            self.texsize = w2, h2
-
+        pixels, pixelformat, alignment = surfacePixels(surf, fmt)
+        try:
+            subImage((w, h), pixelformat, alignment, pixels)
+        finally:
+            del pixels
         self.srcsize = w, h
-
-        #print "TEX", self.srcsize, self.texsize, self.coords
+        self.coords = float(w)/w2, float(h)/h2
     def blit_at(self, *rects):
         """blit_at(self, *rects) -> self
 
@@ -321,14 +527,119 @@ class OGLSprite:
         """get_height(self) -> int"""
         return self.srcsize[1]
 
+def pixelBuffersAvailable():
+    """
+    Return True if pixel buffer objects are supported.
+    """
+    return glInitPixelBufferObjectARB is not None and bool(glInitPixelBufferObjectARB())
+
+class StreamingSprite(OGLSprite):
+    """
+    An OGLSprite for pixels that change every frame, such as a
+    movie's.  The texture storage is allocated once and each update
+    copies the new pixels into it in place.  Where pixel buffer
+    objects are supported, updates alternate between two of them, so
+    copying one frame does not wait for the driver to finish
+    transferring the last.
+    """
+    def __init__(self, surf):
+        """StreamingSprite(self, surf) -> StreamingSprite"""
+        OGLSprite.__init__(self, surf)
+        if pixelBuffersAvailable():
+            self.pbos = list(glGenBuffersARB(2))
+        else:
+            self.pbos = None
+        self.nextpbo = 0
+    def __del__(self):
+        """
+        """
+        try:
+            if self.pbos:
+                glDeleteBuffersARB(len(self.pbos), self.pbos)
+        except NameError:
+            pyepl.exceptions.eplWarn("glDeleteBuffersARB function not present.")
+        OGLSprite.__del__(self)
+    def update(self, surf):
+        """update(self, surf) -> None
+
+        Copy a new frame into the texture."""
+        fmt = self.updateFormat(surf)
+        if fmt is False or not self.pbos:
+            OGLSprite.update(self, surf)
+            return
+
+        w, h = surf.get_width(), surf.get_height()
+        w2, h2 = self.texsize
+        pbo = self.pbos[self.nextpbo]
+        self.nextpbo = 1 - self.nextpbo
+
+        pixels, pixelformat, alignment = surfacePixels(surf, fmt)
+        glBindBufferARB(GL_PIXEL_UNPACK_BUFFER_ARB, pbo)
+        try:
+            # orphan the old contents so the driver need not wait for them
+            glBufferDataARB(GL_PIXEL_UNPACK_BUFFER_ARB, pixels.nbytes, None, GL_STREAM_DRAW_ARB)
+            glBufferSubDataARB(GL_PIXEL_UNPACK_BUFFER_ARB, 0, pixels.nbytes, pixels)
+            del pixels
+            glBindTexture(GL_TEXTURE_2D, self.texid)
+            subImage((w, h), pixelformat, alignment, None)
+        finally:
+            glBindBufferARB(GL_PIXEL_UNPACK_BUFFER_ARB, 0)
+        self.srcsize = w, h
+        self.coords = float(w)/w2, float(h)/h2
+
+def arraySurface(a):
+    """
+    Return a (height, width, 4) uint8 RGBA array of the pixels of a
+    (height, width), (height, width, 3) or (height, width, 4) array
+    of values from 0 to 255, and a Surface sharing its memory.  An
+    array that is already C contiguous RGBA uint8 is used as it is.
+    """
+    a = numpy.asarray(a)
+    if a.ndim == 2:
+        # gray levels
+        a = a[:, :, numpy.newaxis].repeat(3, 2)
+    if a.ndim != 3 or a.shape[2] not in (3, 4):
+        raise ValueError, "Pixel arrays must be (height, width[, 3 or 4]), not %r." % (a.shape,)
+    h, w = a.shape[:2]
+    if a.dtype == numpy.uint8 and a.shape[2] == 4 and a.flags.c_contiguous:
+        rgba = a
+    else:
+        if a.dtype != numpy.uint8:
+            a = numpy.clip(numpy.round(a), 0, 255)
+        rgba = numpy.empty((h, w, 4), numpy.uint8)
+        rgba[:, :, :3] = a[:, :, :3]
+        if a.shape[2] == 4:
+            rgba[:, :, 3] = a[:, :, 3]
+        else:
+            rgba[:, :, 3] = 255
+    return rgba, pygame.image.frombuffer(rgba.data, (w, h), "RGBA")
+
+def channels(x):
+    """
+    Return the RGB values of an operand of LowImage arithmetic (a
+    LowImage, Color, array or number) as floats.
+    """
+    if isinstance(x, LowImage):
+        return x.getPixels()[:, :, :3].astype(numpy.float32)
+    if isinstance(x, Color):
+        return numpy.array((x.red, x.green, x.blue), numpy.float32)
+    return numpy.asarray(x, numpy.float32)
+
 class LowImage:
     """
     Low level representation of an image.
     """
-    def __init__(self, *args):
+    def __init__(self, *args, **dargs):
         """
-        Create LowImage.
+        Create LowImage from a Surface, an image file name, a width
+        and height, or a NumPy pixel array (see arraySurface).  If the
+        keyword argument data is given, it must be the textureData of
+        the surface argument.  If the keyword argument streaming is
+        True, the texture is a StreamingSprite, for surfaces that are
+        redrawn every frame.
         """
+        # RGBA pixel array the surface shares (made by getPixels)
+        self.pixelArray = None
         if len(args) == 2:
             self.surf = pygame.Surface(args)
         elif len(args) == 1:
@@ -337,17 +648,21 @@ class LowImage:
                 self.surf = param
             elif isinstance(param, str):
                 self.surf = pygame.image.load(param)
+            elif isinstance(param, numpy.ndarray):
+                self.pixelArray, self.surf = arraySurface(param)
             else:
                 raise ValueError, "Invalid type for LowImage constructor argument."
         else:
             raise ValueError, "Invalid number of arguments for LowImage constructor."
-        self.gl_texture = OGLSprite(self.surf)
+        if software.active:
+            # the offscreen backend draws from the surface itself
+            self.gl_texture = software.SoftwareSprite(self.surf)
+        elif dargs.get("streaming"):
+            self.gl_texture = StreamingSprite(self.surf)
+        else:
+            self.gl_texture = OGLSprite(self.surf, data = dargs.get("data"))
         self.gl_texture_dirty = False
 
-	# this next line supposedly breaks on OSX, set to none if this is the case
-        #self.surfarray = pygame.surfarray.pixels3d(self.surf)
-        # fix for the mac (breaks other stuff)
-        self.surfarray = None
     def dataString(self):
         """
         Return an RGBA string of the image data.
@@ -363,6 +678,10 @@ class LowImage:
         """
         """
         self.cleanGLTexture()
+        if batch.active is not None:
+            # queue the quad to be drawn when the frame's batch is flushed
+            batch.active.addSprite(self.gl_texture, x, y)
+            return
         self.gl_texture.enter(*pygame.display.get_surface().get_size())
         self.gl_texture.blit_at((x, y))
         self.gl_texture.exit()
@@ -371,58 +690,153 @@ class LowImage:
         """
         self.surf = self.surf.convert_alpha()
         self.surf.fill((int(r), int(g), int(b), int(a)))
+        self.pixelArray = None
+        self.gl_texture_dirty = True
+    def getPixels(self):
+        """
+        Return the pixels as a (height, width, 4) uint8 RGBA NumPy
+        array.  The first call copies them out of the surface; from
+        then on the surface uses the array's memory, so the array is
+        a view of the image.  Call changed after writing to it.
+        """
+        if self.pixelArray is None:
+            w, h = self.surf.get_size()
+            a = numpy.fromstring(pygame.image.tostring(self.surf, "RGBA"), numpy.uint8)
+            self.pixelArray, self.surf = arraySurface(a.reshape((h, w, 4)))
+        return self.pixelArray
+    def changed(self):
+        """
+        Note that the pixels were changed, so the texture is made
+        again before the image is next drawn.
+        """
         self.gl_texture_dirty = True
+    def withRGB(self, rgb):
+        """
+        Return a new LowImage with these RGB values (floats are
+        rounded and clipped) and this image's alpha.
+        """
+        a = self.getPixels()
+        r = numpy.empty(a.shape, numpy.uint8)
+        r[:, :, :3] = numpy.clip(numpy.round(rgb), 0, 255)
+        r[:, :, 3] = a[:, :, 3]
+        return LowImage(r)
+    def crop(self, x, y, w, h):
+        """
+        Return a new LowImage of the w by h pixels with their upper
+        left corner at x, y.
+        """
+        return LowImage(self.getPixels()[y:y + h, x:x + w].copy())
+    def blend(self, other, weight = 0.5):
+        """
+        Return a new LowImage mixing this image (1 - weight) with
+        other (weight), which is a LowImage or array of the same size
+        or a Color.
+        """
+        a = self.getPixels().astype(numpy.float32)
+        if isinstance(other, LowImage):
+            b = other.getPixels().astype(numpy.float32)
+        elif isinstance(other, Color):
+            b = numpy.array((other.red, other.green, other.blue, other.alpha), numpy.float32)
+        else:
+            b = numpy.asarray(other, numpy.float32)
+            if b.ndim == 3 and b.shape[2] == 3:
+                b = numpy.concatenate((b, a[:, :, 3:]), 2)
+        return LowImage(a + (b - a) * weight)
+    def alphaMask(self, mask):
+        """
+        Return a new LowImage whose alpha is this image's multiplied
+        by mask: a LowImage of the same size (whose gray level is
+        used), or a (height, width) array of values from 0.0 to 1.0
+        (floats) or 0 to 255 (integers).
+        """
+        if isinstance(mask, LowImage):
+            m = mask.getPixels()[:, :, :3].mean(2) / 255.0
+        else:
+            m = numpy.asarray(mask)
+            if m.dtype.kind in "ui":
+                m = m / 255.0
+        r = self.getPixels().copy()
+        r[:, :, 3] = numpy.clip(numpy.round(r[:, :, 3] * m), 0, 255)
+        return LowImage(r)
+    def contrast(self, factor, mean = None):
+        """
+        Return a new LowImage with the color values moved away from
+        (factor > 1) or toward (factor < 1) mean, which defaults to
+        the image's mean value.
+        """
+        rgb = channels(self)
+        if mean is None:
+            mean = rgb.mean()
+        return self.withRGB((rgb - mean) * factor + mean)
+    def phaseScramble(self, amount = 1.0, seed = None):
+        """
+        Return a new LowImage with the same amplitude spectrum but
+        with amount (0.0 to 1.0) of random phase added to each
+        frequency.  The same phase is added to each color channel, so
+        colors are kept.  seed seeds the random numbers, for a
+        repeatable result.
+        """
+        rgb = channels(self)
+        h, w = rgb.shape[:2]
+        rng = numpy.random.RandomState(seed)
+
+        # the phase spectrum of real noise is symmetric, so the
+        # scrambled image stays real
+        phase = numpy.exp(1j * amount * numpy.angle(numpy.fft.fft2(rng.rand(h, w))))
+        for c in range(3):
+            rgb[:, :, c] = numpy.fft.ifft2(numpy.fft.fft2(rgb[:, :, c]) * phase).real
+        return self.withRGB(rgb)
     def __getitem__(self, index):
         """
-        Two dimensional indexing and slicing.
+        Two dimensional (x, y) indexing and slicing.  A pixel is
+        returned as a Color, a slice as a new LowImage.
         """
-        return pygame.surfarray.make_surface(self.surfarray[index])
+        xy = self.getPixels().swapaxes(0, 1)
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) == 2 and not [i for i in index if isinstance(i, slice)]:
+            return Color(tuple(xy[index]), normtoone = False)
+
+        # keep both dimensions, so the result is an image
+        index = tuple([isinstance(i, slice) and i or slice(i, i + 1 or None) for i in index])
+        return LowImage(xy[index].swapaxes(0, 1).copy())
     def __setitem__(self, index, value):
         """
-        Index and slice assignment.
+        Index and slice assignment, of a LowImage, a Color or RGBA
+        values.
         """
+        xy = self.getPixels().swapaxes(0, 1)
         if isinstance(value, LowImage):
-            self.surfarray[index] = value.surfarray
-        else:
-            self.surfarray[index] = value
-        self.gl_texture_dirty = True
+            value = value.getPixels().swapaxes(0, 1)
+        elif isinstance(value, Color):
+            value = (value.red, value.green, value.blue, value.alpha)
+        xy[index] = value
+        self.changed()
     def __mul__(self, x):
         """
         Color multiplication.
         """
-        if isinstance(x, LowImage):
-            return pygame.surfarray.make_surface(self.surfarray * x.surfarray)
-        else:
-            return pygame.surfarray.make_surface(self.surfarray * x)
+        return self.withRGB(channels(self) * channels(x))
     def __div__(self, x):
         """
         Color division.
         """
-        if isinstance(x, LowImage):
-            return pygame.surfarray.make_surface(self.surfarray / x.surfarray)
-        else:
-            return pygame.surfarray.make_surface(self.surfarray / x)
+        return self.withRGB(channels(self) / channels(x))
     def __add__(self, x):
         """
         Color addition.
         """
-        if isinstance(x, LowImage):
-            return pygame.surfarray.make_surface(self.surfarray + x.surfarray)
-        else:
-            return pygame.surfarray.make_surface(self.surfarray + x)
+        return self.withRGB(channels(self) + channels(x))
     def __sub__(self, x):
         """
         Color subtraction.
         """
-        if isinstance(x, LowImage):
-            return pygame.surfarray.make_surface(self.surfarray - x.surfarray)
-        else:
-            return pygame.surfarray.make_surface(self.surfarray - x)
+        return self.withRGB(channels(self) - channels(x))
     def __neg__(self):
         """
         Color inversion.
         """
-        return pygame.surfarray.make_surface(-self.surfarray)
+        return self.withRGB(255 - channels(self))
     def scale(self, x, y):
         """
         Get scaled image.
@@ -433,3 +847,11 @@ class LowImage:
         Return an x, y tuple for image dimensions.
         """
         return self.surf.get_size()
+    def getByteSize(self):
+        """
+        Return the approximate number of bytes used by the image: its
+        surface plus its (padded) texture.
+        """
+        w, h = self.surf.get_size()
+        w2, h2 = self.gl_texture.texsize
+        return (w * h + w2 * h2) * 4
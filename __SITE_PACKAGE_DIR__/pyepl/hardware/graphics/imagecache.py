@@ -0,0 +1,180 @@
+# PyEPL: hardware/graphics/imagecache.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module keeps decoded and scaled images on disk, so image files
+need not be decoded and scaled again in every session.
+
+Each cached image is one file named for a hash of the source path,
+its modification time and the scaled size.  It holds a short header
+followed by the raw RGBA pixels, which are memory mapped when read.
+"""
+
+import pygame
+import os
+import struct
+import mmap
+import tempfile
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+# magic string, width and height
+HEADER = "<8sII"
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = "PYEPLRGB"
+
+# the ImageCache in use (None for no caching)
+cache = None
+
+class ImageCache:
+    """
+    A directory of scaled RGBA images.
+    """
+    def __init__(self, directory):
+        """
+        Create ImageCache.
+
+        INPUT ARGS:
+          directory- where to keep the cached images.  It is created
+                     if it does not exist.
+        """
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.hits = 0
+        self.misses = 0
+    def path(self, filename, size):
+        """
+        Return the path of the cache file for an image file scaled to
+        size, or None if the image file does not exist.
+        """
+        filename = os.path.abspath(filename)
+        try:
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            return None
+        key = "%s\0%r\0%d\0%d" % (filename, mtime, size[0], size[1])
+        return os.path.join(self.directory, sha1(key).hexdigest() + ".rgba")
+    def get(self, filename, size):
+        """
+        Return the cached Surface of an image file scaled to size, or
+        None if it is not cached.  The Surface's pixels are mapped
+        from the cache file (copy on write).
+        """
+        path = self.path(filename, size)
+        if path is None:
+            return None
+        try:
+            f = open(path, "rb")
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            header = f.read(HEADER_SIZE)
+            if len(header) != HEADER_SIZE:
+                self.misses += 1
+                return None
+            magic, w, h = struct.unpack(HEADER, header)
+            if magic != MAGIC or (w, h) != tuple(size) or \
+                   os.fstat(f.fileno()).st_size != HEADER_SIZE + w * h * 4:
+                # not one of ours, or cut short
+                self.misses += 1
+                return None
+            pixels = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_COPY)
+        finally:
+            f.close()
+        self.hits += 1
+        return pygame.image.frombuffer(buffer(pixels, HEADER_SIZE), (w, h), "RGBA")
+    def put(self, filename, size, surf):
+        """
+        Store the Surface of an image file scaled to size.
+        """
+        path = self.path(filename, size)
+        if path is None:
+            return
+        w, h = surf.get_size()
+
+        # write a temporary file and rename it, so readers never see
+        # half a file
+        fd, tmppath = tempfile.mkstemp(".tmp", "", self.directory)
+        try:
+            f = os.fdopen(fd, "wb")
+            try:
+                f.write(struct.pack(HEADER, MAGIC, w, h))
+                f.write(pygame.image.tostring(surf, "RGBA", 0))
+            finally:
+                f.close()
+            try:
+                os.rename(tmppath, path)
+            except OSError:
+                # (on Windows, when another process got there first)
+                os.remove(tmppath)
+        except:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+    def scaled(self, filename, size):
+        """
+        Return the Surface of an image file scaled to size, from the
+        cache if it is there, otherwise by decoding and scaling the
+        file and caching the result.
+        """
+        surf = self.get(filename, size)
+        if surf is None:
+            surf = pygame.transform.scale(pygame.image.load(filename), size)
+            self.put(filename, size, surf)
+        return surf
+    def contains(self, filename, size):
+        """
+        Return True if an image file scaled to size is cached.
+        """
+        path = self.path(filename, size)
+        return path is not None and os.path.exists(path)
+    def getStats(self):
+        """
+        Return a dictionary of cache statistics.
+        """
+        return {"directory": self.directory,
+                "hits": self.hits,
+                "misses": self.misses}
+
+def setDirectory(directory):
+    """
+    Cache scaled images in directory from now on, or stop caching if
+    directory is None.
+    """
+    global cache
+    if directory is None:
+        cache = None
+    elif cache is None or cache.directory != os.path.abspath(directory):
+        cache = ImageCache(directory)
+
+def scaledSurface(filename, size):
+    """
+    Return the Surface of an image file scaled to size through the
+    cache, or None if there is no cache.
+    """
+    if cache is None:
+        return None
+    return cache.scaled(filename, size)
+
+def prepare(filename, size):
+    """
+    Make sure an image file scaled to size is in the cache, without
+    keeping it in memory.  Returns True if it had to be made.
+    """
+    if cache is None:
+        raise RuntimeError, "No image cache directory has been set."
+    if cache.contains(filename, size):
+        return False
+    cache.put(filename, size, pygame.transform.scale(pygame.image.load(filename), size))
+    return True
@@ -0,0 +1,200 @@
+# PyEPL: hardware/graphics/layout.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module lays out text using cached per-character metrics.
+"""
+
+import pygame
+
+# FontMetrics objects by (font filename, point size)
+metrics = {}
+
+# maximum number of word widths remembered per FontMetrics
+MAX_WORD_WIDTHS = 10000
+
+def getMetrics(filename, size):
+    """
+    Return the FontMetrics for a font file at a point size, creating
+    it the first time it is needed.
+    """
+    try:
+        return metrics[(filename, size)]
+    except KeyError:
+        m = FontMetrics(filename, size)
+        metrics[(filename, size)] = m
+        return m
+
+class FontMetrics:
+    """
+    Character advances and kerning for one font file at one point
+    size.  Each character and each pair of characters is measured
+    once, so measuring a string afterwards is a few dictionary
+    lookups per character.
+    """
+    def __init__(self, filename, size):
+        """
+        Create FontMetrics.
+        """
+        self.font = pygame.font.Font(filename, size)
+        self.height = self.font.get_height()
+        self.advances = {}
+        self.kerning = {}
+        self.widths = {}
+    def advance(self, char):
+        """
+        Return the x advance of a single character.
+        """
+        try:
+            return self.advances[char]
+        except KeyError:
+            a = self.font.size(char)[0]
+            self.advances[char] = a
+            return a
+    def kern(self, a, b):
+        """
+        Return the adjustment to the advance when character b follows
+        character a.
+        """
+        try:
+            return self.kerning[(a, b)]
+        except KeyError:
+            k = self.font.size(a + b)[0] - self.advance(a) - self.advance(b)
+            self.kerning[(a, b)] = k
+            return k
+    def measure(self, text):
+        """
+        Return the x size of a line of text.
+        """
+        try:
+            return self.widths[text]
+        except KeyError:
+            pass
+        w = 0
+        prev = None
+        for char in text:
+            w += self.advance(char)
+            if prev is not None:
+                w += self.kern(prev, char)
+            prev = char
+        if len(self.widths) >= MAX_WORD_WIDTHS:
+            self.widths.clear()
+        self.widths[text] = w
+        return w
+    def getSize(self, text):
+        """
+        Return a 2-tuple of the x, y pixel size of a line of text.
+        """
+        return self.measure(text), self.height
+    def wrapParagraph(self, words, width):
+        """
+        Greedily break a list of words into lines no wider than width
+        (a word wider than width gets a line of its own).  Returns a
+        list of lines and a list of their widths.
+        """
+        lines = []
+        widths = []
+        space = self.advance(" ")
+        line = []
+        linewidth = 0
+        for word in words:
+            wordwidth = self.measure(word)
+            if line:
+                # the width of the line if a space and this word were added
+                w = linewidth + self.kern(line[-1][-1], " ") + space + self.kern(" ", word[0]) + wordwidth
+                if w <= width:
+                    line.append(word)
+                    linewidth = w
+                    continue
+                lines.append(" ".join(line))
+                widths.append(linewidth)
+            line = [word]
+            linewidth = wordwidth
+        if line:
+            lines.append(" ".join(line))
+            widths.append(linewidth)
+        return lines, widths
+
+class TextLayout:
+    """
+    The result of laying out a block of text: its lines, their widths,
+    and the x offset of each line for the requested alignment.
+    """
+    def __init__(self, lines, widths, lineheight, width = None, align = "LEFT"):
+        """
+        Create TextLayout.
+
+        INPUT ARGS:
+          lines- list of line strings.
+          widths- list of line widths in pixels.
+          lineheight- height of each line in pixels.
+          width- width to align within (defaults to the widest line).
+          align- "LEFT", "RIGHT" or "CENTER".
+        """
+        self.lines = lines
+        self.widths = widths
+        self.lineheight = lineheight
+        self.align = align
+        if widths:
+            maxwidth = max(widths)
+        else:
+            maxwidth = 0
+        if width is None:
+            width = maxwidth
+        self.width = width
+
+        # calculate the offset of each line within the width
+        if align == "LEFT":
+            self.offsets = [0] * len(widths)
+        elif align == "RIGHT":
+            self.offsets = [width - w for w in widths]
+        elif align == "CENTER":
+            self.offsets = [width / 2 - w / 2 for w in widths]
+        else:
+            raise ValueError, "Invalid alignment: %r" % align
+
+        self.size = (maxwidth, lineheight * len(lines))
+    def __len__(self):
+        """
+        Return the number of lines.
+        """
+        return len(self.lines)
+    def __iter__(self):
+        """
+        Iterate over (line, width, offset) 3-tuples.
+        """
+        return iter(zip(self.lines, self.widths, self.offsets))
+
+def layoutText(m, text, width = None, align = "LEFT"):
+    """
+    Lay out text with FontMetrics m and return a TextLayout.
+
+    If width is None, each newline starts a new line.  Otherwise the
+    text is word wrapped to width: paragraphs are separated by blank
+    lines, other newlines are treated as spaces, and a blank line
+    follows each paragraph.
+    """
+    if width is None:
+        lines = text.split("\n")
+        widths = [m.measure(line) for line in lines]
+        return TextLayout(lines, widths, m.height, None, align)
+
+    lines = []
+    widths = []
+    for p in text.split("\n\n"):
+        words = [word for word in p.strip().replace("\n", " ").split(" ") if word]
+        if words:
+            plines, pwidths = m.wrapParagraph(words, width)
+            lines.extend(plines)
+            widths.extend(pwidths)
+
+            # add a blank line after each paragraph
+            lines.append("")
+            widths.append(0)
+    return TextLayout(lines, widths, m.height, width, align)
@@ -0,0 +1,192 @@
+# PyEPL: hardware/graphics/loader.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module decodes image files on background threads and turns them
+into LowImages a little at a time on the main thread.
+"""
+
+import pygame
+import threading
+import Queue
+import collections
+import sys
+import time
+
+import image
+import imagecache
+
+# number of decoding threads
+WORKERS = 2
+
+# seconds of each frame that uploadReady may spend making textures
+UPLOAD_BUDGET = 0.002
+
+# jobs waiting for a worker
+jobs = Queue.Queue()
+
+# decoded jobs waiting to be uploaded, oldest first
+ready = collections.deque()
+
+# the worker threads (started when first needed)
+workers = []
+
+class LoadJob:
+    """
+    One image file to decode and upload.
+    """
+    def __init__(self, filename, size = None):
+        """
+        Create LoadJob.
+
+        INPUT ARGS:
+          filename- the image file.
+          size- optional (x, y) pixel size to scale the image to.
+        """
+        self.filename = filename
+        self.size = size
+
+        # filled in by a worker: [(surface, textureData or None), ...]
+        # for the unscaled image and (if size was given) the scaled
+        # one.  The unscaled surface is None if the scaled one came
+        # from the image cache.
+        self.decoded = None
+        self.error = None
+        self.decodedEvent = threading.Event()
+
+        # filled in by the uploader: (unscaled, scaled) LowImages
+        self.result = None
+
+        # True if nobody wants the result any more
+        self.cancelled = False
+    def decode(self):
+        """
+        Decode the file and prepare its texture data (worker thread).
+        """
+        try:
+            scaled = None
+            if self.size is not None:
+                # use the image cache, if there is one
+                scaled = imagecache.scaledSurface(self.filename, self.size)
+            if scaled is not None:
+                # (the unscaled image is loaded when it is asked for)
+                self.decoded = [(None, None), (scaled, prepare(scaled))]
+            else:
+                surf = pygame.image.load(self.filename)
+                decoded = [(surf, prepare(surf))]
+                if self.size is not None:
+                    scaled = pygame.transform.scale(surf, self.size)
+                    decoded.append((scaled, prepare(scaled)))
+                self.decoded = decoded
+        except:
+            self.error = sys.exc_info()
+        self.decodedEvent.set()
+    def isDecoded(self):
+        """
+        Return True once the worker is done with this job.
+        """
+        return self.decodedEvent.isSet()
+    def isReady(self):
+        """
+        Return True once the LowImages have been made.
+        """
+        return self.result is not None or self.error is not None
+    def upload(self):
+        """
+        Make the LowImages from the decoded data (main thread).
+        """
+        if self.result is not None or self.error is not None:
+            return
+        lows = []
+        for surf, data in self.decoded:
+            if surf is None:
+                lows.append(None)
+            else:
+                lows.append(image.LowImage(surf, data = data))
+        self.decoded = None
+        if len(lows) == 1:
+            self.result = (lows[0], lows[0])
+        else:
+            self.result = (lows[0], lows[1])
+    def finish(self):
+        """
+        Wait for the decode, upload now, and return the (unscaled,
+        scaled) LowImages.  Re-raises any decoding error.  The
+        unscaled LowImage is None if the scaled one came from the
+        image cache.
+        """
+        self.decodedEvent.wait()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        self.upload()
+        return self.result
+    def cancel(self):
+        """
+        Note that the result is no longer wanted.
+        """
+        self.cancelled = True
+
+def prepare(surf):
+    """
+    Return the padded texture data for a surface, or None if its
+    pixels can be uploaded as they are.
+    """
+    if image.directFormat(surf):
+        return None
+    return image.textureData(surf)
+
+def work():
+    """
+    Worker thread loop.
+    """
+    while True:
+        job = jobs.get()
+        if not job.cancelled:
+            job.decode()
+            ready.append(job)
+
+def startWorkers():
+    """
+    Start the worker threads if they are not running yet.
+    """
+    while len(workers) < WORKERS:
+        t = threading.Thread(target = work, name = "PyEPL image loader")
+        t.setDaemon(True)
+        t.start()
+        workers.append(t)
+
+def load(filename, size = None):
+    """
+    Queue an image file to be decoded in the background and return
+    its LoadJob.
+    """
+    startWorkers()
+    job = LoadJob(filename, size)
+    jobs.put(job)
+    return job
+
+def uploadReady(budget = None):
+    """
+    Make LowImages for decoded jobs, oldest first, until budget
+    seconds (default UPLOAD_BUDGET) have passed.  Returns the number
+    of jobs uploaded.
+    """
+    if budget is None:
+        budget = UPLOAD_BUDGET
+    start = time.time()
+    n = 0
+    while ready:
+        job = ready.popleft()
+        if job.cancelled or job.error is not None:
+            continue
+        job.upload()
+        n += 1
+        if time.time() - start >= budget:
+            break
+    return n
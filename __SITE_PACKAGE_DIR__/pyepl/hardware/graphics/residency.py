@@ -0,0 +1,151 @@
+# PyEPL: hardware/graphics/residency.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module keeps track of how much texture memory is in use and
+unloads the least recently used images when there is too much.  Every
+texture is accounted where it is made and freed, whether it belongs
+to an image file, text, a pixel array or a movie.
+"""
+
+import pyepl.lrucache
+import sys
+
+# default number of bytes of textures to keep loaded
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+class TextureResidency:
+    """
+    Accounts the bytes of every texture, and tracks texture owners
+    (objects with an unload method) that can give theirs up.  Owners
+    in use are never unloaded; idle ones are kept loaded, least
+    recently used first out, until the total goes over the budget.
+    """
+    def __init__(self, budget = DEFAULT_BUDGET):
+        """
+        Create TextureResidency.
+        """
+        self.budget = budget
+
+        # bytes of every texture that exists
+        self.bytes = 0
+        self.textures = 0
+
+        # whether each owner in use is loaded
+        self.pinned = {}
+
+        # loaded idle owners, least recently used first (the budget is
+        # enforced here rather than by the cache)
+        self.idle = pyepl.lrucache.LRUCache(sys.maxint)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def allocated(self, nbytes):
+        """
+        Note that a texture of nbytes has been made.
+        """
+        self.bytes += nbytes
+        self.textures += 1
+    def resized(self, nbytes):
+        """
+        Note that a texture's storage has grown by nbytes (which may
+        be negative).
+        """
+        self.bytes += nbytes
+    def freed(self, nbytes):
+        """
+        Note that a texture of nbytes has been deleted.
+        """
+        self.bytes -= nbytes
+        self.textures -= 1
+    def loaded(self, owner):
+        """
+        Note that owner has just loaded its textures.
+        """
+        self.misses += 1
+        if owner in self.pinned:
+            self.pinned[owner] = True
+        else:
+            self.idle.put(owner, owner, 0)
+
+        # make room, but the caller is about to use what it just loaded
+        self.enforceBudget(owner)
+    def use(self, owner):
+        """
+        Note that owner is needed (it is on the screen), so it must
+        not be unloaded.
+        """
+        if owner in self.pinned:
+            return
+        if owner in self.idle:
+            # it was still loaded from before
+            self.hits += 1
+            self.idle.remove(owner)
+            self.pinned[owner] = True
+        else:
+            self.pinned[owner] = False
+        self.enforceBudget()
+    def release(self, owner):
+        """
+        Note that owner is no longer needed.  It stays loaded until
+        the budget requires otherwise.
+        """
+        try:
+            loaded = self.pinned.pop(owner)
+        except KeyError:
+            return
+        if loaded:
+            self.idle.put(owner, owner, 0)
+        self.enforceBudget()
+    def unloaded(self, owner):
+        """
+        Note that owner has unloaded its textures.
+        """
+        if owner in self.pinned:
+            self.pinned[owner] = False
+        else:
+            self.idle.remove(owner)
+    def setBudget(self, budget):
+        """
+        Change the byte budget, unloading idle owners if necessary.
+        """
+        self.budget = budget
+        self.enforceBudget()
+    def enforceBudget(self, keep = None):
+        """
+        Unload least recently used idle owners until the total is
+        within the budget or nothing idle is left (except keep, which
+        is never unloaded).  Textures still used elsewhere (by a
+        cached text rendering, say) are only freed when the last user
+        lets go of them.
+        """
+        while self.bytes > self.budget and len(self.idle):
+            owner = self.idle.oldest()
+            if owner is keep:
+                # keep is the most recently used, so it is the only one left
+                break
+            self.idle.remove(owner)
+            self.evictions += 1
+            owner.unload()
+    def getStats(self):
+        """
+        Return a dictionary of residency statistics.
+        """
+        return {"budget": self.budget,
+                "bytes": self.bytes,
+                "textures": self.textures,
+                "inuse": len(self.pinned),
+                "idle": len(self.idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+# the residency manager for all images
+manager = TextureResidency()
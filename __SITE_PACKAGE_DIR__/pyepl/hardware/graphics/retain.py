@@ -0,0 +1,182 @@
+# PyEPL: hardware/graphics/retain.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module keeps a composite of the last unchanged frame in an
+offscreen framebuffer, so it can be presented again with one blit.
+"""
+
+from OpenGL.GL import *
+import batch
+import residency
+
+try:
+    from OpenGL.GL.EXT.framebuffer_object import *
+except ImportError:
+    glInitFramebufferObjectEXT = None
+
+# the RetainedFrame for the window (None until first needed)
+frame = None
+
+# True once offscreen framebuffers are known to be unsupported
+unavailable = False
+
+class RetainedFrame:
+    """
+    An offscreen texture holding the composite of one frame, along
+    with the content generation it was drawn from.
+    """
+    def __init__(self, xres, yres):
+        """
+        Create RetainedFrame for a window of the given resolution.
+        """
+        self.xres = xres
+        self.yres = yres
+
+        # texture dimensions are powers of two
+        w2 = 1
+        h2 = 1
+        while w2 < xres: w2 <<= 1
+        while h2 < yres: h2 <<= 1
+        self.texsize = (w2, h2)
+
+        self.texid = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texid)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w2, h2, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        residency.manager.allocated(w2 * h2 * 4)
+
+        self.fbo = glGenFramebuffersEXT(1)
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbo)
+        glFramebufferTexture2DEXT(GL_FRAMEBUFFER_EXT, GL_COLOR_ATTACHMENT0_EXT, GL_TEXTURE_2D, self.texid, 0)
+        status = glCheckFramebufferStatusEXT(GL_FRAMEBUFFER_EXT)
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE_EXT:
+            self.release()
+            raise RuntimeError, "Incomplete offscreen framebuffer (status 0x%x)" % status
+
+        # generation of the composite in the texture (None for no composite)
+        self.generation = None
+
+        # generation of the last frame drawn directly
+        self.lastgeneration = None
+
+        self.hits = 0
+        self.captures = 0
+    def release(self):
+        """
+        Free the framebuffer and texture.
+        """
+        if self.fbo is not None:
+            glDeleteFramebuffersEXT(1, [self.fbo])
+            self.fbo = None
+        if self.texid is not None:
+            glDeleteTextures([self.texid])
+            self.texid = None
+            residency.manager.freed(self.texsize[0] * self.texsize[1] * 4)
+    def invalidate(self):
+        """
+        Forget the retained composite.
+        """
+        self.generation = None
+        self.lastgeneration = None
+    def draw(self, generation, drawfunc):
+        """
+        Draw a frame whose content is identified by generation.  If it
+        is the retained composite, just blit it.  A generation seen
+        for the second time in a row is captured offscreen while it is
+        drawn, so frames that are only drawn once cost nothing extra.
+        Otherwise drawfunc is called to draw the frame directly.
+        """
+        if generation == self.generation:
+            # nothing changed, so present the composite again
+            self.hits += 1
+            self.blit()
+        elif generation == self.lastgeneration:
+            # this frame has been drawn twice now, so keep a copy
+            self.capture(drawfunc)
+            self.generation = generation
+            self.captures += 1
+            self.blit()
+        else:
+            self.lastgeneration = generation
+            drawfunc()
+    def capture(self, drawfunc):
+        """
+        Call drawfunc with drawing redirected into the offscreen
+        texture.
+        """
+        # anything already queued belongs on the screen, not in the composite
+        batch.flush()
+        glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbo)
+        try:
+            glViewport(0, 0, self.xres, self.yres)
+            glClearColor(0.0, 0.0, 0.0, 1.0)
+            glClear(GL_COLOR_BUFFER_BIT)
+            drawfunc()
+            batch.flush()
+        finally:
+            glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
+    def blit(self):
+        """
+        Draw the composite over the whole window.
+        """
+        w2, h2 = self.texsize
+
+        # the texture's first row is the bottom of the window
+        rect = (0, 0, self.xres, self.yres)
+        texrect = (0.0, float(self.yres) / h2, float(self.xres) / w2, 0.0)
+        if batch.active is not None:
+            batch.active.add(self.texid, rect, texrect, blend = False, owner = self)
+        else:
+            b = batch.SpriteBatch(self.xres, self.yres)
+            b.add(self.texid, rect, texrect, blend = False, owner = self)
+            b.flush()
+    def getStats(self):
+        """
+        Return a dictionary of retained frame statistics.
+        """
+        return {"hits": self.hits,
+                "captures": self.captures}
+
+def available():
+    """
+    Return True if offscreen framebuffers are supported.
+    """
+    return glInitFramebufferObjectEXT is not None and bool(glInitFramebufferObjectEXT())
+
+def draw(generation, drawfunc, xres, yres):
+    """
+    Draw a frame through the window's RetainedFrame, creating it when
+    first needed.  Falls back to calling drawfunc directly if
+    offscreen framebuffers are not available.
+    """
+    global frame
+    global unavailable
+    if frame is None or (frame.xres, frame.yres) != (xres, yres):
+        if unavailable:
+            drawfunc()
+            return
+        if frame is not None:
+            frame.release()
+            frame = None
+        if not available():
+            unavailable = True
+            drawfunc()
+            return
+        frame = RetainedFrame(xres, yres)
+    frame.draw(generation, drawfunc)
+
+def invalidate():
+    """
+    Forget the retained composite, if any.
+    """
+    if frame is not None:
+        frame.invalidate()
@@ -0,0 +1,223 @@
+# PyEPL: hardware/graphics/software.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module provides the offscreen video backend: instead of OpenGL,
+textures are pygame surfaces, quads are blitted into a software
+framebuffer, and flips wait for a simulated refresh clock.  It needs
+no monitor, so the video code can be run and timed on headless
+machines.
+"""
+
+import pygame
+from pygame.locals import *
+import numpy
+import time
+import residency
+
+import pyepl.hardware.timing
+
+# True while the offscreen backend is in use
+active = False
+
+# the framebuffer surface (the dummy display's, or a RenderTarget's
+# while one is being drawn into)
+framebuffer = None
+
+# screen position of the framebuffer's upper left corner
+origin = (0, 0)
+
+# texture surfaces by texture id
+textures = {}
+nextid = 1
+
+# the RefreshClock that flips wait for
+clock = None
+
+class RefreshClock:
+    """
+    A simulated display refresh at a fixed rate.
+    """
+    def __init__(self, rate):
+        """
+        Create RefreshClock.
+
+        INPUT ARGS:
+          rate- refresh rate in Hz.
+        """
+        self.period = 1000.0 / rate
+        self.origin = pyepl.hardware.timing.universal_time()
+        self.refreshes = 0
+    def nextRefresh(self, t):
+        """
+        Return the time (in ms) of the first refresh after time t.
+        """
+        n = int((t - self.origin) / self.period) + 1
+        return self.origin + n * self.period
+    def wait(self):
+        """
+        Wait for the next refresh and return its time (in ms).
+        """
+        now = pyepl.hardware.timing.universal_time()
+        t = self.nextRefresh(now)
+        time.sleep((t - now) / 1000.0)
+        self.refreshes += 1
+        return long(round(t))
+
+def start(rate):
+    """
+    Start drawing into the display surface, which must already have
+    been set up with the dummy video driver.
+    """
+    global active
+    global framebuffer
+    global clock
+    active = True
+    framebuffer = pygame.display.get_surface()
+    clock = RefreshClock(rate)
+
+def genTexture(surf):
+    """
+    Return a new texture id for a surface.
+    """
+    global nextid
+    texid = nextid
+    nextid += 1
+    textures[texid] = surf
+    w, h = surf.get_size()
+    residency.manager.allocated(w * h * 4)
+    return texid
+
+def deleteTexture(texid):
+    """
+    Forget a texture.
+    """
+    try:
+        surf = textures.pop(texid)
+    except KeyError:
+        return
+    # (the module may be gone at exit)
+    if residency:
+        w, h = surf.get_size()
+        residency.manager.freed(w * h * 4)
+
+def clear(color):
+    """
+    Fill the framebuffer with an RGB 3-tuple color (0 to 255).
+    """
+    framebuffer.fill(tuple(color[:3]))
+
+def drawQuad(texid, rect, texrect, color = (1.0, 1.0, 1.0, 1.0), blend = True):
+    """
+    Blit part of a texture into the framebuffer, as SpriteBatch.add
+    describes a quad.
+    """
+    surf = textures[texid]
+    tw, th = surf.get_size()
+    x0, y0, x1, y1 = rect
+    s0, t0, s1, t1 = texrect
+
+    # the source rectangle in pixels (texture coordinates may be flipped)
+    sx0 = int(round(min(s0, s1) * tw))
+    sy0 = int(round(min(t0, t1) * th))
+    sx1 = min(int(round(max(s0, s1) * tw)), tw)
+    sy1 = min(int(round(max(t0, t1) * th)), th)
+    if sx1 <= sx0 or sy1 <= sy0:
+        return
+    region = surf.subsurface((sx0, sy0, sx1 - sx0, sy1 - sy0))
+    if s1 < s0 or t1 < t0:
+        region = pygame.transform.flip(region, s1 < s0, t1 < t0)
+
+    # sprites are queued with inclusive corners and glyphs with
+    # exclusive ones, so only scale for a real difference in size
+    dw = int(round(x1 - x0))
+    dh = int(round(y1 - y0))
+    if dw <= 0 or dh <= 0:
+        return
+    if abs(dw - (sx1 - sx0)) > 1 or abs(dh - (sy1 - sy0)) > 1:
+        region = pygame.transform.scale(region, (dw, dh))
+
+    if tuple(color) != (1.0, 1.0, 1.0, 1.0):
+        # tint, as the vertex color does
+        region = region.convert_alpha()
+        region.fill(tuple([int(c * 255) for c in color]), special_flags = BLEND_RGBA_MULT)
+    if not blend and region.get_flags() & SRCALPHA:
+        region = region.copy()
+        region.set_alpha(None)
+    framebuffer.blit(region, (int(round(x0)) - origin[0], int(round(y0)) - origin[1]))
+
+def flip():
+    """
+    Wait for the next simulated refresh and return its time (in ms).
+    """
+    return clock.wait()
+
+def snapshot():
+    """
+    Return a copy of the framebuffer as a (height, width, 3) uint8
+    array.
+    """
+    w, h = framebuffer.get_size()
+    return numpy.fromstring(pygame.image.tostring(framebuffer, "RGB"), numpy.uint8).reshape((h, w, 3))
+
+class SoftwareSprite:
+    """
+    Stands in for an OGLSprite: the texture is the surface itself.
+    """
+    def __init__(self, surf, mipmap=None, data=None):
+        """
+        Create SoftwareSprite.
+        """
+        self.mipmap = mipmap
+        self.blend = True
+        self.texid = genTexture(surf)
+        self.update(surf)
+    def __del__(self):
+        """
+        """
+        deleteTexture(self.texid)
+    def update(self, surf):
+        """
+        Use a new surface.
+        """
+        w, h = textures[self.texid].get_size()
+        w2, h2 = surf.get_size()
+        residency.manager.resized((w2 * h2 - w * h) * 4)
+        textures[self.texid] = surf
+        self.srcsize = surf.get_size()
+        self.texsize = self.srcsize
+        self.coords = 1.0, 1.0
+    def enter(self, xres, yres):
+        """
+        Nothing to set up.
+        """
+        return self
+    def blit_at(self, *rects):
+        """
+        Draw at the supplied position(s), as OGLSprite.blit_at does.
+        """
+        for rect in rects:
+            x0, y0 = rect[0:2]
+            try:
+                x1, y1 = x0 + rect[2], y0 + rect[3]
+            except IndexError:
+                x1, y1 = x0 + self.srcsize[0] - 1, y0 + self.srcsize[1] - 1
+            drawQuad(self.texid, (x0, y0, x1, y1), (0.0, 0.0, 1.0, 1.0), blend = self.blend)
+        return self
+    def exit(self):
+        """
+        Nothing to clean up.
+        """
+        pass
+    def get_width(self):
+        """get_width(self) -> int"""
+        return self.srcsize[0]
+    def get_height(self):
+        """get_height(self) -> int"""
+        return self.srcsize[1]
@@ -0,0 +1,174 @@
+# PyEPL: hardware/graphics/vblank.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module estimates when flipped frames actually reach the screen.
+It keeps a running model of the display's refresh period and phase,
+fitted to the times at which buffer swaps return, so onsets can be
+predicted without stalling the pipeline with glFinish every frame.
+"""
+
+import math
+
+# flips returning faster than this (ms) were not held up by a refresh
+BLOCK_THRESH = 0.25
+
+# how quickly the phase and period follow new samples
+PHASE_GAIN = 0.1
+PERIOD_GAIN = 0.01
+
+# samples further than this fraction of a period from the model are
+# not used for fitting
+OUTLIER = 0.25
+
+# samples needed before the model is trusted
+MIN_SAMPLES = 10
+
+# consecutive outliers after which the phase is taken from the samples
+# again (the first sample may have been a late wakeup)
+RESEED = 3
+
+class RefreshModel:
+    """
+    A running fit of refresh times t = phase + k * period (in ms).
+    """
+    def __init__(self, rate = 60.0):
+        """
+        Create RefreshModel.
+
+        INPUT ARGS:
+          rate- the nominal refresh rate in Hz, used until the model
+                has been fitted.
+        """
+        self.period = 1000.0 / rate
+        self.phase = None
+        self.samples = 0
+        self.outliers = 0
+
+        # running mean square of the fit residuals
+        self.meansquare = 0.0
+
+        # onset of the last frame and the number of frames, dropped
+        # frames (refreshes skipped between back to back flips) and
+        # late frames (shown more than a refresh after their request)
+        self.lastonset = None
+        self.frames = 0
+        self.dropped = 0
+        self.late = 0
+        self.lastlate = False
+    def isLocked(self):
+        """
+        Return True once enough samples have been fitted.
+        """
+        return self.samples >= MIN_SAMPLES
+    def observe(self, t):
+        """
+        Fit a time (in ms) at which a refresh is known to have
+        happened.
+        """
+        if self.phase is None or self.outliers >= RESEED:
+            # start again from this sample
+            self.phase = t
+            self.samples = 1
+            self.outliers = 0
+            self.meansquare = 0.0
+            return
+        k = round((t - self.phase) / self.period)
+        residual = t - (self.phase + k * self.period)
+        if abs(residual) > OUTLIER * self.period:
+            # a late wakeup, not a refresh time, unless it keeps
+            # happening, in which case the phase is what is wrong
+            self.outliers += 1
+            return
+        self.outliers = 0
+        self.phase += PHASE_GAIN * residual
+        if k:
+            self.period += PERIOD_GAIN * residual / k
+        # keep the reference refresh close to the present, so period
+        # errors are not multiplied by large k
+        self.phase += k * self.period
+        self.meansquare += (residual * residual - self.meansquare) * PHASE_GAIN
+        self.samples += 1
+    def uncertainty(self):
+        """
+        Return the uncertainty (in ms) of predicted onsets.
+        """
+        if not self.isLocked():
+            # could be any time within a refresh
+            return self.period
+        # onsets are only known to the refresh they fall on, however
+        # well the refresh times themselves are fitted
+        return max(math.sqrt(self.meansquare), self.period / 2.0)
+    def nextRefresh(self, t):
+        """
+        Return the time of the first refresh at or after t.
+        """
+        if self.phase is None:
+            return t
+        k = math.ceil((t - self.phase) / self.period)
+        return self.phase + k * self.period
+    def nearestRefresh(self, t):
+        """
+        Return the time of the refresh nearest to t.
+        """
+        if self.phase is None:
+            return t
+        k = round((t - self.phase) / self.period)
+        return self.phase + k * self.period
+    def flipped(self, start, end, blocking, requested = None):
+        """
+        Account for a flip and return a 2-tuple of the predicted
+        onset of the frame and its uncertainty (in ms).
+
+        INPUT ARGS:
+          start, end- when the flip was called and when it returned.
+          blocking- True if the flip waited for the swap to happen,
+                    so it returned at the onset.
+          requested- (optional) when the frame was asked for.
+        """
+        if blocking:
+            # the swap happened just before the return
+            self.observe(end)
+            onset = self.nearestRefresh(end)
+        elif end - start >= BLOCK_THRESH:
+            # held up until the previous swap freed a buffer, which
+            # happens at a refresh; this frame goes out at the next one
+            self.observe(end)
+            onset = self.nearestRefresh(end) + self.period
+        else:
+            # the frame goes out at the next refresh
+            onset = self.nextRefresh(end)
+
+        # each refresh shows one frame, so a frame flipped right after
+        # another goes out at least a refresh later
+        if self.lastonset is not None:
+            onset = max(onset, self.lastonset + self.period)
+
+        # look for skipped refreshes between back to back flips
+        if self.lastonset is not None and start - self.lastonset < self.period:
+            skipped = int(round((onset - self.lastonset) / self.period)) - 1
+            if skipped > 0:
+                self.dropped += skipped
+        self.lastlate = requested is not None and onset > requested + self.period
+        if self.lastlate:
+            self.late += 1
+        self.lastonset = onset
+        self.frames += 1
+        return onset, self.uncertainty()
+    def getStats(self):
+        """
+        Return a dictionary of the model and its counts.
+        """
+        return {"period": self.period,
+                "rate": 1000.0 / self.period,
+                "locked": self.isLocked(),
+                "uncertainty": self.uncertainty(),
+                "frames": self.frames,
+                "dropped": self.dropped,
+                "late": self.late}
@@ -12,11 +12,36 @@ This package implements sound functions.
 """
 from eplSound import eplSound as EPLSound
 import soundFile as SoundFile
+import audiocache
 
 def initialize(**options):
     """
     """
-    pass
+    # set where decoded sounds are cached and how many bytes of them
+    # are kept in memory
+    audiocache.setDirectory(options.get("audio_cache"))
+    audiocache.setBudget(options.get("audio_budget", audiocache.DEFAULT_BUDGET))
+
+def setAudioCache(directory):
+    """
+    Keep decoded and resampled sounds in directory, so later sessions
+    need not decode them again.  None turns the cache off.
+    """
+    audiocache.setDirectory(directory)
+
+def setAudioBudget(budget):
+    """
+    Set the number of bytes of unloaded sounds kept in memory in case
+    they are played again.
+    """
+    audiocache.setBudget(budget)
+
+def getAudioCacheStats():
+    """
+    Return a dictionary of statistics of the decoded sounds kept in
+    memory and on disk.
+    """
+    return audiocache.getStats()
 
 def finalize():
     """
@@ -0,0 +1,211 @@
+# PyEPL: hardware/sound/audiocache.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module keeps decoded and resampled sounds, so sound files need
+not be decoded again.  Sounds that were unloaded recently are kept in
+memory, up to a byte budget, and every decoded sound can also be kept
+on disk for later sessions.
+
+Sounds are identified by a key of the source path, its modification
+time, the sample rate and channels they were converted to and any
+settings needed to read the file.  Each sound on disk is one file
+named for a hash of the key.  It holds a short header followed by the
+interleaved int16 samples, which are memory mapped when read.
+"""
+
+import numpy
+import os
+import struct
+import mmap
+import tempfile
+
+import pyepl.lrucache
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+# magic string, sample rate, channels of the source file and frames
+HEADER = "<8sIII"
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = "PYEPLPCM"
+
+# default number of bytes of unloaded sounds to keep in memory
+DEFAULT_BUDGET = 64 * 1024 * 1024
+
+# the AudioCache in use (None for no caching on disk)
+cache = None
+
+# (samples, source channels) of recently unloaded sounds by key
+recent = pyepl.lrucache.LRUCache(DEFAULT_BUDGET)
+
+def makeKey(filename, rate, channels, settings = ""):
+    """
+    Return the key of a sound file converted to rate and channels, or
+    None if the file does not exist.
+    """
+    filename = os.path.abspath(filename)
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        return None
+    return (filename, mtime, rate, channels, settings)
+
+class AudioCache:
+    """
+    A directory of decoded sounds.
+    """
+    def __init__(self, directory):
+        """
+        Create AudioCache.
+
+        INPUT ARGS:
+          directory- where to keep the cached sounds.  It is created
+                     if it does not exist.
+        """
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.hits = 0
+        self.misses = 0
+    def path(self, key):
+        """
+        Return the path of the cache file for a key.
+        """
+        return os.path.join(self.directory, sha1("%s\0%r\0%d\0%d\0%s" % key).hexdigest() + ".pcm")
+    def get(self, key):
+        """
+        Return the (samples, source channels) of a sound, or None if it
+        is not cached.  The samples are mapped from the cache file
+        (read only).
+        """
+        try:
+            f = open(self.path(key), "rb")
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            header = f.read(HEADER_SIZE)
+            if len(header) != HEADER_SIZE:
+                self.misses += 1
+                return None
+            magic, rate, channels, frames = struct.unpack(HEADER, header)
+            if magic != MAGIC or rate != key[2] or \
+                   os.fstat(f.fileno()).st_size != HEADER_SIZE + frames * key[3] * 2:
+                # not one of ours, or cut short
+                self.misses += 1
+                return None
+            samples = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+        self.hits += 1
+        return numpy.frombuffer(buffer(samples, HEADER_SIZE), numpy.int16), channels
+    def put(self, key, samples, channels):
+        """
+        Store the interleaved int16 samples of a sound, whose source
+        file had channels channels.
+        """
+        path = self.path(key)
+
+        # write a temporary file and rename it, so readers never see
+        # half a file
+        fd, tmppath = tempfile.mkstemp(".tmp", "", self.directory)
+        try:
+            f = os.fdopen(fd, "wb")
+            try:
+                f.write(struct.pack(HEADER, MAGIC, key[2], channels, len(samples) / key[3]))
+                f.write(buffer(numpy.ascontiguousarray(samples, numpy.int16)))
+            finally:
+                f.close()
+            try:
+                os.rename(tmppath, path)
+            except OSError:
+                # (on Windows, when another process got there first)
+                os.remove(tmppath)
+        except:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+    def contains(self, key):
+        """
+        Return True if a sound is cached.
+        """
+        return os.path.exists(self.path(key))
+    def getStats(self):
+        """
+        Return a dictionary of cache statistics.
+        """
+        return {"directory": self.directory,
+                "hits": self.hits,
+                "misses": self.misses}
+
+def setDirectory(directory):
+    """
+    Cache decoded sounds in directory from now on, or stop caching on
+    disk if directory is None.
+    """
+    global cache
+    if directory is None:
+        cache = None
+    elif cache is None or cache.directory != os.path.abspath(directory):
+        cache = AudioCache(directory)
+
+def setBudget(budget):
+    """
+    Set the number of bytes of unloaded sounds kept in memory.
+    """
+    recent.setBudget(budget)
+
+def recall(key):
+    """
+    Return the (samples, source channels) of a sound kept in memory or
+    cached on disk, or None if it must be decoded.  A sound kept in
+    memory is handed over, so it no longer counts against the budget.
+    """
+    if key is None:
+        return None
+    kept = recent.get(key)
+    if kept is not None:
+        recent.remove(key)
+        return kept
+    if cache is not None:
+        return cache.get(key)
+    return None
+
+def store(key, samples, channels):
+    """
+    Cache a newly decoded sound on disk, if there is a cache.
+    """
+    if key is not None and cache is not None:
+        cache.put(key, samples, channels)
+
+def keep(key, samples, channels):
+    """
+    Keep the samples of a sound that is being unloaded in memory, in
+    case it is loaded again.
+    """
+    if key is not None:
+        recent.put(key, (samples, channels), samples.nbytes)
+
+def getStats():
+    """
+    Return a dictionary of statistics of the sounds kept in memory
+    and, if there is one, the cache on disk.
+    """
+    d = {"budget": recent.budget,
+         "bytes": recent.bytes,
+         "kept": len(recent),
+         "hits": recent.hits,
+         "misses": recent.misses,
+         "evictions": recent.evictions}
+    if cache is not None:
+        d["disk"] = cache.getStats()
+    return d
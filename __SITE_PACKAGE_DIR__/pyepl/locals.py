@@ -24,7 +24,7 @@ from display import Color
 from display import Text
 from display import ABOVE, BELOW, LEFT, RIGHT, OVER, NORTH, NORTHEAST, EAST, SOUTHEAST, SOUTH, SOUTHWEST, WEST, NORTHWEST, CENTER
 from display import CompoundStimulus
-from sound import AudioClip, FileAudioClip, Beep
+from sound import AudioClip, FileAudioClip, StreamingAudioClip, Beep
 from sound import AudioTrack
 from keyboard import KeyTrack, Key
 from joystick import JoyTrack, JoyButton, JoyAxis, JoyHat, JoyBall
@@ -38,7 +38,8 @@ from mechinput import * #...
 from pyepl import initialize
 from pyepl import finalize
 from exputils import Experiment, EPLOption, PresentationClock, State
-from convenience import setRealtime, instruct, getInstructing, instructBegin, instructStep, instructEnd, instructSeenAll, waitForAnyKey, buttonChoice, micTest, flashStimulus, presentStimuli, mathDistract,recognition
+from convenience import setRealtime, instruct, getInstructing, instructBegin, instructStep, instructEnd, instructSeenAll, waitForAnyKey, buttonChoice, micTest, flashStimulus, presentStimuli, presentRSVP, mathDistract,recognition
+from rsvp import RSVPSequence
 from optparse import make_option
 from virtualtrack import VirtualTrack
 from version import checkVersion, checkVersionRange
@@ -0,0 +1,169 @@
+# PyEPL: lrucache.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module provides a least-recently-used cache with a byte budget.
+"""
+
+# indices into the links of the recency list
+PREV = 0
+NEXT = 1
+KEY = 2
+VALUE = 3
+NBYTES = 4
+
+class LRUCache:
+    """
+    A mapping from keys to values where each value has a size in
+    bytes.  When the total size goes over the budget, the least
+    recently used entries are evicted until it fits again.
+    """
+    def __init__(self, budget, onEvict = None):
+        """
+        Create LRUCache.
+
+        INPUT ARGS:
+          budget- maximum number of bytes to keep.
+          onEvict- optional callable, called as onEvict(key, value)
+            for every entry that is evicted to meet the budget.
+        """
+        self.budget = budget
+        self.onEvict = onEvict
+
+        # link lists [prev, next, key, value, nbytes] by key
+        self.links = {}
+
+        # circular recency list; root[NEXT] is the least recently used
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None, 0]
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def __len__(self):
+        """
+        Return the number of cached entries.
+        """
+        return len(self.links)
+    def __contains__(self, key):
+        """
+        Test for a key without counting a hit or miss.
+        """
+        return key in self.links
+    def get(self, key, default = None):
+        """
+        Return the value for key, marking it as most recently used, or
+        default if it is not cached.
+        """
+        try:
+            link = self.links[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.moveToEnd(link)
+        return link[VALUE]
+    def put(self, key, value, nbytes):
+        """
+        Cache value under key, accounting nbytes for it, and evict
+        older entries if the budget is exceeded.  Values larger than
+        the whole budget are not cached.
+        """
+        self.remove(key)
+        if nbytes > self.budget:
+            return
+        last = self.root[PREV]
+        link = [last, self.root, key, value, nbytes]
+        last[NEXT] = link
+        self.root[PREV] = link
+        self.links[key] = link
+        self.bytes += nbytes
+        self.enforceBudget()
+    def remove(self, key):
+        """
+        Drop key from the cache (without calling onEvict).  Returns
+        the value, or None if it was not cached.
+        """
+        try:
+            link = self.links.pop(key)
+        except KeyError:
+            return None
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+        self.bytes -= link[NBYTES]
+        return link[VALUE]
+    def clear(self):
+        """
+        Drop everything.
+        """
+        self.links = {}
+        self.root[:] = [self.root, self.root, None, None, 0]
+        self.bytes = 0
+    def setBudget(self, budget):
+        """
+        Change the byte budget, evicting entries if necessary.
+        """
+        self.budget = budget
+        self.enforceBudget()
+    def enforceBudget(self):
+        """
+        Evict least recently used entries until the budget is met.
+        """
+        while self.bytes > self.budget and self.links:
+            link = self.root[NEXT]
+            self.remove(link[KEY])
+            self.evictions += 1
+            if self.onEvict:
+                self.onEvict(link[KEY], link[VALUE])
+    def moveToEnd(self, link):
+        """
+        Make link the most recently used entry.
+        """
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+        last = self.root[PREV]
+        link[PREV] = last
+        link[NEXT] = self.root
+        last[NEXT] = link
+        self.root[PREV] = link
+    def oldest(self):
+        """
+        Return the least recently used key (without marking it used),
+        or None if the cache is empty.
+        """
+        return self.root[NEXT][KEY]
+    def sizeOf(self, key):
+        """
+        Return the bytes accounted for key, or 0 if it is not cached.
+        """
+        try:
+            return self.links[key][NBYTES]
+        except KeyError:
+            return 0
+    def keys(self):
+        """
+        Return the cached keys, least recently used first.
+        """
+        r = []
+        link = self.root[NEXT]
+        while link is not self.root:
+            r.append(link[KEY])
+            link = link[NEXT]
+        return r
+    def getStats(self):
+        """
+        Return a dictionary of cache statistics.
+        """
+        return {"entries": len(self.links),
+                "bytes": self.bytes,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
@@ -0,0 +1,367 @@
+# PyEPL: mixer.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module provides the software mixer an AudioTrack plays through.
+Any number of voices (up to a limit) each play the samples of a clip
+with their own gain and pan, and are summed block by block into the
+single stream the sound device plays.
+
+Positions are counted in frames (one sample per channel) of the mixed
+stream, so voices that overlap are aligned to the sample.
+
+A Feeder thread keeps the play buffer filled, so playback does not
+depend on the main thread getting back to pollEvents.
+"""
+
+import numpy
+import threading
+import time
+
+import timing
+
+# frames mixed at a time
+BLOCK_FRAMES = 1024
+
+# default maximum number of voices
+DEFAULT_VOICES = 16
+
+# ms the feeder thread sleeps between refills
+FEED_INTERVAL = 10
+
+class Voice:
+    """
+    One clip being played by a Mixer.
+    """
+    def __init__(self, clip, frames, gain = 1.0, pan = 0.0, loop = False):
+        """
+        Create Voice.
+
+        INPUT ARGS:
+          clip- the AudioClip played.
+          frames- its 16 bit samples, as an array of frames with a
+                  column for each channel.  A single channel is
+                  played on both.
+          gain- amplitude multiplier.
+          pan- from -1.0 (left only) through 0.0 (both channels at
+               full gain) to 1.0 (right only).
+          loop- if True, play the clip over and over until stopped.
+        """
+        self.clip = clip
+        self.frames = frames
+        self.length = len(self.frames)
+        self.loop = loop
+        self.gain = gain
+        self.pan = pan
+        self.setLevels(gain, pan)
+
+        # the mixer frame the voice starts at and the (time, latency)
+        # timestamp of its onset, set when it is started
+        self.start = None
+        self.onset = None
+        self.number = None
+    def setLevels(self, gain = None, pan = None):
+        """
+        Change the gain and/or pan.  The change is heard from the next
+        block mixed.
+        """
+        if gain is not None:
+            self.gain = gain
+        if pan is not None:
+            self.pan = pan
+        self.levels = numpy.array([self.gain * min(1.0, 1.0 - self.pan),
+                                   self.gain * min(1.0, 1.0 + self.pan)], numpy.float32)
+    def getEnd(self):
+        """
+        Return the mixer frame after the voice's last, or None if it
+        loops.
+        """
+        if self.loop:
+            return None
+        return self.start + self.length
+
+class Mixer:
+    """
+    Mixes voices into an eplSound play buffer.
+    """
+    def __init__(self, eplsound, maxVoices = DEFAULT_VOICES, blockFrames = BLOCK_FRAMES):
+        """
+        Create Mixer.
+
+        INPUT ARGS:
+          eplsound- the EPLSound to play through.
+          maxVoices- the most voices played at once; starting another
+                     stops the one started first.
+          blockFrames- frames mixed at a time.
+        """
+        self.eplsound = eplsound
+        self.maxVoices = maxVoices
+        self.blockFrames = blockFrames
+        self.channels = eplsound.NUM_CHANNELS
+        self.acc = numpy.zeros((blockFrames, 2), numpy.float32)
+
+        # held by whoever is changing the voices or the play buffer
+        self.lock = threading.RLock()
+
+        # voices still to be heard, in the order they were started
+        self.voices = []
+
+        # voices heard to their end or stopped since the last call
+        # to takeFinished
+        self.finished = []
+
+        # the next frame to be mixed
+        self.frame = 0
+        self.started = 0
+
+        # the frame that was next to be played when the device's count
+        # of frames played was last reset
+        self.base = 0
+
+        # (time, frame) of each time the play buffer ran dry with
+        # more to play, since the last call to takeUnderruns
+        self.underruns = []
+        self.underrunCount = 0
+    def bufferedFrames(self):
+        """
+        Return the number of mixed frames not yet played.
+        """
+        # getBufferUsed counts 16 bit samples (not bytes), as append
+        # and consume do
+        return self.eplsound.getBufferUsed() / self.channels
+    def clear(self):
+        """
+        Drop the mixed frames that have not been played, so mixing
+        starts again with the next frame the device plays.
+        """
+        self.eplsound.clearPlayBuffer()
+        # the device counts the frames it takes from the buffer, so
+        # after the clear this is exactly where it is (reading the
+        # buffer first would miss frames taken in between)
+        self.frame = self.base + self.eplsound.getSamplesPlayed()
+    def isActive(self):
+        """
+        Return True while there are voices to be heard.
+        """
+        return len(self.voices) > 0
+    def start(self, voice, exclusive = False):
+        """
+        Start a voice with the next frame the device plays, and return
+        the voices it displaced.
+
+        INPUT ARGS:
+          voice- the Voice.
+          exclusive- if True, stop every other voice at the same frame.
+        """
+        self.lock.acquire()
+        try:
+            return self.__start(voice, exclusive)
+        finally:
+            self.lock.release()
+    def __start(self, voice, exclusive):
+        """
+        Start a voice, with the lock held.
+        """
+        if self.bufferedFrames():
+            # take back what has been mixed but not played, so the new
+            # voice is heard at once
+            self.clear()
+        elif not self.voices:
+            self.eplsound.resetSamplesPlayed()
+            self.base = self.frame
+
+        stopped = []
+        if exclusive:
+            stopped = self.voices
+            self.voices = []
+        while len(self.voices) >= self.maxVoices:
+            stopped.append(self.voices.pop(0))
+        self.finished.extend(stopped)
+
+        self.started += 1
+        voice.number = self.started
+        voice.start = self.frame
+        self.voices.append(voice)
+        return stopped
+    def stop(self, voice = None):
+        """
+        Stop one voice, or all of them.  Mixed frames of the stopped
+        voices are dropped from the play buffer.
+        """
+        self.lock.acquire()
+        try:
+            if voice is None:
+                stopped = self.voices
+            elif voice in self.voices:
+                stopped = [voice]
+            else:
+                return
+            self.clear()
+            self.voices = [v for v in self.voices if v not in stopped]
+            self.finished.extend(stopped)
+        finally:
+            self.lock.release()
+    def takeFinished(self):
+        """
+        Return the voices that ended or were stopped since the last
+        call.
+        """
+        self.lock.acquire()
+        try:
+            finished = self.finished
+            self.finished = []
+            return finished
+        finally:
+            self.lock.release()
+    def takeUnderruns(self):
+        """
+        Return the (time, frame) of each underrun since the last call.
+        """
+        self.lock.acquire()
+        try:
+            underruns = self.underruns
+            self.underruns = []
+            return underruns
+        finally:
+            self.lock.release()
+    def pending(self):
+        """
+        Return True if some voice has frames still to be mixed.
+        """
+        for v in self.voices:
+            end = v.getEnd()
+            if end is None or end > self.frame:
+                return True
+        return False
+    def mix(self, n):
+        """
+        Return the next n frames (at most blockFrames) of the mix as
+        an int16 array of interleaved samples.
+        """
+        acc = self.acc[:n]
+        acc[:] = 0.0
+        for v in self.voices:
+            # where in the block the voice comes in, and the frame of
+            # the voice heard there
+            a = max(v.start - self.frame, 0)
+            pos = self.frame + a - v.start
+            while a < n:
+                if pos >= v.length:
+                    if not v.loop or v.length == 0:
+                        break
+                    pos %= v.length
+                m = min(n - a, v.length - pos)
+                acc[a:a + m] += v.frames[pos:pos + m] * v.levels
+                a += m
+                pos += m
+        numpy.clip(acc, -32768.0, 32767.0, acc)
+        return acc.astype(numpy.int16).ravel()
+    def fill(self, target, watch = False):
+        """
+        Mix until target frames are buffered or every voice has been
+        mixed to its end.  Voices that have been heard to their end are
+        moved to the finished list.  If watch is True, an empty play
+        buffer with more to play is counted as an underrun.
+        """
+        self.lock.acquire()
+        try:
+            self.__fill(target, watch)
+        finally:
+            self.lock.release()
+    def __fill(self, target, watch):
+        """
+        Fill the play buffer, with the lock held.
+        """
+        buffered = self.bufferedFrames()
+        if watch and buffered == 0 and self.pending():
+            self.underruns.append((timing.now(), self.frame))
+            self.underrunCount += 1
+        played = self.frame - buffered
+        for v in self.voices[:]:
+            end = v.getEnd()
+            if end is not None and end <= played:
+                self.voices.remove(v)
+                self.finished.append(v)
+
+        while self.voices and buffered < target:
+            n = min(self.blockFrames, target - buffered)
+            ends = [v.getEnd() for v in self.voices]
+            if None not in ends:
+                # nothing left after the last voice ends
+                n = min(n, max(ends) - self.frame)
+                if n <= 0:
+                    break
+            block = self.mix(n)
+            appended = self.eplsound.append(block.tostring(), len(block), 0, 1.0) / self.channels
+            self.frame += appended
+            buffered += appended
+            if appended < n:
+                # the play buffer is full
+                break
+
+class Feeder:
+    """
+    A thread that keeps a Mixer's play buffer filled to a target
+    level, whatever the main thread is doing.
+    """
+    def __init__(self, mixer, target, interval = FEED_INTERVAL):
+        """
+        Create Feeder.
+
+        INPUT ARGS:
+          mixer- the Mixer to fill from.
+          target- the number of frames to keep buffered.
+          interval- ms to sleep between refills.
+        """
+        self.mixer = mixer
+        self.target = target
+        self.interval = interval
+        self.running = False
+        self.thread = None
+
+        # set when there may be something to play
+        self.wake = threading.Event()
+    def start(self):
+        """
+        Start the thread if it is not running.
+        """
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self.run, name = "PyEPL audio feeder")
+        self.thread.setDaemon(True)
+        self.thread.start()
+    def stop(self):
+        """
+        Stop the thread and wait for it to finish.
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self.thread = None
+    def notify(self):
+        """
+        Note that a voice has been started.
+        """
+        self.wake.set()
+    def run(self):
+        """
+        Thread loop.
+        """
+        while self.running:
+            self.wake.clear()
+            if not self.mixer.isActive():
+                # nothing to do until a voice is started
+                self.wake.wait()
+                continue
+            self.mixer.fill(self.target, True)
+            # (the sleep lets the main thread run)
+            time.sleep(self.interval / 1000.0)
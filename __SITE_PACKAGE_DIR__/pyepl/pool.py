@@ -13,6 +13,7 @@ This module provides tools for manipulating collections of stimuli.
 
 import sound
 import display
+import bundle
 from exceptions import BadFileExtension
 from base import MediaFile
 import os
@@ -130,7 +131,10 @@ class Pool(list):
     def loadFromSourcePath(self, sourcepath):
         """
         """
-        if os.path.isdir(sourcepath):
+        if bundle.isBundle(sourcepath):
+            # is a stimulus bundle
+            self.loadFromBundle(sourcepath)
+        elif os.path.isdir(sourcepath):
             # is a directory, loop over files
             for stimfile in os.listdir(sourcepath):
                 # strip off filename and extension
@@ -162,6 +166,46 @@ class Pool(list):
                 textval = line.strip()
                 self.append(name = textval, content = display.Text(textval))
                 
+    def loadFromBundle(self, filename, propxsize = None, propysize = None,
+                       size = None, color = None, font = None):
+        """
+        Append the items of a stimulus bundle (see the bundle
+        module).  The bundle is mapped into memory, and each image or
+        sound is only read from it when it is loaded.
+
+        INPUT ARGS:
+          filename- the bundle file.
+          propxsize, propysize- (optional) proportional size for the
+                                images, instead of the sizes they were
+                                bundled with.
+          size, color, font- (optional) settings for the texts.
+        """
+        b = bundle.Bundle(filename)
+        i = 0
+        for name, kind, attrs, pos, length, info in b:
+            d = self.append(PoolDict(attrs))
+            if not name is None:
+                d.name = name
+            if kind == "image":
+                if propxsize is None or propysize is None:
+                    d.content = bundle.BundleImage(b, i, info[2], info[3])
+                else:
+                    d.content = bundle.BundleImage(b, i, propxsize, propysize)
+            elif kind == "sound":
+                d.content = bundle.BundleAudioClip(b, i)
+            elif kind == "text":
+                d.content = display.Text(b.text(i), size = size, color = color, font = font)
+            elif kind == "lines":
+                d.content = TextPool(b.text(i).split("\n"), size, color, font)
+            i += 1
+    def saveBundle(self, filename):
+        """
+        Write the pool to a stimulus bundle file, which can be loaded
+        much faster than the original files.  Images, sounds and texts
+        are stored decoded, along with every other attribute (which
+        must be picklable).
+        """
+        bundle.writeBundle(filename, self)
     def append(self, actualpooldict = None, **items):
         """
         Append a pooldir to a pool, returning the new one.
@@ -399,7 +443,12 @@ class ImagePool(Pool):
     def loadFromSourcePath(self, sourcepath, xscale, yscale):
         """
         """
-        if os.path.isdir(sourcepath):
+        if bundle.isBundle(sourcepath):
+            if xscale or yscale:
+                self.loadFromBundle(sourcepath, xscale or yscale, yscale or xscale)
+            else:
+                self.loadFromBundle(sourcepath)
+        elif os.path.isdir(sourcepath):
             for stimfile in os.listdir(sourcepath):
                 name, ext = os.path.splitext(stimfile)
                 ext = ext.lower()
@@ -425,6 +474,28 @@ class ImagePool(Pool):
                     raise BadFileExtension, ext
         else:
             raise ValueError("Directory %s not found." % sourcepath)
+    def prepareCache(self, yres = None):
+        """
+        Make sure every image in the pool, scaled to its proportional
+        size, is in the image cache (see hardware.setImageCache), so
+        loading them later needs no decoding or scaling.
+
+        INPUT ARGS:
+          yres- (optional) vertical screen resolution to scale for.
+                Defaults to the VideoTrack's.
+
+        OUTPUT ARGS:
+          made- the number of scaled images that had to be made.
+        """
+        made = 0
+        for d in self:
+            try:
+                content = d.content
+            except AttributeError:
+                continue
+            if isinstance(content, display.Image) and content.prepareCache(yres):
+                made += 1
+        return made
 
 class TextPool(Pool):
     """
@@ -446,8 +517,16 @@ class TextPool(Pool):
             list.append(self, d)
     def loadFromSourcePath(self, sourcepath, size, color, font):
         """
+        The source may also be a list of lines of text.
         """
-        if os.path.isdir(sourcepath):
+        if isinstance(sourcepath, list):
+            for line in sourcepath:
+                textval = line.strip()
+                self.append(name = textval,
+                            content = display.Text(textval, size=size, color=color, font=font))
+        elif bundle.isBundle(sourcepath):
+            self.loadFromBundle(sourcepath, size = size, color = color, font = font)
+        elif os.path.isdir(sourcepath):
             for stimfile in os.listdir(sourcepath):
                 name, ext = os.path.splitext(stimfile)
                 ext = ext.lower()
@@ -499,7 +578,9 @@ class SoundPool(Pool):
     def loadFromSourcePath(self, sourcepath):
         """
         """
-        if os.path.isdir(sourcepath):
+        if bundle.isBundle(sourcepath):
+            self.loadFromBundle(sourcepath)
+        elif os.path.isdir(sourcepath):
             for stimfile in os.listdir(sourcepath):
                 name, ext = os.path.splitext(stimfile)
                 ext = ext.lower()
@@ -0,0 +1,235 @@
+# PyEPL: rsvp.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module provides frame-locked rapid serial visual presentation.
+Showables are given durations in frames rather than milliseconds; the
+whole sequence is loaded and compiled into a per-frame schedule
+beforehand, the frames are flipped back to back with nothing else
+done between them, and the log is written afterward.
+"""
+
+import numpy
+
+import hardware
+import exputils
+from display import VideoTrack, ActiveShowable, Shown
+from exceptions import EPLError
+
+class RSVPSequence:
+    """
+    A sequence of showables, each shown for a whole number of frames
+    over whatever is already on the screen.
+    """
+    def __init__(self, video = None):
+        """
+        Create RSVPSequence.
+
+        INPUT ARGS:
+          video- (optional) the VideoTrack to present on (the last one
+                 made by default).
+        """
+        if video is None:
+            video = VideoTrack.lastInstance()
+        self.video = video
+
+        # (showable, frames, x, y) for each item
+        self.items = []
+
+        # (shown, showable, x, y) entry of each item (None for blank
+        # items), made by prepare
+        self.entries = None
+
+        # the results of the last presentation
+        self.onsets = None
+        self.missed = []
+    def __len__(self):
+        """
+        Return the number of items.
+        """
+        return len(self.items)
+    def add(self, showable, frames, x = 0.5, y = 0.5):
+        """
+        Add an item to the end of the sequence.
+
+        INPUT ARGS:
+          showable- the showable to show, or None for blank frames
+                    (only what was already on the screen).
+          frames- the number of refreshes to show it for.
+          x, y- proportional position, as for
+                VideoTrack.showProportional.
+        """
+        if int(frames) != frames or frames < 1:
+            raise ValueError, "Frame counts must be positive integers, not %r." % frames
+        if isinstance(showable, ActiveShowable):
+            raise ValueError, "Active showables can not be presented frame by frame."
+        self.items.append((showable, int(frames), x, y))
+        self.release()
+    def prepare(self):
+        """
+        Load every showable, make sure its textures are on the card,
+        and work out where each item goes.  The showables stay loaded
+        until release.  present calls this if it has not been called
+        since the last add.
+        """
+        resx, resy = self.video.getResolution()
+        entries = []
+        for showable, frames, x, y in self.items:
+            if showable is None:
+                entries.append(None)
+                continue
+            showable.requireLoaded()
+            if not showable.isLoaded():
+                raise EPLError("Could not load %r for presentation." % showable)
+            w, h = showable.getSize()
+            px = int((resx - w) * x)
+            py = int((resy - h) * y)
+            entries.append((Shown(px, py, w, h), showable, px, py))
+
+        # draw everything once into the back buffer, so drivers that
+        # upload textures lazily do it now rather than mid-sequence
+        self.video.drawShowables([e for e in entries if e is not None])
+        hardware.clearScreen((0, 0, 0))
+
+        self.release()
+        self.entries = entries
+    def release(self):
+        """
+        Allow the showables to be unloaded again.
+        """
+        if self.entries is None:
+            return
+        for e in self.entries:
+            if e is not None:
+                e[1].unrequireLoaded()
+        self.entries = None
+    def present(self, clk = None):
+        """
+        Present the sequence.  The first item is flipped at the clock
+        time (or at once), each following frame is flipped as soon as
+        the previous one is, and after the last item one more frame
+        with only what was already on the screen ends it.  When flips
+        are synced to the refresh, each one waits for its swap, so the
+        onset of every frame is observed rather than predicted.
+
+        Frames shown more than one refresh after the frame before them
+        missed their slot, which lengthens their item; getMissed lists
+        them.
+
+        INPUT ARGS:
+          clk- (optional) PresentationClock, tared to the end of the
+               sequence.
+
+        OUTPUT ARGS:
+          onsets- list of the (time, latency) timestamps of each
+                  item's first frame.
+        """
+        if self.entries is None:
+            self.prepare()
+        v = self.video
+
+        # compile the schedule: the display list of each frame
+        background = v.pending.getEntries()
+        lists = []
+        for e in self.entries:
+            if e is None:
+                lists.append(background)
+            else:
+                lists.append(background + [e])
+        lists.append(background)
+        slots = numpy.repeat(numpy.arange(len(self.items) + 1),
+                             [frames for showable, frames, x, y in self.items] + [1])
+        frames = [lists[i] for i in slots]
+        n = len(frames)
+
+        # requested time, draw start and end, flip call and return (on
+        # the time.time clock), onset and uncertainty of each frame
+        times = numpy.zeros((n, 7), numpy.float64)
+
+        period = hardware.getRefreshStats()["period"]
+        paced = hardware.isFramePaced()
+        if isinstance(clk, exputils.PresentationClock):
+            t = clk.get()
+        else:
+            t = None
+        ft = v.frameTiming
+        now = ft.now
+        draw = v.drawShowables
+        flip = hardware.makeVideoChanges
+        lastFlip = hardware.getLastFlip
+
+        # paced flips wait for their swap, so back to back flips each
+        # get their own refresh and an observed onset
+        blocking = paced or None
+
+        # the tight loop: nothing but drawing and flipping
+        first = None
+        for k in xrange(n):
+            drawstart = now()
+            draw(frames[k])
+            drawend = now()
+            r = flip(t, blocking)
+            swapstart, swapreturn = lastFlip()
+            times[k, 1:] = (drawstart, drawend, swapstart, swapreturn, r[0], r[1])
+            if first is None:
+                first = r[0]
+            if paced:
+                # the flip itself waits for the refresh
+                t = None
+            else:
+                t = first + (k + 1) * period
+
+        # the slot each frame was meant for
+        times[:, 0] = first + numpy.arange(n) * period
+        if isinstance(clk, exputils.PresentationClock):
+            times[0, 0] = clk.get()
+
+        # the screen now shows what was there before
+        v.onscreen = background
+        v.onscreengeneration = v.generation
+        v.last_updated = (long(times[-1, 5]), long(times[-1, 6]))
+
+        # count the refreshes from the first frame to each one; a frame
+        # shown more than one refresh after the one before it missed
+        # its slot
+        refreshes = numpy.round((times[:, 5] - first) / period).astype(numpy.int64)
+        self.missed = []
+        for k in numpy.nonzero(numpy.diff(refreshes) > 1)[0] + 1:
+            self.missed.append((int(slots[k]), int(k), times[k, 5] - times[k, 0]))
+
+        # record and log everything now that the timing is over
+        for k in xrange(n):
+            ft.record(times[k, 0], times[k, 1], times[k, 2], times[k, 3:5], times[k, 5:7], len(frames[k]))
+        starts = numpy.concatenate(([0], numpy.nonzero(numpy.diff(slots))[0] + 1))
+        stamps = [(long(times[k, 5]), long(times[k, 6])) for k in starts]
+        self.onsets = stamps[:-1]
+        v.logMessage("RSVP\t%d\t%d" % (len(self.items), n), stamps[0])
+        for k, stamp in zip(starts, stamps):
+            v.onscreen = frames[k]
+            v.logDisplay(stamp)
+        v.onscreen = background
+        for item, k, lateness in self.missed:
+            v.logMessage("RM\t%d\t%d\t%.3f" % (item, k, lateness), (long(times[k, 5]), long(times[k, 6])))
+
+        if isinstance(clk, exputils.PresentationClock):
+            clk.tare(v.last_updated)
+        return self.onsets
+    def getOnsets(self):
+        """
+        Return the (time, latency) timestamp of each item's first
+        frame in the last presentation.
+        """
+        return self.onsets
+    def getMissed(self):
+        """
+        Return a list of (item, frame, lateness) tuples for the frames
+        of the last presentation that missed their slot.  lateness is
+        how far (in ms) the frame was behind the schedule.
+        """
+        return self.missed
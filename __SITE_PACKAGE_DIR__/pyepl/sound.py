@@ -16,11 +16,10 @@ import time
 import threading
 import numpy
 import math
-import struct
 import copy
 import string
-from os import uname
-from struct import unpack
+import struct
+import os
 
 # import pyepl modules
 from transarchive import Archive
@@ -32,7 +31,9 @@ import exceptions
 import hardware
 import exputils
 from stimulus import Stimulus
+import mixer
 from hardware import addPollCallback, removePollCallback, SoundFile
+from hardware.sound import audiocache
 from exceptions import EPLFatalError
 
 class SoundException(EPLFatalError):
@@ -41,17 +42,70 @@ class SoundException(EPLFatalError):
     def printMsg(self):
         print "SoundException: ", self.__str__()
 
+# samples of room an AudioClip grows by at least
+MIN_GROWTH = 44100 * 2
+
+def asSamples(data):
+    """
+    Return 16 bit sample data (a raw string, buffer or array) as an
+    int16 array, without copying it if possible.
+    """
+    if isinstance(data, numpy.ndarray):
+        if data.dtype == numpy.int16:
+            return data
+        return data.astype(numpy.int16)
+    return numpy.frombuffer(data, numpy.int16)
+
 class AudioClip(Stimulus):
     """
-    Manages sound data.
+    Manages sound data.  The samples are kept as interleaved 16 bit
+    stereo in an int16 array (snd), which is a view of a larger buffer
+    while the clip is being appended to.
     """
     def __init__(self, data=None):
-	self.snd = data
 	# constants: 
 	self.RESAMPLEDRATE = 44100
 	self.sampleWidth = 2
 	self.numchannels = 2
 
+	# the buffer snd is the start of (None until appended to)
+	self.buffer = None
+	self.setSamples(data)
+
+    def setSamples(self, data):
+        """
+        Replace the samples of the clip.
+
+        INPUT ARGS:
+          data- interleaved 16 bit stereo samples, as a raw string
+            or an array (or None for no samples).  They are not
+            copied if they need not be.
+        """
+        self.buffer = None
+        if data is None:
+            self.snd = None
+        else:
+            self.snd = asSamples(data)
+
+    def getSamples(self):
+        """
+        Return the interleaved stereo samples as an int16 array (a
+        view, not a copy), or None if there are none.
+        """
+        if self.snd is None:
+            return None
+        return asSamples(self.snd)
+
+    def getFrames(self):
+        """
+        Return the samples as an int16 array of (left, right) frames
+        (a view, not a copy), or None if there are none.
+        """
+        samples = self.getSamples()
+        if samples is None:
+            return None
+        return samples.reshape((-1, self.numchannels))
+
     def getDuration(self):
         """
         Return the duration of an AudioClip in milliseconds.
@@ -60,49 +114,55 @@ class AudioClip(Stimulus):
           duration- returns length of AudioClip object in milliseconds.
           
         """
-	self.duration = (len(self.snd)*1000) / (self.RESAMPLEDRATE
-						* self.sampleWidth 
-						* self.numchannels)
+	self.duration = (len(self.getSamples())*1000) / (self.RESAMPLEDRATE
+							  * self.numchannels)
         return self.duration
 
     def stripChannel(self, rawstr):
         """
-        Strip the second channel from raw data in str form for saving.
+        Return the first channel of stereo samples (a raw string or
+        an array) as an int16 array.  The result is a view of the
+        samples, so call tostring on it to save it.
         """
-        # Convert to numeric array
-        xbuff = numpy.array(struct.unpack(str(len(rawstr)/self.sampleWidth) + 'h', rawstr), dtype=numpy.int16)
-	# Drop a channel
-        xbuff = xbuff[::2]
-
-        # convert to a string
-        newstr = xbuff.tostring()
-        del xbuff
-        return newstr
+        return asSamples(rawstr)[::2]
                 
     def duplicateChannel(self, rawstr):
 	""" 
-	Copy the data of a one-channel signal into another channel, to
-	make a 2-channel signal.
+	Copy the data of a one-channel signal (a raw string or an
+	array) into another channel, to make a 2-channel signal, and
+	return it as an int16 array.
 	"""
-	# add the second channel
-	xbuff = numpy.zeros((len(rawstr)*2), dtype=numpy.int16)
-	xbuff[::2] = rawstr;
-	xbuff[1::2] = rawstr;
-
-	# convert to a string
-	sbuff = xbuff.tostring()
-	del xbuff 
-	return sbuff
+	return numpy.repeat(asSamples(rawstr), 2)
 
     def append(self, data, numchans):
-	if not self.snd:
-	    self.snd = ''
+        """
+        Append samples to the clip.  Room is made by doubling the
+        buffer, so a long recording costs linear time.
+
+        INPUT ARGS:
+          data- 16 bit samples, as a raw string or an array.
+          numchans- the number of channels in data (1 or 2).
+        """
+        data = asSamples(data)
 	if numchans==1:
 	    # double the data 
-	    buff = numpy.array(struct.unpack(str(len(data)/self.sampleWidth) + 'h', data), dtype=numpy.int16)
-	    data = self.duplicateChannel(buff)
+	    data = self.duplicateChannel(data)
 
-	self.snd += data
+        old = self.getSamples()
+        if old is None:
+            n = 0
+        else:
+            n = len(old)
+        need = n + len(data)
+        if self.buffer is None or old is None or old.base is not self.buffer or \
+               need > len(self.buffer):
+            # move to a new buffer
+            buff = numpy.empty(max(need, 2 * n, MIN_GROWTH), numpy.int16)
+            if n:
+                buff[:n] = old
+            self.buffer = buff
+        self.buffer[n:need] = data
+        self.snd = self.buffer[:need]
 
     def present(self, clk = None, duration = None, jitter = None, bc = None, minDuration = None, doDelay = True):
         """
@@ -151,23 +211,15 @@ class AudioClip(Stimulus):
         and returning a clip the length of the longer clip.
         """
 
-        # convert from str to numpy array
-        base = self.stripChannel(self.snd)
-        toadd = self.stripChannel(clip.snd)
-        base = numpy.array(struct.unpack(str(len(base)/self.sampleWidth) + 'h', base), dtype=numpy.int16)
-	toadd = numpy.array(struct.unpack(str(len(toadd)/clip.sampleWidth) + 'h', toadd), dtype=numpy.int16)
-
-        # see the diff in length
-        clipdiff = len(base) - len(toadd)
+        # views of the first channels
+        base = self.stripChannel(self.getSamples())
+        toadd = clip.stripChannel(clip.getSamples())
 
-        if clipdiff > 0:
-            # append zeros to the clip
-            toadd = numpy.concatenate([toadd,numpy.zeros(clipdiff)])
-        elif clipdiff < 0:
-            # append zeros to the base
-            base = numpy.concatenate([base,numpy.zeros(-clipdiff)])
+        # sum into a signal the length of the longer one
+        newclip = numpy.zeros(max(len(base), len(toadd)))
+        newclip[:len(base)] += base
+        newclip[:len(toadd)] += toadd*.5
 
-        newclip = base+toadd*.5
         newclip = self.duplicateChannel(newclip)
         return AudioClip(newclip)
 
@@ -212,7 +264,7 @@ class Beep(AudioClip):
 	buff = buff.astype(numpy.int16)
 
 	# convert duplicate to a 2nd channel
-	self.snd = self.duplicateChannel(buff)
+	self.setSamples(self.duplicateChannel(buff))
     
 
 # map strings to SoundFile constants:
@@ -354,6 +406,7 @@ class FileAudioClip(MediaFile,AudioClip):
         #initially, the file isn't loaded into memory
 	self.sndStripped=None
         self.duration = None
+	self.cacheKey = None
 
     def getDuration(self):
         """
@@ -369,53 +422,71 @@ class FileAudioClip(MediaFile,AudioClip):
         return self.duration
 
     
+    def getCacheKey(self):
+        """
+        Return the key the decoded sound is cached under (see
+        hardware.sound.audiocache), or None if the file is missing.
+        """
+	if self.fileSettings['format']=='raw':
+	    # the settings are needed to read the file
+	    settings = "%(sampleWidth)s %(channels)s %(sampleRate)s %(endian)s" % self.fileSettings
+	else:
+	    settings = ""
+	return audiocache.makeKey(self.filename, self.RESAMPLEDRATE, self.numchannels, settings)
+
     def load(self):
         """
-        Load the instance of the sound into memory.
+        Load the instance of the sound into memory.  A sound that was
+        unloaded recently, or was cached on disk by an earlier session
+        (see hardware.setAudioCache), is not decoded again.
         """
-	sizes = '-bh-i---l'
-        if not self.snd: #if it's not loaded
-	    try:
-		mode = SoundFile.SFM_READ
-		if self.fileSettings['format']=='raw':
-		    format = formatDict[self.fileSettings['format']] \
-			| widthDict[self.fileSettings['sampleWidth']] \
-			| endianDict[self.fileSettings['endian']]
-		    # load the snd-file
-		    sfile = SoundFile.soundFile(self.filename, mode, format, self.fileSettings['channels'],
-						self.fileSettings['sampleRate'])
-		else:
-		    sfile = SoundFile.soundFile(self.filename, mode)
-		# resample and read into a string
-		data = sfile.readfile_short(self.RESAMPLEDRATE)
-		self.fileSettings['channels'] = sfile.getChannels()
-		nf = sfile.getFrames()
-		del sfile
-		if uname()[4].find('Power')>=0: # handle Mac endian-ness difference
-		    byteorder = '>'
-		else:
-		    byteorder = '<'
-	    except:
-		raise SoundException("Couldn't open sound file %s, exiting." % self.filename)
-
-	    # save the raw data to an array
-	    totalSamples = nf*self.fileSettings['channels']
-	    self.snd = numpy.array(unpack(byteorder + str(totalSamples) + sizes[self.sampleWidth], data), dtype=numpy.int16)
-	    if len(self.snd)==0:
-		raise SoundException("Sound file %s is empty." % self.filename)
+        if self.snd is None: #if it's not loaded
+	    self.cacheKey = self.getCacheKey()
+	    kept = audiocache.recall(self.cacheKey)
+	    if kept is None:
+		kept = self.decode()
+		audiocache.store(self.cacheKey, *kept)
+	    samples, self.fileSettings['channels'] = kept
 
 	    # calculate the duration
-	    self.duration = (len(data)*1000) / (self.RESAMPLEDRATE
-						* self.sampleWidth 
-						* self.fileSettings['channels'])
-
-	    # duplicate channel if necessary
-	    if self.fileSettings['channels'] == 1:
-		# duplicate it
-		self.snd = self.duplicateChannel(self.snd)	
+	    self.duration = (len(samples)*1000) / (self.RESAMPLEDRATE
+						   * self.numchannels)
+	    self.setSamples(samples)
+
+    def decode(self):
+        """
+        Read and resample the sound file.  Returns a tuple of its
+        interleaved stereo samples and the number of channels in the
+        file.
+        """
+	try:
+	    mode = SoundFile.SFM_READ
+	    if self.fileSettings['format']=='raw':
+		format = formatDict[self.fileSettings['format']] \
+		    | widthDict[self.fileSettings['sampleWidth']] \
+		    | endianDict[self.fileSettings['endian']]
+		# load the snd-file
+		sfile = SoundFile.soundFile(self.filename, mode, format, self.fileSettings['channels'],
+					    self.fileSettings['sampleRate'])
 	    else:
-		# just convert to string.
-		self.snd = self.snd.tostring()
+		sfile = SoundFile.soundFile(self.filename, mode)
+	    # resample and read into a string
+	    data = sfile.readfile_short(self.RESAMPLEDRATE)
+	    channels = sfile.getChannels()
+	    del sfile
+	except:
+	    raise SoundException("Couldn't open sound file %s, exiting." % self.filename)
+
+	# view the data (in native byte order) as samples
+	samples = asSamples(data)
+	if len(samples)==0:
+	    raise SoundException("Sound file %s is empty." % self.filename)
+
+	# duplicate channel if necessary
+	if channels == 1:
+	    # duplicate it
+	    samples = self.duplicateChannel(samples)
+	return samples, channels
 
     def append(self, data, numchans):
         """
@@ -432,10 +503,12 @@ class FileAudioClip(MediaFile,AudioClip):
 
 	if self.fileSettings['channels']==1 and numchans==2:
 	    # strip the second channel
-	    channelCorrectData = self.stripChannel(data)
+	    channelCorrectData = self.stripChannel(data).tostring()
 	elif self.fileSettings['channels']==2 and numchans==1:
 	    # duplicate the data so we have 2 channels
-	    channelCorrectData = self.duplicateChannel(data)
+	    channelCorrectData = self.duplicateChannel(data).tostring()
+	elif isinstance(data, numpy.ndarray):
+	    channelCorrectData = asSamples(data).tostring()
 	else:
 	    # number of channels to append matches the number of channels in soundfile
 	    channelCorrectData = data
@@ -447,14 +520,22 @@ class FileAudioClip(MediaFile,AudioClip):
 	del soundFile
 
         # If the sound is loaded, append to the loaded sound, too
-        if self.snd:
+        if self.snd is not None:
 	    AudioClip.append(self, data, numchans)	    
 
     def unload(self):
         """
-        Unloads the AudioClip's data from memory.  This frees the memory used by the sound data.
+        Unloads the AudioClip's data from memory.  The samples are
+        kept among the recently unloaded sounds, within the budget set
+        by hardware.setAudioBudget, so loading the sound again soon
+        costs nothing.
         """
-        self.snd = None
+	if self.snd is not None and self.cacheKey is not None and \
+	       self.cacheKey == self.getCacheKey():
+	    # (not if the file has been recorded to since it was loaded)
+	    audiocache.keep(self.cacheKey, self.getSamples(), self.fileSettings['channels'])
+	self.cacheKey = None
+        self.setSamples(None)
 	self.sndStripped = None
 
     def isLoaded(self):
@@ -467,6 +548,159 @@ class FileAudioClip(MediaFile,AudioClip):
         return self.snd is not None
 
 
+def readWavHeader(filename):
+    """
+    Find the sample data of a WAV file.  Returns a tuple of the byte
+    offset of the data, the number of frames, channels, sample rate,
+    bits per sample, and True if the samples are integer PCM, or None
+    if the file is not a WAV file.
+    """
+    f = open(filename, "rb")
+    try:
+        header = f.read(12)
+        if len(header) < 12 or header[0:4] != "RIFF" or header[8:12] != "WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            name, size = struct.unpack("<4sI", chunk)
+            if name == "fmt ":
+                data = f.read(size)
+                tag, channels, rate, byterate, align, bits = struct.unpack("<HHIIHH", data[0:16])
+                if tag == 0xFFFE and len(data) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE: the format is the start
+                    # of the subformat GUID
+                    tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (channels, rate, bits, tag == 1)
+                if size % 2:
+                    f.seek(1, 1)
+            elif name == "data":
+                if fmt is None:
+                    return None
+                channels, rate, bits, pcm = fmt
+                offset = f.tell()
+                # (the size of a file still being written may be unset)
+                size = min(size, os.path.getsize(filename) - offset)
+                frames = size / (channels * bits / 8)
+                return (offset, frames, channels, rate, bits, pcm)
+            else:
+                f.seek(size + size % 2, 1)
+    finally:
+        f.close()
+
+class StreamingAudioClip(FileAudioClip):
+    """
+    A sound file played straight from disk.  Loading maps the samples
+    into memory instead of reading them, and the mixer reads each
+    block as it plays it, so neither the time to start playing nor
+    the memory used depends on the length of the file.
+
+    Only 16 bit PCM at the playback rate (44100 Hz, one or two
+    channels, WAV or raw) can be streamed; any other file is loaded
+    and converted as a FileAudioClip would be.
+    """
+    def __init__(self, *args, **fileargs):
+	"""
+	Construct a StreamingAudioClip, from the path+filename of the
+	sound file and, for raw files, the keyword settings described
+	for FileAudioClip.
+	"""
+	FileAudioClip.__init__(self, *args, **fileargs)
+
+	# the mapped frames, while loaded
+	self.frames = None
+
+	# where the samples are: byte offset, frame count, channels
+	# and dtype (None if they can not be streamed)
+	self.stream = None
+	settings = self.fileSettings
+	if settings['format'] == 'raw':
+	    if settings['sampleWidth'] == 'short' and settings['sampleRate'] == self.RESAMPLEDRATE \
+		   and settings['channels'] in (1, 2):
+		dtype = {'little':'<i2', 'big':'>i2'}.get(settings['endian'], '=i2')
+		frames = os.path.getsize(self.filename) / (2 * settings['channels'])
+		self.stream = (0, frames, settings['channels'], dtype)
+	else:
+	    try:
+		header = readWavHeader(self.filename)
+	    except (IOError, struct.error):
+		header = None
+	    if header is not None:
+		offset, frames, channels, rate, bits, pcm = header
+		if pcm and bits == 16 and rate == self.RESAMPLEDRATE and channels in (1, 2):
+		    self.stream = (offset, frames, channels, '<i2')
+
+	if self.stream is not None:
+	    offset, frames, channels, dtype = self.stream
+	    self.fileSettings['channels'] = channels
+	    self.duration = (frames * 1000) / self.RESAMPLEDRATE
+
+    def isStreamed(self):
+        """
+        Return True if the file is played from disk rather than loaded
+        into memory.
+        """
+        return self.stream is not None
+
+    def load(self):
+        """
+        Map the samples of the file (or, if it can not be streamed,
+        load them as a FileAudioClip does).
+        """
+        if self.stream is None:
+            FileAudioClip.load(self)
+            return
+        if self.frames is None:
+            offset, frames, channels, dtype = self.stream
+            if frames == 0:
+                raise SoundException("Sound file %s is empty." % self.filename)
+            try:
+                self.frames = numpy.memmap(self.filename, dtype, 'r', offset, (frames, channels))
+            except (IOError, ValueError):
+                raise SoundException("Couldn't open sound file %s, exiting." % self.filename)
+
+    def unload(self):
+        """
+        Unmap the samples.
+        """
+        self.frames = None
+        FileAudioClip.unload(self)
+
+    def isLoaded(self):
+        """
+        Tells if the samples are mapped (or loaded).
+        """
+        return self.frames is not None or FileAudioClip.isLoaded(self)
+
+    def getFrames(self):
+        """
+        Return the mapped samples as an array of frames, one column
+        per channel of the file.  Reading the array reads the file.
+        """
+        if self.frames is None:
+            return FileAudioClip.getFrames(self)
+        return self.frames
+
+    def getSamples(self):
+        """
+        Return the samples as interleaved 16 bit stereo.  For a mono
+        file this reads the whole file, to make the second channel.
+        """
+        if self.frames is None:
+            return FileAudioClip.getSamples(self)
+        if self.frames.shape[1] == 1:
+            return self.duplicateChannel(self.frames.ravel())
+        return self.frames.reshape(-1)
+
+    def append(self, data, numchans):
+        """
+        Streamed sounds can not be recorded to.
+        """
+        raise SoundException("Can't append to a streamed sound.")
+
+
 class AudioTrack(textlog.LogTrack):
     """
     Provides audio I/O functionality.
@@ -490,23 +724,28 @@ class AudioTrack(textlog.LogTrack):
         else:
             self.canRecord = False
 
-        # set up the track for loggin
-        textlog.LogTrack.__init__(self, basename, archive, autoStart)
-        if not archive:
-            archive = exputils.session
-        self.archive = archive
-        self.recording = False
-	self.playing = False
-
         # some parameters that control recording and playing
         self.rec_interval = 1000
 	# maximum time (in seconds) we'll append to buffer
 	self.MAX_APPEND = .5 # in seconds
-	self.play_interval = 250
 	self.bytes_per_sample = self.eplsound.FORMAT_SIZE * self.eplsound.NUM_CHANNELS
 	self.bytes_per_append = int(math.floor(self.MAX_APPEND * self.eplsound.SAMPLE_RATE \
 					       * self.bytes_per_sample))    
+	self.frames_per_append = int(self.MAX_APPEND * self.eplsound.SAMPLE_RATE)
 	self.currentClip = None
+	self.playing = False
+
+	# every sound is played through the mixer, which a thread
+	# keeps ahead of the device (made before the service starts)
+	self.mixer = mixer.Mixer(self.eplsound)
+	self.feeder = mixer.Feeder(self.mixer, self.frames_per_append)
+
+        # set up the track for loggin
+        textlog.LogTrack.__init__(self, basename, archive, autoStart)
+        if not archive:
+            archive = exputils.session
+        self.archive = archive
+        self.recording = False
 
     def startLogging(self):
         """
@@ -525,6 +764,7 @@ class AudioTrack(textlog.LogTrack):
         Create the sound system and start the stream.
         """
 	self.eplsound.startstream()
+	self.feeder.start()
 
 
     def stopService(self):
@@ -532,10 +772,11 @@ class AudioTrack(textlog.LogTrack):
         Clean up the sound system.
         """
 	self.playStop()
+	self.feeder.stop()
         self.stopRecording()
 	self.eplsound.stopstream()
         
-    def play(self, soundClip, t = None, ampFactor=1.0, doDelay=True):
+    def play(self, soundClip, t = None, ampFactor=1.0, doDelay=True, pan=0.0, overlap=False):
         """
         Play an AudioClip and return the time and latency of when the
         sound played.
@@ -546,17 +787,66 @@ class AudioTrack(textlog.LogTrack):
           ampFactor- Optional amplification of sound.  (default value is 1)
           doDelay- Optionally do not tare and move the presentation clock
             forward.  Defaults to True (moving the clock forward)
+          pan- Optional balance, from -1.0 (left only) to 1.0 (right
+            only).  Defaults to 0.0 (both channels).
+          overlap- Optionally keep playing the sounds already playing,
+            mixed with this one.  By default they are stopped.
           
         OUTPUT ARGS:
           timestamp- time and latency when sound playing began.
           
         """          
+        voice = self.startVoice(soundClip, t, ampFactor, pan, False, not overlap, doDelay)
+        return voice.onset
+
+    def __mixCallback__(self):
+	"""
+	Poll callback that tidies up after the mixer.  (The feeder
+	thread, not this, keeps the sound playing.)
+	"""
+	self.retireVoices()
+
+    def retireVoices(self):
+        """
+        Log underruns, unload the clips of voices that have finished,
+        unless other voices still play them, and stop the mixer
+        callback when nothing is left to play.
+        """
+        for t, frame in self.mixer.takeUnderruns():
+            self.logMessage("%s\t%d" % ("PU", frame), t)
+
+        playing = [v.clip for v in self.getVoices()]
+        for v in self.mixer.takeFinished():
+            if isinstance(v.clip, FileAudioClip) and v.doUnload and \
+                   not v.clip in playing and v.clip.isLoaded():
+                v.clip.unload()
+        if self.playing and not self.mixer.isActive():
+            self.playing = False
+            removePollCallback(self.__mixCallback__)
+
+    def startVoice(self, soundClip, t = None, gain=1.0, pan=0.0, loop=False, exclusive=False, doDelay=False):
+        """
+        Start playing an AudioClip in a new voice of the mixer, and
+        return the Voice.  Its onset attribute is the time and latency
+        of when it began, and it can be changed with setLevels and
+        stopped with stopVoice.
 
-	# Must be sure to not get multiple callbacks at once, so
-	# playing a soundclip while another is running causes that 
-	# other one to stop immediately, even if it is not done playing.
-	# self.playStop()
+        INPUT ARGS:
+          soundClip- AudioClip object of the sound to be played
+          t- Optional PresentationClock for timing.
+          gain- Optional amplification of sound.  (default value is 1)
+          pan- Optional balance, from -1.0 (left only) to 1.0 (right
+            only).  Defaults to 0.0 (both channels).
+          loop- Optionally play the sound over and over until it is
+            stopped.
+          exclusive- Optionally stop every other voice as this one
+            begins.  By default they keep playing.
+          doDelay- Optionally tare and move the presentation clock
+            forward.  Defaults to False.
 
+        OUTPUT ARGS:
+          voice- the Voice playing the clip.
+        """
 	# handle special case: if it's a FileAudioClip and needs loading,
 	# load it.
 	self.currentClip = soundClip
@@ -576,107 +866,112 @@ class AudioTrack(textlog.LogTrack):
 	
 	t = clk.get()
 
-        if not soundClip.snd is None:
-	    # first, compute how many bytes our initial chunk
-	    # to append is. ASSUMPTION: always starting from byte 0.
-	    firstbytes = min(self.bytes_per_append, len(soundClip.snd))
-	    self.total_samples = int(math.floor(len(soundClip.snd)/self.eplsound.FORMAT_SIZE))
-
-	    if self.playing:
-		# stop the playing sound 5ms prior to the new time
-		timing.timedCall(t-5, self.playStop, False)
-	    self.playing = True
-	    self.eplsound.resetSamplesPlayed()
-	    (timeInterval, appended) = timing.timedCall(t,
-						       self.eplsound.append,
-						       soundClip.snd[0:firstbytes],
-						       len(soundClip.snd[0:firstbytes])/self.eplsound.FORMAT_SIZE,
-						       0, ampFactor)
-    
+        frames = soundClip.getFrames()
+        if frames is None:
+            frames = numpy.zeros((0, 2), numpy.int16)
+        voice = mixer.Voice(soundClip, frames, gain, pan, loop)
+        voice.doUnload = True
+
+        if voice.length:
+	    (voice.onset, stopped) = timing.timedCall(t, self.__startVoice__, voice, exclusive)
+	    for v in stopped:
+		# (legacy play kept stopped clips loaded)
+		v.doUnload = False
+
             if doDelay:
                 # accumulate the error
-                clk.accumulatedTimingError += timeInterval[0]-t
+                clk.accumulatedTimingError += voice.onset[0]-t
                 # tare the clock and delay the proper amount
-                clk.tare(timeInterval[0])
+                clk.tare(voice.onset[0])
                 clk.delay(soundClip.getDuration())
 
-	    # it would be great if the soundClip knew the formatsize...
-	    if appended < self.total_samples:
-		# mark the offset into the sound clip
-		self.startInd = appended*self.eplsound.FORMAT_SIZE
-		self.endInd = len(soundClip.snd) #self.total_samples*self.eplsound.FORMAT_SIZE
-
-		# Add the callback to continue playing
-		self.last_play = timeInterval[0]
-		addPollCallback(self.__playCallback__, soundClip.snd, 0, ampFactor)
-		
             dur = soundClip.getDuration()
-
         else:
             dur = 0
-            timeInterval = (t,0)
-            
+            voice.onset = (t,0)
+
         # log message        
-        self.logMessage("%s\t%s\t%s" % ("P",shortName,dur), timeInterval)
+        self.logMessage("%s\t%s\t%s" % ("P",shortName,dur), voice.onset)
+        if voice.number is not None:
+            self.logMessage("%s\t%d\t%s\t%s\t%s" % ("PV", voice.number, voice.gain, voice.pan, voice.loop),
+                            voice.onset)
 
-        return timeInterval
+        return voice
 
-    def __playCallback__(self, s, ow, ampFactor):
-	"""
-	Timer for appending the remainder of a sound.
-	"""
-    	currentTime = timing.now()
-
-    	if self.playing and currentTime >= self.last_play + self.play_interval:
-	    # see if stop the time
-	    if self.startInd < self.endInd:
-
-		# determine how much to append
-		actualInd = self.startInd + self.bytes_per_append
-
-		# make sure it's not beyond the end
-		if actualInd > self.endInd:
-		    # just set to the end
-		    actualInd = self.endInd
-		
-		# append the sound
-		appended = self.eplsound.append(s[self.startInd:actualInd],
-                                                len(s[self.startInd:actualInd])/self.eplsound.FORMAT_SIZE, 0, ampFactor)
-
-		self.last_play = currentTime
-		
-		# update the startInd
-		if appended > 0:
-		    self.startInd += appended*self.eplsound.FORMAT_SIZE
-		
-	    else:
-		# no more sound
-		if (self.eplsound.getSamplesPlayed()*self.eplsound.NUM_CHANNELS)>=self.total_samples:
-		    self.playStop()
+    def __startVoice__(self, voice, exclusive):
+        """
+        Start a voice and mix its first chunk.
+        """
+        self.mixer.lock.acquire()
+        try:
+            stopped = self.mixer.start(voice, exclusive)
+            self.mixer.fill(self.frames_per_append)
+        finally:
+            self.mixer.lock.release()
+        self.feeder.notify()
+        if not self.playing:
+            self.playing = True
+            addPollCallback(self.__mixCallback__)
+        return stopped
+
+    def stopVoice(self, voice, doUnload=True):
+        """
+        Stop one voice started by startVoice, play or playLoop.
+        """
+        if voice in self.mixer.voices:
+            voice.doUnload = doUnload
+            self.mixer.lock.acquire()
+            try:
+                self.mixer.stop(voice)
+                # mix the rest again without it
+                self.mixer.fill(self.frames_per_append)
+            finally:
+                self.mixer.lock.release()
+            self.logMessage("%s\t%d" % ("PS", voice.number))
+        self.retireVoices()
+
+    def getVoices(self):
+        """
+        Return the list of voices still playing.
+        """
+        self.mixer.lock.acquire()
+        try:
+            return self.mixer.voices[:]
+        finally:
+            self.mixer.lock.release()
+
+    def getUnderrunCount(self):
+        """
+        Return the number of times the play buffer has run dry while
+        there was more to play (each is logged as a PU line).
+        """
+        return self.mixer.underrunCount
 
     def playLoopStop(self, doUnload=True):
         self.playStop(doUnload)
 
     def playStop(self, doUnload=True):
-	if self.playing:
-	    self.playing = False
-	    removePollCallback(self.__playCallback__)           
-	    removePollCallback(self.__playLoopCallback__)           
-        
+        """
+        Stop every voice, and return the number of frames played
+        since the last sound was started with nothing else playing.
+        Unloaded sound files are kept in memory, within the audio
+        budget, in case they are played again.
+        """
+	for v in self.getVoices():
+	    v.doUnload = doUnload
+        self.mixer.stop()
+
         # clear the sound buffer to stop playing
 	self.eplsound.clearPlayBuffer()
-
-	if isinstance(self.currentClip, FileAudioClip) and self.currentClip.isLoaded() and doUnload:
-	    self.currentClip.unload()
-	    
+	self.retireVoices()
 
 	return self.eplsound.getSamplesPlayed()
 
 
-    def playLoop(self, soundClip, t = None, ampFactor=1.0, doDelay=True):
+    def playLoop(self, soundClip, t = None, ampFactor=1.0, doDelay=True, pan=0.0, overlap=False):
         """
-        Play an AudioClip and return the time and latency of when the
-        sound played.
+        Play an AudioClip over and over until playLoopStop, and return
+        the time and latency of when the sound played.
 
         INPUT ARGS:
           soundClip- AudioClip object of the sound to be played
@@ -684,118 +979,17 @@ class AudioTrack(textlog.LogTrack):
           ampFactor- Optional amplification of sound.  (default value is 1)
           doDelay- Optionally do not tare and move the presentation clock
             forward.  Defaults to True (moving the clock forward)
+          pan- Optional balance, from -1.0 (left only) to 1.0 (right
+            only).  Defaults to 0.0 (both channels).
+          overlap- Optionally keep playing the sounds already playing,
+            mixed with this one.  By default they are stopped.
           
         OUTPUT ARGS:
           timestamp- time and latency when sound playing began.
           
         """          
-
-	# Must be sure to not get multiple callbacks at once, so
-	# playing a soundclip while another is running causes that 
-	# other one to stop immediately, even if it is not done playing.
-	# self.playStop()
-
-	# handle special case: if it's a FileAudioClip and needs loading,
-	# load it.
-	self.currentClip = soundClip
-        if isinstance(soundClip, FileAudioClip):
-	    if not soundClip.isLoaded():
-		# load and append the sound
-		soundClip.load()
-	    # for logging
-	    shortName = soundClip.filename
-	else:
-	    shortName = "NOFILE"
-
-        if isinstance(t, exputils.PresentationClock):
-            clk = t
-	else:
-	    clk = exputils.PresentationClock()
-	
-	t = clk.get()
-
-        if not soundClip.snd is None:
-	    # first, compute how many bytes our initial chunk
-	    # to append is. ASSUMPTION: always starting from byte 0.
-	    firstbytes = min(self.bytes_per_append, len(soundClip.snd))
-	    self.total_samples = int(math.floor(len(soundClip.snd)/self.eplsound.FORMAT_SIZE))
-
-	    if self.playing:
-		# stop the playing sound 5ms prior to the new time
-		timing.timedCall(t-5, self.playStop, False)
-	    self.playing = True
-	    self.eplsound.resetSamplesPlayed()
-	    (timeInterval, appended) = timing.timedCall(t,
-						       self.eplsound.append,
-						       soundClip.snd[0:firstbytes],
-						       len(soundClip.snd[0:firstbytes])/self.eplsound.FORMAT_SIZE,
-						       0, ampFactor)
-    
-            if doDelay:
-                # accumulate the error
-                clk.accumulatedTimingError += timeInterval[0]-t
-                # tare the clock and delay the proper amount
-                clk.tare(timeInterval[0])
-                clk.delay(soundClip.getDuration())
-
-	    # it would be great if the soundClip knew the formatsize...
-	    # mark the offset into the sound clip
-            self.startInd = appended*self.eplsound.FORMAT_SIZE
-            self.endInd = len(soundClip.snd) #self.total_samples*self.eplsound.FORMAT_SIZE
-
-            # Add the callback to continue playing
-            self.last_play = timeInterval[0]
-            #addPollCallback(self.__playLoopCallback__, soundClip.snd, 0, ampFactor)
-            addPollCallback(self.__playLoopCallback__, 0, ampFactor)
-		
-            dur = soundClip.getDuration()
-
-        else:
-            dur = 0
-            
-        # log message        
-        self.logMessage("%s\t%s\t%s" % ("P",shortName,dur), timeInterval)
-
-        return timeInterval
-
-    def __playLoopCallback__(self, ow, ampFactor):
-	"""
-	Timer for appending the remainder of a sound.
-	"""
-    	currentTime = timing.now()
-
-    	if self.playing and currentTime >= self.last_play + self.play_interval:
-	    # see if stop the time
-	    if self.startInd < self.endInd:
-                # do the sound
-                s = self.currentClip.snd
-
-		# determine how much to append
-                toplay = self.eplsound.getBufferUsed()
-                toappend = self.bytes_per_append - toplay
-                if toappend <= 0:
-                    return
-                
-                actualInd = self.startInd + toappend  # self.bytes_per_append
-
-		# make sure it's not beyond the end
-		if actualInd > self.endInd:
-		    # just set to the end
-		    actualInd = self.endInd
-		
-		# append the sound
-		appended = self.eplsound.append(s[self.startInd:actualInd], len(s[self.startInd:actualInd])/self.eplsound.FORMAT_SIZE, 0, ampFactor)
-
-                self.last_play = currentTime
-		
-		# update the startInd
-		if appended > 0:
-		    self.startInd += appended*self.eplsound.FORMAT_SIZE
-		
-	    else:
-		# no more sound, so start again right away
-                self.startInd = 0
-
+        voice = self.startVoice(soundClip, t, ampFactor, pan, True, not overlap, doDelay)
+        return voice.onset
 
         
     def startRecording(self, basename = None, t = None, **sfargs):
@@ -964,9 +1158,8 @@ class AudioTrack(textlog.LogTrack):
                 clip = clipinfo
                 clipOffset = 0
 
-            # convert from str to numpy array
-            toadd = clip.stripChannel(clip.snd)
-            toadd = numpy.array(struct.unpack(str(len(toadd)/clip.sampleWidth) + 'h', toadd), dtype=numpy.int64)
+            # the first channel, widened so the sum can not overflow
+            toadd = clip.stripChannel(clip.getSamples()).astype(numpy.int64)
 
             # add in on beginning if necessary
             if clipOffset > 0:
@@ -0,0 +1,231 @@
+# PyEPL: vidlog.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+This module reads VideoTrack logs (.vidlog files) and reconstructs
+what was on the screen at each update.
+
+Full logs have a D line for every showable at every update.  Delta
+logs (VideoTrack.setLogMode("DELTA")) have these lines instead:
+
+  DK frame count            keyframe: the screen is rebuilt from the
+                            DA lines that follow
+  DF frame count            update relative to the previous one
+  DR id                     id was removed
+  DA id index x y logline   id was added at position index in the
+                            draw order
+  DO id,id,...              the draw order changed to this
+  DC id logline             the log line for id changed
+
+Both kinds end with a summary of the frame timing, logged when logging
+stops:
+
+  FS frames missed dropped  frames drawn, frames shown a refresh or
+                            more late, and refreshes skipped
+  FT name p50 p95 p99 max   percentiles (ms) of the draw, swap,
+                            lateness and interval times
+
+An RSVPSequence logs its frames after presenting them: an RSVP line
+(item count, frame count), an update for each item's first frame and
+for the frame that ends the sequence, then a line for each frame that
+missed its slot:
+
+  RM item frame lateness    frame (of the sequence) was lateness ms
+                            behind the schedule
+"""
+
+from exceptions import EPLError
+import bisect
+
+class VidlogError(EPLError):
+    """
+    Raised for a malformed video log.
+    """
+    pass
+
+def parseLine(line):
+    """
+    Split a log line into a (timestamp, maxLatency) tuple and the
+    message.  Returns None for blank lines.
+    """
+    line = line.rstrip("\r\n")
+    if not line:
+        return None
+    ts, ml, msg = line.split("\t", 2)
+    return (long(ts), long(ml)), msg
+
+class Frame:
+    """
+    The contents of the screen as of one update.
+    """
+    def __init__(self, timestamp, entries):
+        """
+        Create Frame.
+
+        INPUT ARGS:
+          timestamp- (timestamp, maxLatency) tuple of the update.
+          entries- list of (x, y, logline) tuples in draw order.
+        """
+        self.timestamp = timestamp
+        self.entries = entries
+    def __len__(self):
+        """
+        Return the number of showables on the screen.
+        """
+        return len(self.entries)
+    def __iter__(self):
+        """
+        Iterate over the (x, y, logline) entries in draw order.
+        """
+        return iter(self.entries)
+    def __repr__(self):
+        return "Frame(%r, %r)" % (self.timestamp, self.entries)
+
+class VidlogReader:
+    """
+    Reads a full or delta encoded video log.
+    """
+    def __init__(self, filename):
+        """
+        Open a video log and index its keyframes.
+        """
+        self.filename = filename
+        self.file = open(filename, "r")
+
+        # parallel lists of keyframe times (in ms) and file offsets
+        self.keytimes = []
+        self.keyoffsets = []
+        self.index()
+    def close(self):
+        """
+        Close the log file.
+        """
+        self.file.close()
+    def index(self):
+        """
+        Find every keyframe (and every update of a full log, since
+        those are complete on their own).
+        """
+        self.file.seek(0)
+        while True:
+            offset = self.file.tell()
+            line = self.file.readline()
+            if not line:
+                break
+            r = parseLine(line)
+            if r is None:
+                continue
+            timestamp, msg = r
+            if msg.startswith("DK\t") or msg.startswith("D\t0/"):
+                self.keytimes.append(timestamp[0])
+                self.keyoffsets.append(offset)
+    def frames(self, offset = 0):
+        """
+        Iterate over the Frames of the log, starting at a file offset
+        which must be the start of a keyframe.
+        """
+        # state of the screen: draw order of ids and (x, y, logline) by id
+        order = []
+        entries = {}
+
+        # the frame being read (None between frames)
+        timestamp = None
+        full = False
+
+        self.file.seek(offset)
+        while True:
+            line = self.file.readline()
+            r = parseLine(line)
+            if r is None:
+                if not line:
+                    break
+                continue
+            ts, msg = r
+            fields = msg.split("\t")
+            code = fields[0]
+
+            # a new update finishes the one before it
+            if code in ("DK", "DF") or (code == "D" and fields[1].startswith("0/")):
+                if timestamp is not None:
+                    yield self.makeFrame(timestamp, order, entries)
+                timestamp = ts
+                if code != "DF":
+                    order = []
+                    entries = {}
+                full = code == "D"
+                continue
+            if timestamp is None:
+                continue
+
+            if code == "D" and full:
+                x, y, logline = msg.split("\t", 4)[2:]
+                n = len(order)
+                order.append(n)
+                entries[n] = (int(x), int(y), logline)
+            elif code == "DA":
+                id, index, x, y, logline = msg.split("\t", 5)[1:]
+                id = int(id)
+                order.insert(int(index), id)
+                entries[id] = (int(x), int(y), logline)
+            elif code == "DR":
+                id = int(fields[1])
+                order.remove(id)
+                del entries[id]
+            elif code == "DO":
+                order = [int(id) for id in fields[1].split(",") if id]
+            elif code == "DC":
+                id, logline = msg.split("\t", 2)[1:]
+                id = int(id)
+                x, y, old = entries[id]
+                entries[id] = (x, y, logline)
+        if timestamp is not None:
+            yield self.makeFrame(timestamp, order, entries)
+    def makeFrame(self, timestamp, order, entries):
+        """
+        Make a Frame from the current screen state.
+        """
+        try:
+            return Frame(timestamp, [entries[id] for id in order])
+        except KeyError, e:
+            raise VidlogError, "Unknown showable id %s at %s" % (e, timestamp)
+    def __iter__(self):
+        """
+        Iterate over all the Frames of the log.
+        """
+        return self.frames()
+    def screenAt(self, t):
+        """
+        Return the Frame that was on the screen at time t (in ms, or
+        a (timestamp, maxLatency) tuple), or None if nothing had been
+        shown yet.
+        """
+        if isinstance(t, tuple):
+            t = t[0]
+
+        # start from the last keyframe at or before t
+        k = bisect.bisect_right(self.keytimes, t) - 1
+        if k < 0:
+            return None
+
+        result = None
+        for frame in self.frames(self.keyoffsets[k]):
+            if frame.timestamp[0] > t:
+                break
+            result = frame
+        return result
+
+def screenAt(filename, t):
+    """
+    Return the Frame on the screen at time t in a video log file.
+    """
+    r = VidlogReader(filename)
+    try:
+        return r.screenAt(t)
+    finally:
+        r.close()
@@ -0,0 +1,83 @@
+# PyEPL: tests/test_vblank.py
+#
+# Copyright (C) 2003-2005 Michael J. Kahana
+# Authors: Ian Schleifer, Per Sederberg, Aaron Geller, Josh Jacobs
+# URL: http://memory.psych.upenn.edu/programming/pyepl
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See the license.txt that came with this file.
+
+"""
+Tests for the refresh model in hardware/graphics/vblank.py.  The
+module is pure Python, so it is loaded straight from its file rather
+than through pyepl.hardware (which needs pygame and OpenGL).
+"""
+
+import os
+import random
+import unittest
+
+VBLANK = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                      "__SITE_PACKAGE_DIR__", "pyepl", "hardware", "graphics", "vblank.py")
+
+try:
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("vblank", VBLANK)
+    vblank = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(vblank)
+except ImportError:
+    import imp
+    vblank = imp.load_source("vblank", VBLANK)
+
+PERIOD = 1000.0 / 60.0
+
+def locked(phase = 1000.0, n = 20):
+    """
+    Return a RefreshModel fitted to n exact refresh times.
+    """
+    m = vblank.RefreshModel(60.0)
+    for k in range(n):
+        m.observe(phase + k * PERIOD)
+    return m
+
+class RefreshModelTest(unittest.TestCase):
+    def testBlockedFlipsShowAtTheNextRefresh(self):
+        m = locked()
+        rng = random.Random(1)
+        for k in range(30, 60):
+            # held up by the swap chain, so it returns at refresh k
+            r = 1000.0 + k * PERIOD
+            end = r + rng.uniform(-0.3, 0.3)
+            onset, uncertainty = m.flipped(end - 5.0, end, False)
+            self.assertAlmostEqual(onset, r + PERIOD, delta = 0.5)
+
+    def testBackToBackFlipsGetSuccessiveRefreshes(self):
+        m = locked()
+        t = 1000.0 + 50 * PERIOD + 2.0
+        onsets = [m.flipped(t + i, t + i + 0.1, False)[0] for i in range(3)]
+        for a, b in zip(onsets, onsets[1:]):
+            self.assertAlmostEqual(b - a, PERIOD, delta = 0.01)
+        self.assertEqual(m.getStats()["dropped"], 0)
+
+    def testUncertaintyCoversTheRefresh(self):
+        m = locked()
+        onset, uncertainty = m.flipped(1500.0, 1500.1, False)
+        self.assertTrue(uncertainty >= PERIOD / 2.0 - 1e-6)
+
+    def testLateFirstSampleIsRecovered(self):
+        m = vblank.RefreshModel(60.0)
+        m.observe(1006.0)
+        for k in range(1, 200):
+            m.observe(1000.0 + k * PERIOD)
+        self.assertTrue(m.isLocked())
+        self.assertAlmostEqual(m.nearestRefresh(5000.0) % PERIOD, 1000.0 % PERIOD, delta = 0.01)
+
+    def testLateWakeupsAreIgnoredOnceLocked(self):
+        m = locked()
+        m.observe(1000.0 + 20 * PERIOD + 6.0)
+        m.observe(1000.0 + 21 * PERIOD)
+        self.assertTrue(m.isLocked())
+        self.assertAlmostEqual(m.nearestRefresh(2000.0) % PERIOD, 1000.0 % PERIOD, delta = 0.01)
+
+if __name__ == "__main__":
+    unittest.main()